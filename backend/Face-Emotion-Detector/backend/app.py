@@ -4,10 +4,20 @@ import cv2
 import numpy as np
 import base64
 from models.emotion_detector import EmotionDetector
+from models.session_analyzer import (
+    FrameLimitExceeded, iter_video_frames, iter_zip_frames, classify_frames, build_timeline
+)
 import os
+import tempfile
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
+# Uploads above this size are rejected with 413 before they are read
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_BYTES', 512 * 1024 * 1024))
+# Longest session /analyze_session classifies; longer ones are rejected with 413
+MAX_SESSION_FRAMES = int(os.environ.get('MAX_SESSION_FRAMES', 7200))
+MAX_WORKERS = 8
+MAX_BATCH_SIZE = 64
 detector = EmotionDetector()
 
 @app.route('/')
@@ -117,6 +127,71 @@ def upload_file():
         traceback.print_exc()  # Print full traceback
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
+@app.route('/analyze_session', methods=['POST'])
+def analyze_session():
+    """
+    Analyze a recorded session (video file or zip of frames) in one request
+
+    Form fields:
+        file: video (.mp4, .webm, ...) or .zip of images ordered by file name
+        sample_fps: frames per second to classify (default 1)
+        source_fps: capture rate of zipped frames, used for offsets (default 1)
+        workers / batch_size: face-cropping pool size and frames per batched classification
+        include_samples: also return every [offset, emotion, confidence] sample
+
+    Returns a compact timeline whose samples can be bulk-imported into EmotionLog.
+    """
+    try:
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file uploaded'}), 400
+
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({'error': 'No file selected'}), 400
+
+        sample_fps = float(request.form.get('sample_fps', 1.0))
+        source_fps = float(request.form.get('source_fps', 1.0))
+        workers = min(max(int(request.form.get('workers', 4)), 1), MAX_WORKERS)
+        batch_size = min(max(int(request.form.get('batch_size', 8)), 1), MAX_BATCH_SIZE)
+        include_samples = request.form.get('include_samples', 'false').lower() == 'true'
+
+        if file.filename.lower().endswith('.zip'):
+            samples = classify_frames(
+                iter_zip_frames(file.stream, source_fps, sample_fps), detector, workers, batch_size,
+                max_frames=MAX_SESSION_FRAMES
+            )
+        else:
+            # VideoCapture needs a real file; stream the upload to disk instead of memory
+            suffix = os.path.splitext(file.filename)[1] or '.mp4'
+            with tempfile.NamedTemporaryFile(suffix=suffix) as tmp:
+                file.save(tmp.name)
+                samples = classify_frames(
+                    iter_video_frames(tmp.name, sample_fps), detector, workers, batch_size,
+                    max_frames=MAX_SESSION_FRAMES
+                )
+
+        if not samples:
+            return jsonify({'error': 'No emotion detected'}), 400
+
+        response = {
+            'success': True,
+            'sample_fps': sample_fps,
+            'timeline': build_timeline(samples, max_gap=2.0 / sample_fps if sample_fps > 0 else None),
+        }
+        if include_samples:
+            response['samples'] = [list(sample) for sample in samples]
+        return jsonify(response)
+
+    except FrameLimitExceeded as e:
+        return jsonify({'error': str(e)}), 413
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error in analyze_session: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
 if __name__ == '__main__':
     # Create templates directory if it doesn't exist
     os.makedirs('templates', exist_ok=True)
@@ -5,6 +5,21 @@ from deepface import DeepFace
 import os
 from pathlib import Path
 
+from .onnx_emotion_detector import EMOTION_LABELS, preprocess_face
+
+
+def load_keras_emotion_model():
+    """Load the Keras emotion model DeepFace uses for actions=['emotion']"""
+    try:
+        # deepface >= 0.0.90
+        from deepface.models.demography.Emotion import EmotionClient
+        return EmotionClient().model
+    except ImportError:
+        model = DeepFace.build_model('Emotion')
+        # 0.0.80-0.0.89 wrap the Keras model in an EmotionClient; 0.0.79 returns it directly
+        return getattr(model, 'model', model)
+
+
 class EmotionDetector:
     def __init__(self, model_name='emotion'):
         """
@@ -13,7 +28,43 @@ class EmotionDetector:
         Available models: 'emotion', 'age', 'gender', 'race', 'deepface'
         """
         self.model_name = model_name
+        self._emotion_model = None
         print(f"Initialized DeepFace with {model_name} model")
+
+    def classify_faces(self, faces):
+        """
+        Classify already-cropped faces in one batched forward pass
+
+        Skips DeepFace's per-call face detection, so a frame with many faces
+        costs one model call instead of one analyze() per face.
+
+        Args:
+            faces (list): BGR or grayscale face crops of any size
+
+        Returns:
+            numpy.ndarray: Probabilities of shape (len(faces), 7) in EMOTION_LABELS order
+        """
+        if len(faces) == 0:
+            return np.zeros((0, len(EMOTION_LABELS)), dtype=np.float32)
+        if self._emotion_model is None:
+            self._emotion_model = load_keras_emotion_model()
+        batch = np.stack([preprocess_face(face) for face in faces])
+        return np.asarray(self._emotion_model(batch, training=False))
+
+    def analyze_faces(self, faces):
+        """
+        Batched counterpart of DeepFace.analyze for face crops
+
+        Returns:
+            list: [{'emotion': {label: percent}, 'dominant_emotion': label}] per face
+        """
+        return [
+            {
+                'emotion': {label: float(p) * 100.0 for label, p in zip(EMOTION_LABELS, probs)},
+                'dominant_emotion': EMOTION_LABELS[int(np.argmax(probs))],
+            }
+            for probs in self.classify_faces(faces)
+        ]
     
     def detect_emotion_from_image(self, image_path, show_result=True):
         """
@@ -96,28 +147,21 @@ class EmotionDetector:
             gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
             faces = face_cascade.detectMultiScale(gray, 1.1, 4)
             
-            # Process each face
-            for (x, y, w, h) in faces:
+            # Classify every face in the frame with one batched call
+            try:
+                results = self.analyze_faces([frame[y:y+h, x:x+w] for (x, y, w, h) in faces])
+            except Exception as e:
+                print(f"Error analyzing faces: {e}")
+                results = [None] * len(faces)
+
+            for (x, y, w, h), result in zip(faces, results):
                 # Draw rectangle around face
                 cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-                
-                # Extract face region
-                face_roi = frame[y:y+h, x:x+w]
-                
-                try:
-                    # Analyze emotion for this face
-                    result = DeepFace.analyze(
-                        face_roi,
-                        actions=['emotion'],
-                        enforce_detection=False,
-                        detector_backend='opencv'
-                    )
-                    
-                    # Get dominant emotion
-                    emotion = result[0]['dominant_emotion']
-                    confidence = result[0]['emotion'][emotion]
-                    
+
+                if result:
                     # Display emotion on frame
+                    emotion = result['dominant_emotion']
+                    confidence = result['emotion'][emotion]
                     cv2.putText(
                         frame, 
                         f"{emotion}: {confidence:.1f}%",
@@ -127,8 +171,7 @@ class EmotionDetector:
                         (0, 255, 0),
                         2
                     )
-                    
-                except Exception as e:
+                else:
                     cv2.putText(
                         frame, 
                         "No emotion detected",
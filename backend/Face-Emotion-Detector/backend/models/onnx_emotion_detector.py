@@ -0,0 +1,120 @@
+import os
+
+import cv2
+import numpy as np
+
+try:
+    import onnxruntime as ort
+except ImportError:  # onnxruntime is only needed for this backend
+    ort = None
+
+# Label order of the DeepFace emotion model the ONNX graph is exported from
+EMOTION_LABELS = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
+INPUT_SIZE = 48
+
+DEFAULT_MODEL_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'models', 'emotion.onnx'
+)
+
+
+def preprocess_face(face_bgr):
+    """
+    Convert a BGR face crop into the classifier input
+
+    Matches DeepFace's emotion preprocessing: grayscale, 48x48, scaled to [0, 1].
+
+    Returns:
+        numpy.ndarray: float32 array of shape (48, 48, 1)
+    """
+    if face_bgr.ndim == 3:
+        gray = cv2.cvtColor(face_bgr, cv2.COLOR_BGR2GRAY)
+    else:
+        gray = face_bgr
+    gray = cv2.resize(gray, (INPUT_SIZE, INPUT_SIZE), interpolation=cv2.INTER_AREA)
+    return (gray.astype(np.float32) / 255.0)[..., np.newaxis]
+
+
+class OnnxEmotionDetector:
+    def __init__(self, model_path=None, intra_op_threads=None):
+        """
+        Initialize emotion detector backed by ONNX Runtime on CPU
+
+        Args:
+            model_path (str): Path to an fp32 or int8 ONNX export of the emotion model
+                (see scripts/export_emotion_onnx.py)
+            intra_op_threads (int): Threads per inference; None or 0 lets ONNX Runtime decide
+        """
+        if ort is None:
+            raise ImportError("onnxruntime is required for the ONNX emotion detector")
+
+        self.model_path = os.path.abspath(model_path or DEFAULT_MODEL_PATH)
+        if not os.path.exists(self.model_path):
+            raise FileNotFoundError(f"ONNX emotion model not found: {self.model_path}")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = int(intra_op_threads)
+        options.inter_op_num_threads = 1
+
+        self.session = ort.InferenceSession(
+            self.model_path, sess_options=options, providers=['CPUExecutionProvider']
+        )
+        self.input_name = self.session.get_inputs()[0].name
+        self.face_cascade = cv2.CascadeClassifier(
+            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+        )
+        print(f"Initialized ONNX emotion model from {self.model_path}")
+
+    def classify_faces(self, faces):
+        """
+        Classify a batch of face crops in one forward pass
+
+        Args:
+            faces (list): BGR or grayscale face crops of any size
+
+        Returns:
+            numpy.ndarray: Probabilities of shape (len(faces), 7) in EMOTION_LABELS order
+        """
+        if len(faces) == 0:
+            return np.zeros((0, len(EMOTION_LABELS)), dtype=np.float32)
+        batch = np.stack([preprocess_face(face) for face in faces])
+        return self.classify_tensor(batch)
+
+    def classify_tensor(self, batch):
+        """Run the model on an already preprocessed (N, 48, 48, 1) batch"""
+        return self.session.run(None, {self.input_name: batch.astype(np.float32)})[0]
+
+    def detect_emotion_from_image_data(self, img, show_result=False, image_path=None):
+        """
+        Detect emotion from image data (numpy array)
+
+        Mirrors EmotionDetector.detect_emotion_from_image_data: the largest
+        OpenCV-detected face is classified, falling back to the whole frame
+        when no face is found. Scores are percentages like DeepFace's.
+
+        Returns:
+            list: [{'emotion': {label: score}, 'dominant_emotion': label, 'region': {...}}]
+        """
+        try:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+            faces = self.face_cascade.detectMultiScale(gray, 1.1, 4)
+
+            if len(faces) > 0:
+                x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+            else:
+                x, y, (h, w) = 0, 0, gray.shape[:2]
+
+            probs = self.classify_faces([gray[y:y+h, x:x+w]])[0]
+            emotions = {label: float(p) * 100.0 for label, p in zip(EMOTION_LABELS, probs)}
+            dominant = EMOTION_LABELS[int(np.argmax(probs))]
+
+            return [{
+                'emotion': emotions,
+                'dominant_emotion': dominant,
+                'region': {'x': int(x), 'y': int(y), 'w': int(w), 'h': int(h)},
+            }]
+
+        except Exception as e:
+            print(f"Error analyzing image: {e}")
+            return None
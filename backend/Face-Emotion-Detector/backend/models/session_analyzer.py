@@ -0,0 +1,184 @@
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PurePosixPath
+
+import cv2
+import numpy as np
+
+from .onnx_emotion_detector import EMOTION_LABELS
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp'}
+
+# CascadeClassifier instances are not shared across threads
+_local = threading.local()
+
+
+class FrameLimitExceeded(Exception):
+    """The frame stream is longer than the caller allows"""
+
+
+def iter_video_frames(video_path, sample_fps=1.0):
+    """
+    Stream frames from a video file at roughly sample_fps
+
+    Skipped frames are only grabbed, not decoded.
+
+    Yields:
+        tuple: (offset_seconds, frame)
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError("Could not open video")
+
+    try:
+        source_fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        step = max(int(round(source_fps / sample_fps)), 1) if sample_fps > 0 else 1
+        index = 0
+        while True:
+            if not cap.grab():
+                break
+            if index % step == 0:
+                ok, frame = cap.retrieve()
+                if ok:
+                    yield index / source_fps, frame
+            index += 1
+    finally:
+        cap.release()
+
+
+def iter_zip_frames(zip_file, source_fps=1.0, sample_fps=1.0):
+    """
+    Stream frames from a zip of images, ordered by file name
+
+    Args:
+        zip_file: Path or file object of the archive
+        source_fps (float): Rate the frames were captured at, used for offsets
+        sample_fps (float): Rate to sample at
+
+    Yields:
+        tuple: (offset_seconds, frame)
+    """
+    with zipfile.ZipFile(zip_file) as archive:
+        names = sorted(
+            name for name in archive.namelist()
+            if PurePosixPath(name).suffix.lower() in IMAGE_EXTENSIONS
+        )
+        step = max(int(round(source_fps / sample_fps)), 1) if sample_fps > 0 else 1
+        for index in range(0, len(names), step):
+            nparr = np.frombuffer(archive.read(names[index]), np.uint8)
+            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            if frame is not None:
+                yield index / source_fps, frame
+
+
+def _crop_batch(batch):
+    """
+    Crop the largest face of each (offset, frame) pair, or keep the whole
+    frame when none is found, like detect_emotion_from_image_data
+
+    Returns:
+        list: [(offset, grayscale crop)]
+    """
+    cascade = getattr(_local, 'face_cascade', None)
+    if cascade is None:
+        cascade = _local.face_cascade = cv2.CascadeClassifier(
+            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+        )
+
+    crops = []
+    for offset, frame in batch:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        faces = cascade.detectMultiScale(gray, 1.1, 4)
+        if len(faces) > 0:
+            x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+            gray = gray[y:y+h, x:x+w]
+        crops.append((offset, gray))
+    return crops
+
+
+def _classify_crops(detector, crops):
+    """Classify one batch of crops in a single forward pass; returns [(offset, emotion, confidence)]"""
+    probabilities = detector.classify_faces([crop for _, crop in crops])
+    results = []
+    for (offset, _), probs in zip(crops, probabilities):
+        index = int(np.argmax(probs))
+        results.append((round(offset, 3), EMOTION_LABELS[index], round(float(probs[index]), 4)))
+    return results
+
+
+def classify_frames(frames, detector, workers=4, batch_size=8, max_frames=None):
+    """
+    Classify a frame stream in batches
+
+    Face detection and cropping run on a worker pool; each batch of crops then
+    goes through ``detector.classify_faces`` in one forward pass on the calling
+    thread, so the detector is never used concurrently. At most ``workers * 2``
+    batches are in flight, so memory stays bounded for long recordings.
+
+    Raises:
+        FrameLimitExceeded: more than ``max_frames`` frames were streamed
+
+    Returns:
+        list: [(offset_seconds, emotion, confidence)] in frame order
+    """
+    samples = []
+    pending = deque()
+    batch = []
+    count = 0
+
+    with ThreadPoolExecutor(max_workers=max(int(workers), 1)) as pool:
+        for item in frames:
+            count += 1
+            if max_frames is not None and count > max_frames:
+                for future in pending:
+                    future.cancel()
+                raise FrameLimitExceeded(f"More than {max_frames} frames to analyze")
+            batch.append(item)
+            if len(batch) < batch_size:
+                continue
+            pending.append(pool.submit(_crop_batch, batch))
+            batch = []
+            if len(pending) >= workers * 2:
+                samples.extend(_classify_crops(detector, pending.popleft().result()))
+
+        if batch:
+            pending.append(pool.submit(_crop_batch, batch))
+        while pending:
+            samples.extend(_classify_crops(detector, pending.popleft().result()))
+
+    return samples
+
+
+def build_timeline(samples, max_gap=None):
+    """
+    Collapse consecutive samples with the same dominant emotion into segments
+
+    Args:
+        samples (list): [(offset_seconds, emotion, confidence)] in order
+        max_gap (float): Start a new segment when samples are further apart than this
+
+    Returns:
+        dict: {'segments': [...], 'distribution': {emotion: count}, 'samples': n}
+    """
+    segments = []
+    distribution = {}
+    for offset, emotion, confidence in samples:
+        distribution[emotion] = distribution.get(emotion, 0) + 1
+        last = segments[-1] if segments else None
+        if (last and last['emotion'] == emotion
+                and (max_gap is None or offset - last['end'] <= max_gap)):
+            last['end'] = offset
+            last['samples'] += 1
+            last['confidence_sum'] += confidence
+        else:
+            segments.append({
+                'start': offset, 'end': offset, 'emotion': emotion,
+                'samples': 1, 'confidence_sum': confidence,
+            })
+
+    for segment in segments:
+        segment['confidence'] = round(segment.pop('confidence_sum') / segment['samples'], 4)
+
+    return {'segments': segments, 'distribution': distribution, 'samples': len(samples)}
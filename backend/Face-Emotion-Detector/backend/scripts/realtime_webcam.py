@@ -1,12 +1,179 @@
+import argparse
+import json
+import queue
+import sys
+import threading
 import cv2
 import numpy as np
-from deepface import DeepFace
 import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from models.emotion_detector import EmotionDetector  # noqa: E402
+from models.onnx_emotion_detector import EMOTION_LABELS, OnnxEmotionDetector  # noqa: E402
+
+
+def create_tracker():
+    """Fastest box tracker this OpenCV build offers (KCF with contrib, else MIL)"""
+    for module in (cv2, getattr(cv2, 'legacy', None)):
+        for name in ('TrackerKCF_create', 'TrackerMIL_create'):
+            factory = getattr(module, name, None) if module is not None else None
+            if factory is not None:
+                return factory()
+    return None
+
+
+def box_iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    iw = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    ih = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = iw * ih
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+def latency_stats(samples_ms):
+    if not samples_ms:
+        return None
+    samples = np.asarray(samples_ms)
+    return {
+        'p50_ms': round(float(np.percentile(samples, 50)), 3),
+        'p99_ms': round(float(np.percentile(samples, 99)), 3),
+        'mean_ms': round(float(samples.mean()), 3),
+    }
+
+
+class FaceTrack:
+    """A tracked face carrying its last emotion label between inferences"""
+
+    def __init__(self, track_id, box, frame):
+        self.track_id = track_id
+        self.box = tuple(int(v) for v in box)
+        self.emotion = None
+        self.scores = {}
+        self.needs_inference = True
+        self.tracker = create_tracker()
+        if self.tracker is not None:
+            self.tracker.init(frame, self.box)
+
+    def update(self, frame):
+        """Advance the box with the tracker; returns False once the track is lost"""
+        if self.tracker is None:
+            return True
+        ok, box = self.tracker.update(frame)
+        if ok:
+            self.box = tuple(int(v) for v in box)
+        return ok
+
+    def reset(self, box, frame):
+        """Snap to a fresh detection and restart the tracker from it"""
+        self.box = tuple(int(v) for v in box)
+        self.tracker = create_tracker()
+        if self.tracker is not None:
+            self.tracker.init(frame, self.box)
+
+
+class FrameGrabber(threading.Thread):
+    """
+    Capture thread feeding the pipeline
+
+    For cameras only the newest frame is kept, so a slow consumer never
+    displays stale frames. Video files are read without dropping frames so
+    benchmark runs are repeatable.
+    """
+
+    def __init__(self, cap, drop_frames=True):
+        super().__init__(daemon=True)
+        self.cap = cap
+        self.drop_frames = drop_frames
+        self.frames = queue.Queue(maxsize=1 if drop_frames else 4)
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+            if self.drop_frames:
+                try:
+                    self.frames.get_nowait()
+                except queue.Empty:
+                    pass
+                self.frames.put(frame)
+            else:
+                while not self.stopped.is_set():
+                    try:
+                        self.frames.put(frame, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+        self.frames.put(None)
+
+    def read(self):
+        """Next frame, or None once the source is exhausted"""
+        return self.frames.get()
+
+    def stop(self):
+        self.stopped.set()
+
+
+class InferenceWorker(threading.Thread):
+    """Runs emotion classification off the display thread, one job at a time"""
+
+    def __init__(self, classify_faces):
+        super().__init__(daemon=True)
+        self.classify_faces = classify_faces
+        self.jobs = queue.Queue(maxsize=1)
+        self.results = queue.Queue()
+        self.latencies_ms = []
+        self.unfinished = False
+
+    @property
+    def busy(self):
+        return self.jobs.full() or self.unfinished
+
+    def submit(self, frame, tracks):
+        """Queue a frame and its [(track_id, box)] if the worker is idle; returns True if queued"""
+        if self.busy:
+            return False
+        self.unfinished = True
+        self.jobs.put((frame, tracks))
+        return True
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            frame, tracks = job
+            start = time.perf_counter()
+            labels = {}
+            crops = [(track_id, frame[max(y, 0):y + h, max(x, 0):x + w]) for track_id, (x, y, w, h) in tracks]
+            crops = [(track_id, roi) for track_id, roi in crops if roi.size > 0]
+            try:
+                # Every tracked face in one forward pass
+                results = self.classify_faces([roi for _, roi in crops])
+                labels = {track_id: result for (track_id, _), result in zip(crops, results)}
+            except Exception as e:
+                print(f"Emotion inference error: {e}")
+            self.latencies_ms.append((time.perf_counter() - start) * 1000.0)
+            self.results.put(labels)
+            self.unfinished = False
+
+    def stop(self):
+        self.jobs.put(None)
+
 
 class RealtimeEmotionDetector:
-    def __init__(self):
+    def __init__(self, onnx_model=None):
         print("Initializing Realtime Emotion Detector...")
         print("Press 'q' to quit, 's' to save current frame")
+
+        # Both classifiers take a list of face crops and run one batched forward pass
+        self.classifier = OnnxEmotionDetector(onnx_model) if onnx_model else EmotionDetector()
         
         self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
         
@@ -35,70 +202,18 @@ class RealtimeEmotionDetector:
             minSize=(30, 30)
         )
         
-        # Process each detected face
-        for (x, y, w, h) in faces:
+        # Classify every detected face in one batched forward pass
+        try:
+            results = self.classify_faces([frame[y:y+h, x:x+w] for (x, y, w, h) in faces])
+        except Exception as e:
+            print(f"Emotion inference error: {e}")
+            results = [None] * len(faces)
+
+        for (x, y, w, h), result in zip(faces, results):
             # Draw face rectangle
             cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-            
-            # Extract face region
-            face_roi = frame[y:y+h, x:x+w]
-            
-            try:
-                # Analyze emotion for this face
-                result = DeepFace.analyze(
-                    face_roi,
-                    actions=['emotion'],
-                    enforce_detection=False,
-                    detector_backend='opencv'
-                )
-                
-                # Get emotion data
-                emotion = result[0]['dominant_emotion']
-                confidence = result[0]['emotion'][emotion]
-                
-                # Get color for this emotion
-                color = self.emotion_colors.get(emotion, (255, 255, 255))
-                
-                # Display emotion and confidence
-                emotion_text = f"{emotion.upper()}: {confidence:.1f}%"
-                cv2.putText(
-                    frame, 
-                    emotion_text,
-                    (x, y-10),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.7,
-                    color,
-                    2
-                )
-                
-                # Draw emotion bar
-                bar_width = int(w * (confidence / 100))
-                cv2.rectangle(
-                    frame, 
-                    (x, y+h+5), 
-                    (x+bar_width, y+h+15), 
-                    color, 
-                    -1
-                )
-                
-                # Show all emotions in a small text overlay
-                emotions_text = ""
-                for emo, conf in result[0]['emotion'].items():
-                    if conf > 5:  # Only show emotions with >5% confidence
-                        emotions_text += f"{emo}: {conf:.0f}% "
-                
-                if emotions_text:
-                    cv2.putText(
-                        frame,
-                        emotions_text,
-                        (x, y+h+25),
-                        cv2.FONT_HERSHEY_SIMPLEX,
-                        0.4,
-                        (255, 255, 255),
-                        1
-                    )
-                
-            except Exception as e:
+
+            if result is None:
                 # If emotion detection fails, just show "Analyzing..."
                 cv2.putText(
                     frame, 
@@ -109,9 +224,236 @@ class RealtimeEmotionDetector:
                     (0, 0, 255),
                     2
                 )
+                continue
+
+            emotion, scores = result
+            confidence = scores[emotion]
+
+            # Get color for this emotion
+            color = self.emotion_colors.get(emotion, (255, 255, 255))
+            
+            # Display emotion and confidence
+            emotion_text = f"{emotion.upper()}: {confidence:.1f}%"
+            cv2.putText(
+                frame, 
+                emotion_text,
+                (x, y-10),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.7,
+                color,
+                2
+            )
+            
+            # Draw emotion bar
+            bar_width = int(w * (confidence / 100))
+            cv2.rectangle(
+                frame, 
+                (x, y+h+5), 
+                (x+bar_width, y+h+15), 
+                color, 
+                -1
+            )
+            
+            # Show all emotions in a small text overlay
+            emotions_text = ""
+            for emo, conf in scores.items():
+                if conf > 5:  # Only show emotions with >5% confidence
+                    emotions_text += f"{emo}: {conf:.0f}% "
+            
+            if emotions_text:
+                cv2.putText(
+                    frame,
+                    emotions_text,
+                    (x, y+h+25),
+                    cv2.FONT_HERSHEY_SIMPLEX,
+                    0.4,
+                    (255, 255, 255),
+                    1
+                )
         
         return frame
     
+    def classify_faces(self, face_rois):
+        """Classify face crops in one batch; returns [(dominant_emotion, {emotion: percent})]"""
+        results = []
+        for probs in self.classifier.classify_faces(face_rois):
+            scores = {label: float(p) * 100.0 for label, p in zip(EMOTION_LABELS, probs)}
+            results.append((EMOTION_LABELS[int(np.argmax(probs))], scores))
+        return results
+
+    def draw_track(self, frame, track):
+        """Draw a tracked face with its most recent emotion label"""
+        x, y, w, h = track.box
+        cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
+        if track.emotion is None:
+            cv2.putText(frame, "Analyzing...", (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+            return
+
+        color = self.emotion_colors.get(track.emotion, (255, 255, 255))
+        confidence = track.scores.get(track.emotion, 0.0)
+        cv2.putText(
+            frame, f"{track.emotion.upper()}: {confidence:.1f}%",
+            (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2
+        )
+        bar_width = int(w * (confidence / 100))
+        cv2.rectangle(frame, (x, y+h+5), (x+bar_width, y+h+15), color, -1)
+
+    def _update_tracks(self, frame, tracks, detect):
+        """Advance trackers, and on detection frames re-associate tracks with Haar faces by IoU"""
+        if not detect:
+            return [track for track in tracks if track.update(frame)]
+
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        faces = self.face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+
+        updated = []
+        unmatched = list(tracks)
+        for box in faces:
+            best = max(unmatched, key=lambda t: box_iou(t.box, box), default=None)
+            if best is not None and box_iou(best.box, box) >= 0.3:
+                unmatched.remove(best)
+                best.reset(box, frame)
+                updated.append(best)
+            else:
+                self._next_track_id += 1
+                updated.append(FaceTrack(self._next_track_id, box, frame))
+        return updated
+
+    def run_pipeline(self, source=0, infer_every=5, detect_every=10,
+                     headless=False, max_frames=None):
+        """
+        Run the threaded pipeline: capture thread -> tracker on the display
+        thread -> inference worker.
+
+        Faces are re-detected every ``detect_every`` frames and tracked in
+        between. Emotions are inferred every ``infer_every`` frames, or
+        immediately for new tracks, whenever the worker is idle; labels ride
+        along with the tracked boxes until the next result arrives.
+
+        Returns:
+            dict: Run statistics (frames, display FPS, frame and inference latency)
+        """
+        cap = cv2.VideoCapture(source)
+        if not cap.isOpened():
+            print(f"Error: Could not open source {source}")
+            return None
+
+        is_camera = isinstance(source, int)
+        if is_camera:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+            cap.set(cv2.CAP_PROP_FPS, 30)
+
+        grabber = FrameGrabber(cap, drop_frames=is_camera)
+        worker = InferenceWorker(self.classify_faces)
+        grabber.start()
+        worker.start()
+
+        tracks = []
+        self._next_track_id = 0
+        frames = 0
+        inferences = 0
+        last_inference = -infer_every
+        frame_latencies_ms = []
+        run_start = time.perf_counter()
+
+        while max_frames is None or frames < max_frames:
+            frame = grabber.read()
+            if frame is None:
+                break
+            frame_start = time.perf_counter()
+
+            tracks = self._update_tracks(frame, tracks, detect=frames % detect_every == 0)
+
+            # Apply finished inferences to the tracks that are still alive
+            while not worker.results.empty():
+                labels = worker.results.get()
+                for track in tracks:
+                    if track.track_id in labels:
+                        track.emotion, track.scores = labels[track.track_id]
+
+            due = frames - last_inference >= infer_every or any(t.needs_inference for t in tracks)
+            if tracks and due and worker.submit(frame.copy(), [(t.track_id, t.box) for t in tracks]):
+                for track in tracks:
+                    track.needs_inference = False
+                last_inference = frames
+                inferences += 1
+
+            frames += 1
+            self.calculate_fps()
+            frame_latencies_ms.append((time.perf_counter() - frame_start) * 1000.0)
+
+            if headless:
+                continue
+
+            for track in tracks:
+                self.draw_track(frame, track)
+            inference_ms = worker.latencies_ms[-1] if worker.latencies_ms else 0.0
+            cv2.putText(frame, f"FPS: {self.fps:.1f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+            cv2.putText(
+                frame, f"Inference: {inference_ms:.0f} ms  Frame: {frame_latencies_ms[-1]:.1f} ms",
+                (10, 55), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1
+            )
+            cv2.putText(
+                frame, "Press 'q' to quit, 's' to save",
+                (10, frame.shape[0] - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1
+            )
+            cv2.imshow('Real-time Emotion Detection', frame)
+
+            key = cv2.waitKey(1) & 0xFF
+            if key == ord('q'):
+                break
+            elif key == ord('s'):
+                filename = f'captured_emotion_{int(time.time())}.jpg'
+                cv2.imwrite(filename, frame)
+                print(f"Frame saved as {filename}")
+
+        elapsed = time.perf_counter() - run_start
+        grabber.stop()
+        worker.stop()
+        worker.join()
+        cap.release()
+        if not headless:
+            cv2.destroyAllWindows()
+
+        return {
+            'mode': 'pipeline',
+            'frames': frames,
+            'inferences': inferences,
+            'display_fps': round(frames / elapsed, 2) if elapsed else None,
+            'frame_latency': latency_stats(frame_latencies_ms),
+            'inference_latency': latency_stats(worker.latencies_ms),
+        }
+
+    def benchmark_sync(self, video_path, max_frames=None):
+        """Headless baseline: run detect_faces_and_emotions on every frame of a video"""
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            print(f"Error: Could not open source {video_path}")
+            return None
+
+        frames = 0
+        frame_latencies_ms = []
+        run_start = time.perf_counter()
+        while max_frames is None or frames < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frame_start = time.perf_counter()
+            self.detect_faces_and_emotions(frame)
+            frame_latencies_ms.append((time.perf_counter() - frame_start) * 1000.0)
+            frames += 1
+        elapsed = time.perf_counter() - run_start
+        cap.release()
+
+        return {
+            'mode': 'sync',
+            'frames': frames,
+            'inferences': frames,
+            'display_fps': round(frames / elapsed, 2) if elapsed else None,
+            'frame_latency': latency_stats(frame_latencies_ms),
+        }
+
     def calculate_fps(self):
         """Calculate and display FPS"""
         self.frame_count += 1
@@ -201,6 +543,46 @@ class RealtimeEmotionDetector:
 
 def main():
     """Main function to run real-time emotion detection"""
+    parser = argparse.ArgumentParser(description='Real-time emotion detection')
+    parser.add_argument('--mode', choices=['pipeline', 'sync'], default='pipeline',
+                        help='Threaded capture/inference pipeline, or the original per-frame loop')
+    parser.add_argument('--camera', type=int, default=None, help='Camera index (skips the index prompt)')
+    parser.add_argument('--video', default=None, help='Read frames from a video file instead of a camera')
+    parser.add_argument('--headless', action='store_true',
+                        help='Benchmark without a window; requires --video and prints a JSON report')
+    parser.add_argument('--infer-every', type=int, default=5, help='Frames between emotion inferences')
+    parser.add_argument('--detect-every', type=int, default=10, help='Frames between face re-detections')
+    parser.add_argument('--max-frames', type=int, default=None, help='Stop after this many frames')
+    parser.add_argument('--onnx-model', default=None,
+                        help='Classify with this ONNX export instead of the Keras model')
+    parser.add_argument('--output', default=None, help='Also write the headless report here')
+    args = parser.parse_args()
+
+    if args.headless:
+        if not args.video:
+            parser.error('--headless needs --video')
+        detector = RealtimeEmotionDetector(args.onnx_model)
+        if args.mode == 'sync':
+            report = detector.benchmark_sync(args.video, args.max_frames)
+        else:
+            report = detector.run_pipeline(
+                args.video, args.infer_every, args.detect_every, headless=True, max_frames=args.max_frames
+            )
+        print(json.dumps(report, indent=2))
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+        return
+
+    if args.video is not None or args.camera is not None:
+        detector = RealtimeEmotionDetector(args.onnx_model)
+        source = args.video if args.video is not None else args.camera
+        if args.mode == 'sync':
+            detector.run(source)
+        else:
+            detector.run_pipeline(source, args.infer_every, args.detect_every, max_frames=args.max_frames)
+        return
+
     print("=" * 50)
     print("REAL-TIME EMOTION DETECTION")
     print("=" * 50)
@@ -211,8 +593,11 @@ def main():
     # Try different camera indices
     for camera_index in range(3):
         print(f"Trying camera index {camera_index}...")
-        detector = RealtimeEmotionDetector()
-        detector.run(camera_index)
+        detector = RealtimeEmotionDetector(args.onnx_model)
+        if args.mode == 'sync':
+            detector.run(camera_index)
+        else:
+            detector.run_pipeline(camera_index, args.infer_every, args.detect_every)
         
         # Ask if user wants to try another camera
         if camera_index < 2:
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Export the DeepFace emotion classifier to ONNX for the CPU inference backend.
+- Writes an fp32 model to models/emotion.onnx by default
+- Use --quantize to also write a static int8 model calibrated on training images
+- Select it at runtime with EMOTION_DETECTOR_BACKEND=onnx and EMOTION_ONNX_MODEL_PATH
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / 'backend'))
+
+from models.emotion_detector import load_keras_emotion_model  # noqa: E402
+from models.onnx_emotion_detector import EMOTION_LABELS, INPUT_SIZE, preprocess_face  # noqa: E402
+
+TRAIN_DIR = ROOT / 'data' / 'images' / 'images' / 'train'
+
+
+def export_fp32(output_path, opset):
+    import tensorflow as tf
+    import tf2onnx
+
+    model = load_keras_emotion_model()
+    spec = (tf.TensorSpec((None, INPUT_SIZE, INPUT_SIZE, 1), tf.float32, name='input'),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=opset, output_path=str(output_path))
+    print(f"Exported fp32 model to {output_path}")
+
+
+def calibration_batches(per_class, batch_size=16):
+    """Deterministic calibration set: the first images of each training class"""
+    images = []
+    for label in EMOTION_LABELS:
+        for path in sorted((TRAIN_DIR / label).glob('*.jpg'))[:per_class]:
+            img = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+            if img is not None:
+                images.append(preprocess_face(img))
+    for start in range(0, len(images), batch_size):
+        yield np.stack(images[start:start + batch_size])
+
+
+def quantize_int8(fp32_path, int8_path, per_class):
+    import onnxruntime as ort
+    from onnxruntime.quantization import (
+        CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    )
+
+    input_name = ort.InferenceSession(str(fp32_path), providers=['CPUExecutionProvider']).get_inputs()[0].name
+
+    class FaceCalibrationReader(CalibrationDataReader):
+        def __init__(self):
+            self.batches = iter(calibration_batches(per_class))
+
+        def get_next(self):
+            batch = next(self.batches, None)
+            return None if batch is None else {input_name: batch}
+
+    quantize_static(
+        str(fp32_path), str(int8_path), FaceCalibrationReader(),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+    )
+    print(f"Wrote int8 model to {int8_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the emotion classifier to ONNX')
+    parser.add_argument('--output', default=str(ROOT / 'models' / 'emotion.onnx'), help='fp32 ONNX output path')
+    parser.add_argument('--opset', type=int, default=13, help='ONNX opset version')
+    parser.add_argument('--quantize', action='store_true', help='Also write a static int8 model')
+    parser.add_argument('--calibration-per-class', type=int, default=50,
+                        help='Training images per emotion used for int8 calibration')
+    args = parser.parse_args()
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    export_fp32(output, args.opset)
+
+    if args.quantize:
+        quantize_int8(output, output.with_name(output.stem + '_int8.onnx'), args.calibration_per_class)
+
+    print("\nNext steps:")
+    print("- Check parity and latency: python scripts/onnx_parity_check.py --model", output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Compare the ONNX emotion backend against the Keras/DeepFace model it was exported from.
+- Uses a fixed image set: the first --per-class test images of every emotion
+- Reports top-1 agreement, probability drift and accuracy for both models
+- Reports per-image latency (p50/p99) for the classifier alone and end-to-end
+- Exits non-zero when agreement drops below --min-agreement
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / 'backend'))
+
+from models.emotion_detector import load_keras_emotion_model  # noqa: E402
+from models.onnx_emotion_detector import EMOTION_LABELS, OnnxEmotionDetector, preprocess_face  # noqa: E402
+
+TEST_DIR = ROOT / 'data' / 'images' / 'images' / 'test'
+
+
+def load_image_set(per_class):
+    """Return [(label, path, bgr_image)] in a stable order"""
+    images = []
+    for label in EMOTION_LABELS:
+        for path in sorted((TEST_DIR / label).glob('*.jpg'))[:per_class]:
+            img = cv2.imread(str(path))
+            if img is not None:
+                images.append((label, path.name, img))
+    return images
+
+
+def latency_stats(samples_ms):
+    samples = np.asarray(samples_ms)
+    return {
+        'p50_ms': round(float(np.percentile(samples, 50)), 3),
+        'p99_ms': round(float(np.percentile(samples, 99)), 3),
+        'mean_ms': round(float(samples.mean()), 3),
+    }
+
+
+def time_per_image(fn, inputs, warmup=3):
+    for item in inputs[:warmup]:
+        fn(item)
+    samples = []
+    outputs = []
+    for item in inputs:
+        start = time.perf_counter()
+        outputs.append(fn(item))
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return outputs, latency_stats(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check ONNX emotion model parity and latency')
+    parser.add_argument('--model', default=None, help='ONNX model path (defaults to models/emotion.onnx)')
+    parser.add_argument('--per-class', type=int, default=30, help='Test images per emotion')
+    parser.add_argument('--threads', type=int, default=0, help='ONNX Runtime intra-op threads')
+    parser.add_argument('--min-agreement', type=float, default=0.95, help='Required top-1 agreement')
+    parser.add_argument('--skip-end-to-end', action='store_true', help='Only compare the classifiers')
+    parser.add_argument('--output', default=None, help='Also write the JSON report here')
+    args = parser.parse_args()
+
+    images = load_image_set(args.per_class)
+    if not images:
+        print(f"No test images found under {TEST_DIR}")
+        sys.exit(1)
+
+    labels = np.array([EMOTION_LABELS.index(label) for label, _, _ in images])
+    tensors = [preprocess_face(img)[np.newaxis] for _, _, img in images]
+
+    keras_model = load_keras_emotion_model()
+    onnx_detector = OnnxEmotionDetector(args.model, intra_op_threads=args.threads)
+
+    keras_probs, keras_latency = time_per_image(lambda t: keras_model.predict(t, verbose=0)[0], tensors)
+    onnx_probs, onnx_latency = time_per_image(lambda t: onnx_detector.classify_tensor(t)[0], tensors)
+    keras_probs, onnx_probs = np.stack(keras_probs), np.stack(onnx_probs)
+
+    keras_top1, onnx_top1 = keras_probs.argmax(axis=1), onnx_probs.argmax(axis=1)
+    drift = np.abs(keras_probs - onnx_probs)
+    report = {
+        'model': onnx_detector.model_path,
+        'images': len(images),
+        'parity': {
+            'top1_agreement': round(float((keras_top1 == onnx_top1).mean()), 4),
+            'max_abs_prob_diff': round(float(drift.max()), 5),
+            'mean_abs_prob_diff': round(float(drift.mean()), 5),
+            'keras_accuracy': round(float((keras_top1 == labels).mean()), 4),
+            'onnx_accuracy': round(float((onnx_top1 == labels).mean()), 4),
+        },
+        'latency': {
+            'classifier': {'keras': keras_latency, 'onnx': onnx_latency},
+        },
+    }
+
+    if not args.skip_end_to_end:
+        from models.emotion_detector import EmotionDetector
+        deepface_detector = EmotionDetector()
+        frames = [img for _, _, img in images]
+        _, deepface_e2e = time_per_image(
+            lambda img: deepface_detector.detect_emotion_from_image_data(img, show_result=False), frames
+        )
+        _, onnx_e2e = time_per_image(
+            lambda img: onnx_detector.detect_emotion_from_image_data(img, show_result=False), frames
+        )
+        report['latency']['end_to_end'] = {'deepface': deepface_e2e, 'onnx': onnx_e2e}
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+    if report['parity']['top1_agreement'] < args.min_agreement:
+        print(f"FAIL: top-1 agreement below {args.min_agreement}")
+        sys.exit(1)
+    print("OK: ONNX model matches the Keras model")
+
+
+if __name__ == '__main__':
+    main()
@@ -66,7 +66,11 @@ def create_app(config_name: str = "development") -> Flask:
     # Create tables if not exist (dev convenience)
     with app.app_context():
         db.create_all()
-        
+
+        # Add columns and indexes that create_all cannot add to existing tables
+        from .services.schema_upgrade import upgrade_schema
+        upgrade_schema()
+
         # Seed sample content for demo
         from .services.content_seeder import seed_sample_content
         seed_sample_content()
@@ -79,11 +83,39 @@ def create_app(config_name: str = "development") -> Flask:
         from .services.story_seeder import seed_sample_story, seed_additional_badges
         seed_sample_story()
         seed_additional_badges()
+
+        # Build derived tables (rollups, counters, progress memberships, quest task index) for databases created before them
+        from .services.emotion_rollup import backfill_emotion_rollups
+        backfill_emotion_rollups()
+        from .services.xp_rollup import backfill_xp_rollups
+        backfill_xp_rollups()
+        from .services.activity_counters import backfill_activity_counters
+        backfill_activity_counters()
+        from .services.progress_membership import backfill_progress_memberships
+        backfill_progress_memberships()
+        from .services.quest_engine import backfill_quest_task_watches
+        backfill_quest_task_watches()
         
         # Start curriculum scheduler
         from .services.curriculum_scheduler import curriculum_scheduler
         curriculum_scheduler.start()
 
+        # Start buffered emotion log writer
+        from .services.emotion_log_writer import emotion_log_writer
+        emotion_log_writer.start(app)
+
+        # Adaptive capture-rate hints for /api/emotion
+        from .services.frame_pacing import frame_pacer
+        frame_pacer.configure(app)
+
+        # Build leaderboards and keep them reconciled with the database
+        from .services.leaderboard import leaderboard_service
+        leaderboard_service.start(app)
+
+        # Scheduled maintenance jobs (streak expiry, XP transaction compaction)
+        from .services.maintenance_scheduler import maintenance_scheduler
+        maintenance_scheduler.start(app)
+
     return app
 
 
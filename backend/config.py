@@ -22,6 +22,42 @@ class BaseConfig:
     }
     JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "dev-secret")
 
+    # Buffered EmotionLog writes: flush every N ms or once M rows are queued
+    EMOTION_LOG_FLUSH_INTERVAL_MS = int(os.environ.get("EMOTION_LOG_FLUSH_INTERVAL_MS", 500))
+    EMOTION_LOG_MAX_BATCH = int(os.environ.get("EMOTION_LOG_MAX_BATCH", 200))
+    # Rows kept buffered while the database is unreachable; the oldest are dropped beyond this
+    EMOTION_LOG_MAX_PENDING = int(os.environ.get("EMOTION_LOG_MAX_PENDING", 20000))
+
+    # Emotion classifier backend: "auto", "deepface", "onnx" or "mock"
+    EMOTION_DETECTOR_BACKEND = os.environ.get("EMOTION_DETECTOR_BACKEND", "auto")
+    EMOTION_ONNX_MODEL_PATH = os.environ.get("EMOTION_ONNX_MODEL_PATH")
+    EMOTION_ONNX_THREADS = int(os.environ.get("EMOTION_ONNX_THREADS", 0))
+
+    # Adaptive capture rate: bounds for the next_frame_after_ms hint returned by /api/emotion;
+    # the minimum matches the clients' previous fixed cadence so pacing never raises the frame rate
+    EMOTION_FRAME_MIN_INTERVAL_MS = int(os.environ.get("EMOTION_FRAME_MIN_INTERVAL_MS", 5000))
+    EMOTION_FRAME_MAX_INTERVAL_MS = int(os.environ.get("EMOTION_FRAME_MAX_INTERVAL_MS", 30000))
+    EMOTION_FRAME_STABLE_CONFIDENCE = float(os.environ.get("EMOTION_FRAME_STABLE_CONFIDENCE", 0.6))
+    # Share of wall time the process may spend in emotion inference: hints stretch past half of it,
+    # frames are shed with 429 once it is used up
+    EMOTION_INFERENCE_BUDGET = float(os.environ.get("EMOTION_INFERENCE_BUDGET", 0.8))
+
+    # Offline session imports (/api/emotion/import) larger than this are rejected with 413
+    EMOTION_IMPORT_MAX_SAMPLES = int(os.environ.get("EMOTION_IMPORT_MAX_SAMPLES", 7200))
+    EMOTION_IMPORT_MAX_BYTES = int(os.environ.get("EMOTION_IMPORT_MAX_BYTES", 2 * 1024 * 1024))
+
+    # Per-user cache of results for near-identical frames (0 disables); distance is in dHash bits
+    EMOTION_CACHE_TTL_SECONDS = float(os.environ.get("EMOTION_CACHE_TTL_SECONDS", 5))
+    EMOTION_CACHE_MAX_DISTANCE = int(os.environ.get("EMOTION_CACHE_MAX_DISTANCE", 4))
+
+    # Materialized leaderboards: shared Redis sorted sets when a URL is set, rebuilt from the DB periodically (0 disables)
+    LEADERBOARD_REDIS_URL = os.environ.get("LEADERBOARD_REDIS_URL")
+    LEADERBOARD_RECONCILE_SECONDS = int(os.environ.get("LEADERBOARD_RECONCILE_SECONDS", 300))
+
+    # Raw XP transactions older than this are archived nightly as gzipped JSON lines (0 keeps them)
+    XP_TRANSACTION_RETENTION_DAYS = int(os.environ.get("XP_TRANSACTION_RETENTION_DAYS", 90))
+    XP_ARCHIVE_DIR = os.environ.get("XP_ARCHIVE_DIR", os.path.abspath("archive/xp_transactions"))
+
 
 class DevelopmentConfig(BaseConfig):
     DEBUG = True
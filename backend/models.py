@@ -10,6 +10,7 @@ class User(db.Model):
     role = db.Column(db.String(20), default="learner")
     emotion_opt_in = db.Column(db.Boolean, default=False)
     learning_style_opt_in = db.Column(db.Boolean, default=True)
+    timezone = db.Column(db.String(64), default="UTC")  # IANA name; decides when streak days roll over
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     emotion_logs = db.relationship("EmotionLog", backref="user", lazy=True)
@@ -50,6 +51,48 @@ class EmotionLog(db.Model):
     confidence = db.Column(db.Float, nullable=False)
 
 
+class EmotionRollup(db.Model):
+    """Per-minute emotion counts per user, maintained incrementally on ingest"""
+    __tablename__ = "emotion_rollup"
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    bucket = db.Column(db.DateTime, nullable=False)  # Timestamp truncated to the minute
+    emotion = db.Column(db.String(32), nullable=False)
+    sample_count = db.Column(db.Integer, default=0)
+    confidence_sum = db.Column(db.Float, default=0.0)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'bucket', 'emotion', name='unique_user_bucket_emotion'),
+        db.Index('ix_emotion_rollup_user_bucket', 'user_id', 'bucket'),
+    )
+
+
+class UserActivityCounter(db.Model):
+    """Running per-user activity totals, incremented by the write paths"""
+    __tablename__ = "user_activity_counters"
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    name = db.Column(db.String(64), nullable=False)  # "attempts", "correct", "quests_completed", "emotion:<label>"
+    value = db.Column(db.Integer, default=0)
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'name', name='unique_user_counter'),)
+
+
+class UserActivityDay(db.Model):
+    """Per-day attempt counts and accuracy sums for rolling accuracy windows"""
+    __tablename__ = "user_activity_day"
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    day = db.Column(db.Date, nullable=False)  # UTC day of the attempts
+    attempts = db.Column(db.Integer, default=0)
+    accuracy_sum = db.Column(db.Float, default=0.0)
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'day', name='unique_user_activity_day'),)
+
+
 class PerformanceLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
@@ -196,8 +239,11 @@ class UserStreak(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    # Ensure unique user-streak type pairs
-    __table_args__ = (db.UniqueConstraint('user_id', 'streak_type', name='unique_user_streak_type'),)
+    # Ensure unique user-streak type pairs; the nightly expiry scans by type and activity date
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'streak_type', name='unique_user_streak_type'),
+        db.Index('ix_user_streak_type_activity', 'streak_type', 'last_activity_date'),
+    )
     
     user = db.relationship("User", backref=db.backref("streaks", lazy=True))
 
@@ -259,6 +305,9 @@ class Quest(db.Model):
     estimated_duration = db.Column(db.Integer, default=7)  # Days
     is_active = db.Column(db.Boolean, default=True)
     is_repeatable = db.Column(db.Boolean, default=False)
+    # Set on generated quests shared by every user with the same weak-topic set;
+    # those are listed only to users they are assigned to
+    template_key = db.Column(db.String(40), nullable=True, unique=True, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -276,7 +325,7 @@ class UserQuest(db.Model):
     # Progress tracking
     status = db.Column(db.String(20), default="available")  # "available", "active", "completed", "failed"
     progress_percentage = db.Column(db.Float, default=0.0)
-    completed_tasks = db.Column(db.JSON, nullable=True)  # List of completed task IDs
+    completed_tasks = db.Column(db.JSON, nullable=True)  # Legacy; completed tasks live in QuestTaskCompletion
     current_task_index = db.Column(db.Integer, default=0)
     
     # Timing
@@ -294,6 +343,38 @@ class UserQuest(db.Model):
     user = db.relationship("User", backref=db.backref("quest_progress", lazy=True))
     quest = db.relationship("Quest", backref=db.backref("user_progress", lazy=True))
     badge_earned = db.relationship("Badge", backref=db.backref("quest_earnings", lazy=True))
+    
+    __table_args__ = (
+        db.Index('ix_user_quest_user_quest', 'user_id', 'quest_id'),
+        db.Index('ix_user_quest_quest', 'quest_id'),
+    )
+
+
+class QuestTaskCompletion(db.Model):
+    """Completed tasks of a user's quest, one row per task"""
+    __tablename__ = "quest_task_completion"
+    
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    quest_id = db.Column(db.Integer, db.ForeignKey("quest.id"), primary_key=True)
+    task_id = db.Column(db.String(100), primary_key=True)
+    completed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class QuestTaskWatch(db.Model):
+    """Open mastery tasks of active quests, indexed by topic for event-driven progress"""
+    __tablename__ = "quest_task_watch"
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    topic = db.Column(db.String(120), nullable=False)
+    quest_id = db.Column(db.Integer, db.ForeignKey("quest.id"), nullable=False)
+    task_id = db.Column(db.String(50), nullable=False)
+    target_mastery = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'quest_id', 'task_id', name='unique_quest_task_watch'),
+        db.Index('ix_quest_task_watch_user_topic', 'user_id', 'topic'),
+    )
 
 
 class XPTransaction(db.Model):
@@ -310,6 +391,29 @@ class XPTransaction(db.Model):
     
     user = db.relationship("User", backref=db.backref("xp_transactions", lazy=True))
 
+    __table_args__ = (
+        # Keyset pagination walks (user_id, id); compaction scans by age
+        db.Index('ix_xp_transaction_user_id_id', 'user_id', 'id'),
+        db.Index('ix_xp_transaction_created_at', 'created_at'),
+    )
+
+
+class XPDailyRollup(db.Model):
+    """Per-day XP totals per user and source, maintained by the XP ledger"""
+    __tablename__ = "xp_daily_rollup"
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    day = db.Column(db.Date, nullable=False)  # UTC day of the grants
+    source = db.Column(db.String(100), nullable=False)
+    amount = db.Column(db.Integer, default=0)
+    transaction_count = db.Column(db.Integer, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'day', 'source', name='unique_user_day_source'),
+        db.Index('ix_xp_daily_rollup_user_day', 'user_id', 'day'),
+    )
+
 
 # Story-Driven Quest System Models
 class Story(db.Model):
@@ -374,8 +478,9 @@ class StoryProgress(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
     story_id = db.Column(db.Integer, db.ForeignKey("story.id"), nullable=False)
     current_chapter_id = db.Column(db.Integer, db.ForeignKey("chapter.id"))
-    completed_chapters = db.Column(db.JSON, default=list)  # List of completed chapter IDs
-    completed_quests = db.Column(db.JSON, default=list)  # List of completed quest IDs
+    # Legacy; completions live in StoryChapterCompletion / StoryQuestCompletion
+    completed_chapters = db.Column(db.JSON, default=list)
+    completed_quests = db.Column(db.JSON, default=list)
     total_story_xp = db.Column(db.Integer, default=0)
     story_started_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -385,6 +490,34 @@ class StoryProgress(db.Model):
     current_chapter = db.relationship("Chapter", backref=db.backref("current_users", lazy=True))
 
 
+class StoryQuestCompletion(db.Model):
+    """Story quests a user has completed, one row per quest"""
+    __tablename__ = "story_quest_completion"
+    
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    quest_id = db.Column(db.Integer, db.ForeignKey("story_quest.id"), primary_key=True)
+    story_id = db.Column(db.Integer, db.ForeignKey("story.id"), nullable=False)
+    completed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_story_quest_completion_user_story', 'user_id', 'story_id'),
+    )
+
+
+class StoryChapterCompletion(db.Model):
+    """Story chapters a user has completed, one row per chapter"""
+    __tablename__ = "story_chapter_completion"
+    
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    chapter_id = db.Column(db.Integer, db.ForeignKey("chapter.id"), primary_key=True)
+    story_id = db.Column(db.Integer, db.ForeignKey("story.id"), nullable=False)
+    completed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_story_chapter_completion_user_story', 'user_id', 'story_id'),
+    )
+
+
 class StoryReward(db.Model):
     """Track story rewards and unlocks"""
     __tablename__ = "story_reward"
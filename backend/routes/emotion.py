@@ -1,13 +1,28 @@
-from flask import Blueprint, request, jsonify
+from datetime import datetime, timedelta, timezone
+import math
+
+from flask import Blueprint, current_app, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from .. import db, socketio
 from ..models import EmotionLog, User
-from ..services.emotion_service import EmotionDetectionService
+from ..services.emotion_service import EMOTION_LABELS, EmotionDetectionService
+from ..services.emotion_log_writer import emotion_log_writer
+from ..services.frame_pacing import frame_pacer
 
 emotion_bp = Blueprint("emotion", __name__)
 service = EmotionDetectionService()
 
 
+def _validate_reading(emotion, confidence) -> str:
+    """Error message for an imported reading the emotion_log table would reject, else an empty string"""
+    if not isinstance(emotion, str) or emotion not in EMOTION_LABELS \
+            or len(emotion) > EmotionLog.__table__.c.emotion.type.length:
+        return f"unknown emotion {emotion!r}"
+    if isinstance(confidence, bool) or not isinstance(confidence, (int, float)) \
+            or not math.isfinite(confidence) or not 0.0 <= confidence <= 1.0:
+        return f"confidence must be a number between 0 and 1, got {confidence!r}"
+    return ""
+
+
 @emotion_bp.post("/emotion")
 @jwt_required(optional=True)
 def analyze_emotion():
@@ -18,36 +33,121 @@ def analyze_emotion():
     if user and not user.emotion_opt_in:
         return jsonify({"error": "emotion detection disabled in settings"}), 403
 
+    pacing_key = f"user:{user.id}" if user else f"addr:{request.remote_addr}"
+    if frame_pacer.saturated():
+        return jsonify({
+            "error": "emotion inference busy",
+            "next_frame_after_ms": frame_pacer.backoff_ms(),
+        }), 429
+
     if request.content_type and request.content_type.startswith("multipart/form-data"):
         file = request.files.get("file")
         if not file:
             return jsonify({"error": "no file uploaded"}), 400
+        session_state = request.form.get("session_state")
         img_bytes = file.read()
         import numpy as np, cv2
         nparr = np.frombuffer(img_bytes, np.uint8)
         img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        analyzed = service.analyze_ndarray(img) if img is not None else None
+        with frame_pacer.track():
+            analyzed = service.analyze_ndarray(img, cache_key=pacing_key) if img is not None else None
     else:
         data = request.get_json() or {}
+        session_state = data.get("session_state")
         image_b64 = data.get("image")
-        analyzed = service.analyze_base64_image(image_b64) if image_b64 else None
+        with frame_pacer.track():
+            analyzed = service.analyze_base64_image(image_b64, cache_key=pacing_key) if image_b64 else None
 
     if not analyzed:
-        return jsonify({"error": "no emotion detected"}), 400
+        return jsonify({
+            "error": "no emotion detected",
+            "next_frame_after_ms": frame_pacer.next_interval_ms(pacing_key, session_state=session_state),
+        }), 400
 
     emotion, confidence = analyzed
 
-    # Persist if user is present and opted-in
+    # Persist if user is present and opted-in; the writer batches inserts and emits updates
     if user:
-        log = EmotionLog(user_id=user.id, emotion=emotion, confidence=confidence)
-        db.session.add(log)
-        db.session.commit()
-        socketio.emit(
-            "emotion_update",
-            {"user_id": user.id, "emotion": emotion, "confidence": confidence, "timestamp": log.timestamp.isoformat()},
-        )
-
-    return jsonify({"emotion": emotion, "confidence": confidence})
+        emotion_log_writer.submit(user.id, emotion, confidence)
+
+    return jsonify({
+        "emotion": emotion,
+        "confidence": confidence,
+        # Clients should wait this long before sending the next frame
+        "next_frame_after_ms": frame_pacer.next_interval_ms(pacing_key, emotion, confidence, session_state),
+    })
+
+
+@emotion_bp.post("/emotion/import")
+@jwt_required()
+def import_timeline():
+    """Bulk-import an offline session timeline from Face-Emotion-Detector's /analyze_session"""
+    user = User.query.get(int(get_jwt_identity()))
+    if not user or not user.emotion_opt_in:
+        return jsonify({"error": "emotion detection disabled in settings"}), 403
+
+    max_bytes = current_app.config.get("EMOTION_IMPORT_MAX_BYTES", 2 * 1024 * 1024)
+    if request.content_length is not None and request.content_length > max_bytes:
+        return jsonify({"error": f"timeline larger than {max_bytes} bytes"}), 413
+
+    data = request.get_json() or {}
+    max_samples = current_app.config.get("EMOTION_IMPORT_MAX_SAMPLES", 7200)
+    try:
+        samples = data.get("samples")
+        if not samples:
+            # Expand compact segments into evenly spaced readings
+            segments = (data.get("timeline") or {}).get("segments", [])
+            if sum(max(int(segment.get("samples", 1)), 1) for segment in segments) > max_samples:
+                return jsonify({"error": f"timeline has more than {max_samples} samples"}), 413
+            samples = []
+            for segment in segments:
+                count = max(int(segment.get("samples", 1)), 1)
+                span = float(segment["end"]) - float(segment["start"])
+                step = span / (count - 1) if count > 1 else 0.0
+                samples.extend(
+                    [float(segment["start"]) + i * step, segment["emotion"], segment["confidence"]]
+                    for i in range(count)
+                )
+        if not samples:
+            return jsonify({"error": "no samples to import"}), 400
+        if len(samples) > max_samples:
+            return jsonify({"error": f"timeline has more than {max_samples} samples"}), 413
+
+        if data.get("started_at"):
+            started_at = datetime.fromisoformat(data["started_at"])
+            if started_at.tzinfo:
+                started_at = started_at.astimezone(timezone.utc).replace(tzinfo=None)
+        else:
+            started_at = datetime.utcnow() - timedelta(seconds=float(samples[-1][0]))
+        readings = []
+        for offset, emotion, confidence in samples:
+            error = _validate_reading(emotion, confidence)
+            if error:
+                return jsonify({"error": f"invalid timeline: {error}"}), 400
+            readings.append({"emotion": emotion, "confidence": float(confidence),
+                             "timestamp": started_at + timedelta(seconds=float(offset))})
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"invalid timeline: {e}"}), 400
+
+    # Stored in its own transaction so the response reflects what was actually written
+    try:
+        imported = emotion_log_writer.write_many(user.id, readings)
+    except Exception as e:
+        current_app.logger.error(f"Error importing emotion timeline for user {user.id}: {e}")
+        return jsonify({"error": "could not store timeline"}), 500
+    return jsonify({"imported": imported})
+
+
+@emotion_bp.get("/emotion/metrics")
+@jwt_required()
+def get_metrics():
+    """Frame cache hit rate and inference load for the emotion endpoint"""
+    return jsonify({
+        "cache": service.cache.stats(),
+        "inference_utilization": round(frame_pacer.utilization(), 3),
+        "inference_load": round(frame_pacer.load(), 3),
+        "pending_log_writes": emotion_log_writer.pending(),
+    })
 
 
 @emotion_bp.get("/emotion/logs")
@@ -1,14 +1,30 @@
-from datetime import datetime, timedelta
-from flask import Blueprint, jsonify, request
+from datetime import date
+from flask import Blueprint, jsonify, make_response, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from .. import db, socketio
-from ..models import User, UserXP, UserStreak, UserBadge, Badge, XPTransaction
+from ..models import User, UserBadge, Badge
 from ..services.gamification_service import GamificationService
+from ..services.gamification_status import GamificationView, gamification_version
+from ..services.leaderboard import WINDOWS
+from ..services.xp_rollup import get_daily_page, get_transactions_page
 
 gamification_bp = Blueprint("gamification", __name__)
 gamification_service = GamificationService()
 
 
+def _versioned_response(user_id, build):
+    """Serve build() with an ETag, or 304 when the client's copy is current"""
+    etag = gamification_version(user_id)
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+    else:
+        response = make_response(jsonify(build()), 200)
+    response.set_etag(etag)
+    # Browsers may keep the body but must revalidate on every poll
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
 @gamification_bp.get("/status")
 @jwt_required()
 def get_gamification_status():
@@ -16,8 +32,7 @@ def get_gamification_status():
     user_id = int(get_jwt_identity())
     
     try:
-        status = gamification_service.get_gamification_status(user_id)
-        return jsonify(status), 200
+        return _versioned_response(user_id, lambda: gamification_service.get_gamification_status(user_id))
     except Exception as e:
         return jsonify({'error': f'Failed to get gamification status: {str(e)}'}), 500
 
@@ -76,6 +91,14 @@ def award_xp():
             'source': source
         }, room=str(user_id))
         
+        # Only XP and level badges can be unlocked by an XP award
+        result['new_badges'] = gamification_service.check_and_award_badges(user_id, triggers=("xp", "level"))
+        for badge in result['new_badges']:
+            socketio.emit('badge_earned', {
+                'user_id': user_id,
+                'badge': badge
+            }, room=str(user_id))
+        
         return jsonify(result), 200
     except Exception as e:
         return jsonify({'error': f'Failed to award XP: {str(e)}'}), 500
@@ -105,6 +128,12 @@ def update_streak():
             'xp_bonus': result.get('xp_bonus', 0)
         }, room=str(user_id))
         
+        for badge in result.get('new_badges', []):
+            socketio.emit('badge_earned', {
+                'user_id': user_id,
+                'badge': badge
+            }, room=str(user_id))
+        
         return jsonify(result), 200
     except Exception as e:
         return jsonify({'error': f'Failed to update streak: {str(e)}'}), 500
@@ -142,6 +171,18 @@ def get_user_badges():
         return jsonify({'error': f'Failed to get badges: {str(e)}'}), 500
 
 
+@gamification_bp.get("/badges/progress")
+@jwt_required()
+def get_badge_progress():
+    """Get progress towards badges the user has not earned yet"""
+    user_id = int(get_jwt_identity())
+    
+    try:
+        return jsonify({"badges": gamification_service.get_badge_progress(user_id)}), 200
+    except Exception as e:
+        return jsonify({'error': f'Failed to get badge progress: {str(e)}'}), 500
+
+
 @gamification_bp.post("/check-badges")
 @jwt_required()
 def check_and_award_badges():
@@ -170,29 +211,50 @@ def check_and_award_badges():
 @gamification_bp.get("/leaderboard")
 @jwt_required()
 def get_leaderboard():
-    """Get leaderboard of top users"""
+    """Get leaderboard of top users; ?window=all|weekly|monthly"""
     limit = int(request.args.get('limit', 10))
+    window = request.args.get('window', 'all')
+    if window not in WINDOWS:
+        return jsonify({'error': f'window must be one of {", ".join(WINDOWS)}'}), 400
     
     try:
-        leaderboard = gamification_service.get_leaderboard(limit)
+        leaderboard = gamification_service.get_leaderboard(limit, window)
         return jsonify({
             "leaderboard": leaderboard,
+            "window": window,
             "total_users": len(leaderboard)
         }), 200
     except Exception as e:
         return jsonify({'error': f'Failed to get leaderboard: {str(e)}'}), 500
 
 
+@gamification_bp.get("/leaderboard/me")
+@jwt_required()
+def get_my_leaderboard_position():
+    """Get the current user's rank and nearby users"""
+    user_id = int(get_jwt_identity())
+    window = request.args.get('window', 'all')
+    radius = min(int(request.args.get('radius', 2)), 25)
+    if window not in WINDOWS:
+        return jsonify({'error': f'window must be one of {", ".join(WINDOWS)}'}), 400
+    
+    try:
+        position = gamification_service.get_leaderboard_position(user_id, window, radius)
+        return jsonify({**position, "window": window}), 200
+    except Exception as e:
+        return jsonify({'error': f'Failed to get leaderboard position: {str(e)}'}), 500
+
+
 @gamification_bp.get("/transactions")
 @jwt_required()
 def get_xp_transactions():
-    """Get user's XP transaction history"""
+    """Get user's XP transaction history, newest first; pass next_before_id back as before_id for the next page"""
     user_id = int(get_jwt_identity())
-    limit = int(request.args.get('limit', 20))
+    limit = min(int(request.args.get('limit', 20)), 100)
+    before_id = request.args.get('before_id', type=int)
     
     try:
-        transactions = XPTransaction.query.filter_by(user_id=user_id)\
-            .order_by(XPTransaction.created_at.desc()).limit(limit).all()
+        transactions, next_before_id = get_transactions_page(user_id, limit, before_id)
         
         transactions_data = []
         for transaction in transactions:
@@ -207,12 +269,36 @@ def get_xp_transactions():
         
         return jsonify({
             "transactions": transactions_data,
-            "total_count": len(transactions_data)
+            "total_count": len(transactions_data),
+            "next_before_id": next_before_id
         }), 200
     except Exception as e:
         return jsonify({'error': f'Failed to get transactions: {str(e)}'}), 500
 
 
+@gamification_bp.get("/transactions/daily")
+@jwt_required()
+def get_daily_xp_history():
+    """Get per-day XP totals, newest first; includes days whose raw transactions were archived"""
+    user_id = int(get_jwt_identity())
+    limit = min(int(request.args.get('limit', 30)), 366)
+    
+    try:
+        before = request.args.get('before')
+        before_day = date.fromisoformat(before) if before else None
+    except ValueError:
+        return jsonify({'error': 'before must be a YYYY-MM-DD date'}), 400
+    
+    try:
+        days, next_before = get_daily_page(user_id, limit, before_day)
+        return jsonify({
+            "days": days,
+            "next_before": next_before.isoformat() if next_before else None
+        }), 200
+    except Exception as e:
+        return jsonify({'error': f'Failed to get XP history: {str(e)}'}), 500
+
+
 @gamification_bp.post("/freeze-streak")
 @jwt_required()
 def freeze_streak():
@@ -274,41 +360,7 @@ def get_gamification_stats():
     user_id = int(get_jwt_identity())
     
     try:
-        # Get XP profile
-        user_xp = UserXP.query.filter_by(user_id=user_id).first()
-        if not user_xp:
-            gamification_service.initialize_user_gamification(user_id)
-            user_xp = UserXP.query.filter_by(user_id=user_id).first()
-        
-        # Get streak stats
-        streaks = UserStreak.query.filter_by(user_id=user_id).all()
-        streak_stats = {}
-        for streak in streaks:
-            streak_stats[streak.streak_type] = {
-                "current": streak.current_streak,
-                "longest": streak.longest_streak,
-                "frozen": streak.streak_frozen
-            }
-        
-        # Get badge count
-        badge_count = UserBadge.query.filter_by(user_id=user_id).count()
-        
-        # Get recent activity
-        recent_transactions = XPTransaction.query.filter_by(user_id=user_id)\
-            .filter(XPTransaction.created_at >= datetime.utcnow() - timedelta(days=7)).count()
-        
-        return jsonify({
-            "xp_profile": {
-                "total_xp": user_xp.total_xp,
-                "current_level": user_xp.current_level,
-                "xp_to_next_level": user_xp.xp_to_next_level,
-                "xp_in_current_level": user_xp.xp_in_current_level
-            },
-            "streak_stats": streak_stats,
-            "badge_count": badge_count,
-            "recent_activity": recent_transactions,
-            "total_streak_days": sum(streak.current_streak for streak in streaks)
-        }), 200
+        return _versioned_response(user_id, lambda: GamificationView(user_id).stats())
     except Exception as e:
         return jsonify({'error': f'Failed to get stats: {str(e)}'}), 500
 
@@ -320,48 +372,6 @@ def get_achievements():
     user_id = int(get_jwt_identity())
     
     try:
-        # Get XP profile
-        user_xp = UserXP.query.filter_by(user_id=user_id).first()
-        if not user_xp:
-            gamification_service.initialize_user_gamification(user_id)
-            user_xp = UserXP.query.filter_by(user_id=user_id).first()
-        
-        # Get badges by category
-        user_badges = UserBadge.query.filter_by(user_id=user_id).all()
-        badges_by_category = {}
-        
-        for user_badge in user_badges:
-            badge = Badge.query.get(user_badge.badge_id)
-            if badge:
-                category = badge.category
-                if category not in badges_by_category:
-                    badges_by_category[category] = []
-                badges_by_category[category].append({
-                    "name": badge.name,
-                    "description": badge.description,
-                    "icon": badge.icon,
-                    "rarity": badge.rarity,
-                    "earned_at": user_badge.earned_at.isoformat()
-                })
-        
-        # Get streak achievements
-        streaks = UserStreak.query.filter_by(user_id=user_id).all()
-        streak_achievements = []
-        for streak in streaks:
-            if streak.longest_streak >= 7:
-                streak_achievements.append({
-                    "type": streak.streak_type,
-                    "days": streak.longest_streak,
-                    "milestone": "weekly" if streak.longest_streak >= 7 else "monthly" if streak.longest_streak >= 30 else "daily"
-                })
-        
-        return jsonify({
-            "level": user_xp.current_level,
-            "total_xp": user_xp.total_xp,
-            "badges_by_category": badges_by_category,
-            "streak_achievements": streak_achievements,
-            "total_badges": len(user_badges),
-            "total_streak_days": sum(streak.current_streak for streak in streaks)
-        }), 200
+        return _versioned_response(user_id, lambda: GamificationView(user_id).achievements())
     except Exception as e:
         return jsonify({'error': f'Failed to get achievements: {str(e)}'}), 500
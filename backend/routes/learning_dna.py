@@ -4,6 +4,8 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from .. import db, socketio
 from ..models import User, TopicMastery, LearningProgress, LearningBadge
 from ..services.learning_dna import LearningDNAEngine
+from ..services.leaderboard import leaderboard_service
+from ..services.mastery_store import get_user_mastery
 
 dna_bp = Blueprint("learning_dna", __name__)
 dna_engine = LearningDNAEngine()
@@ -20,7 +22,7 @@ def get_topic_mastery(user_id):
         return jsonify({'error': 'Access denied'}), 403
     
     try:
-        mastery_records = TopicMastery.query.filter_by(user_id=user_id).all()
+        mastery_records = get_user_mastery(user_id).values()
         
         mastery_data = []
         for mastery in mastery_records:
@@ -234,11 +236,11 @@ def get_learning_stats(user_id):
     
     try:
         # Get basic stats
-        total_topics = TopicMastery.query.filter_by(user_id=user_id).count()
+        mastery_records = list(get_user_mastery(user_id).values())
+        total_topics = len(mastery_records)
         total_badges = LearningBadge.query.filter_by(user_id=user_id).count()
         
         # Get mastery distribution
-        mastery_records = TopicMastery.query.filter_by(user_id=user_id).all()
         mastery_distribution = {
             'beginner': 0,
             'intermediate': 0,
@@ -279,25 +281,20 @@ def get_learning_stats(user_id):
 def get_leaderboard():
     """Get learning leaderboard (top performers)"""
     try:
-        # Get top 10 users by average mastery
-        top_users = db.session.query(
-            User.id,
-            User.name,
-            db.func.avg(TopicMastery.mastery_score).label('avg_mastery'),
-            db.func.count(TopicMastery.id).label('topic_count')
-        ).join(TopicMastery).group_by(User.id, User.name)\
-        .having(db.func.count(TopicMastery.id) >= 3)\
-        .order_by(db.func.avg(TopicMastery.mastery_score).desc())\
-        .limit(10).all()
+        # Top 10 from the materialized mastery board; topic counts in one query
+        top_users = leaderboard_service.top("mastery", limit=10)
+        topic_counts = dict(db.session.query(TopicMastery.user_id, db.func.count(TopicMastery.id))
+                            .filter(TopicMastery.user_id.in_([u['user_id'] for u in top_users]))
+                            .group_by(TopicMastery.user_id)) if top_users else {}
         
         leaderboard = []
-        for i, user in enumerate(top_users, 1):
+        for user in top_users:
             leaderboard.append({
-                'rank': i,
-                'user_id': user.id,
-                'name': user.name,
-                'average_mastery': round(user.avg_mastery, 1),
-                'topics_studied': user.topic_count
+                'rank': user['rank'],
+                'user_id': user['user_id'],
+                'name': user['name'],
+                'average_mastery': round(user['score'], 1),
+                'topics_studied': topic_counts.get(user['user_id'], 0)
             })
         
         return jsonify({
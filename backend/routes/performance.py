@@ -3,8 +3,11 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from .. import db, socketio
 from ..models import PerformanceLog, LearnerConceptMastery
 from ..services.adaptive_engine import get_next_question
+from ..services.activity_counters import record_attempt
+from ..services.gamification_service import GamificationService
 
 performance_bp = Blueprint("performance", __name__)
+gamification_service = GamificationService()
 
 
 @performance_bp.post("/log")
@@ -30,6 +33,7 @@ def create_log():
         score=float(score) if score is not None else None,
     )
     db.session.add(log)
+    record_attempt(user_id, log.correct, log.score)
     # Optional: update learner concept mastery & emit graph update
     if concept_id is not None:
         try:
@@ -70,6 +74,10 @@ def create_log():
     }
     socketio.emit("performance_update", payload)
 
+    # Attempt-count and accuracy badges
+    for badge in gamification_service.check_and_award_badges(user_id, triggers=("performance",)):
+        socketio.emit("badge_earned", {"user_id": user_id, "badge": badge}, room=str(user_id))
+
     return jsonify(payload), 201
 
 
@@ -2,8 +2,9 @@ from datetime import datetime, timedelta
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from .. import db, socketio
-from ..models import TopicMastery, PerformanceLog, EmotionLog, LearningStyle, Content
+from ..models import PerformanceLog, EmotionLog, LearningStyle, Content
 from ..services.personalization_engine import PersonalizationEngine
+from ..services.mastery_store import get_user_mastery
 
 personalization_bp = Blueprint("personalization", __name__)
 personalization_engine = PersonalizationEngine()
@@ -97,7 +98,7 @@ def get_mastery_map():
     user_id = int(get_jwt_identity())
     
     try:
-        topic_masteries = TopicMastery.query.filter_by(user_id=user_id).all()
+        topic_masteries = list(get_user_mastery(user_id).values())
         
         mastery_map = {}
         for mastery in topic_masteries:
@@ -142,10 +143,10 @@ def get_weak_topics():
     user_id = int(get_jwt_identity())
     
     try:
-        weak_topics = TopicMastery.query.filter(
-            TopicMastery.user_id == user_id,
-            TopicMastery.mastery_score < 40.0
-        ).order_by(TopicMastery.mastery_score.asc()).all()
+        weak_topics = sorted(
+            (mastery for mastery in get_user_mastery(user_id).values() if mastery.mastery_score < 40.0),
+            key=lambda mastery: mastery.mastery_score
+        )
         
         topics_data = []
         for mastery in weak_topics:
@@ -175,10 +176,10 @@ def get_strong_topics():
     user_id = int(get_jwt_identity())
     
     try:
-        strong_topics = TopicMastery.query.filter(
-            TopicMastery.user_id == user_id,
-            TopicMastery.mastery_score >= 80.0
-        ).order_by(TopicMastery.mastery_score.desc()).all()
+        strong_topics = sorted(
+            (mastery for mastery in get_user_mastery(user_id).values() if mastery.mastery_score >= 80.0),
+            key=lambda mastery: mastery.mastery_score, reverse=True
+        )
         
         topics_data = []
         for mastery in strong_topics:
@@ -3,6 +3,7 @@ from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from .. import db, socketio
 from ..models import Quest, UserQuest, User, Badge
+from ..services.progress_membership import get_completed_tasks
 from ..services.quest_engine import QuestEngine
 
 quests_bp = Blueprint("quests", __name__)
@@ -171,6 +172,8 @@ def get_active_quests():
             UserQuest.status == "active"
         ).all()
         
+        completed_tasks = get_completed_tasks(user_id, [user_quest.quest_id for user_quest in active_quests])
+        
         quests_data = []
         for user_quest in active_quests:
             quest = Quest.query.get(user_quest.quest_id)
@@ -182,7 +185,7 @@ def get_active_quests():
                     "story_theme": quest.story_theme,
                     "difficulty": quest.difficulty,
                     "progress_percentage": user_quest.progress_percentage,
-                    "completed_tasks": user_quest.completed_tasks or [],
+                    "completed_tasks": completed_tasks.get(quest.id, []),
                     "current_task_index": user_quest.current_task_index,
                     "started_at": user_quest.started_at.isoformat() if user_quest.started_at else None,
                     "deadline": user_quest.deadline.isoformat() if user_quest.deadline else None,
@@ -283,7 +286,7 @@ def get_quest_details(quest_id):
             quest_data["user_progress"] = {
                 "status": user_quest.status,
                 "progress_percentage": user_quest.progress_percentage,
-                "completed_tasks": user_quest.completed_tasks or [],
+                "completed_tasks": get_completed_tasks(user_id, [quest_id]).get(quest_id, []),
                 "current_task_index": user_quest.current_task_index,
                 "started_at": user_quest.started_at.isoformat() if user_quest.started_at else None,
                 "deadline": user_quest.deadline.isoformat() if user_quest.deadline else None,
@@ -3,6 +3,7 @@ from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from .. import db, socketio
 from ..models import User, RevisionSchedule, Content, PerformanceLog, EmotionLog
+from ..services.activity_counters import record_attempt
 from ..services.revision_service import RevisionService
 
 revision_bp = Blueprint("revision", __name__)
@@ -81,6 +82,7 @@ def complete_review():
             score=quality_score / 5.0  # Convert to 0-1 scale
         )
         db.session.add(performance_log)
+        record_attempt(user_id, performance_log.correct, performance_log.score)
         db.session.commit()
         
         # Emit real-time updates
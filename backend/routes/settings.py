@@ -2,6 +2,7 @@ from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from .. import db
 from ..models import User
+from ..services.streak_evaluator import valid_timezone
 
 settings_bp = Blueprint("settings", __name__)
 
@@ -12,7 +13,7 @@ def get_settings():
     user = User.query.get(int(get_jwt_identity()))
     if not user:
         return jsonify({"error": "not found"}), 404
-    return jsonify({"emotion_opt_in": user.emotion_opt_in})
+    return jsonify({"emotion_opt_in": user.emotion_opt_in, "timezone": user.timezone or "UTC"})
 
 
 @settings_bp.post("/")
@@ -24,7 +25,11 @@ def update_settings():
     data = request.get_json() or {}
     if "emotion_opt_in" in data:
         user.emotion_opt_in = bool(data["emotion_opt_in"])
+    if "timezone" in data:
+        if not valid_timezone(data["timezone"]):
+            return jsonify({"error": "timezone must be an IANA name such as 'Europe/London'"}), 400
+        user.timezone = data["timezone"]
     db.session.commit()
-    return jsonify({"emotion_opt_in": user.emotion_opt_in})
+    return jsonify({"emotion_opt_in": user.emotion_opt_in, "timezone": user.timezone or "UTC"})
 
 
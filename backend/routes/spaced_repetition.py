@@ -1,7 +1,9 @@
+from datetime import datetime
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from .. import db, socketio
 from ..models import Content, UserProgress, User
+from ..services.activity_counters import record_attempt
 from ..services.spaced_repetition import SpacedRepetitionEngine
 from ..services.feedback_engine import PersonalizedFeedbackEngine
 from ..services.learning_dna import LearningDNAEngine
@@ -75,6 +77,16 @@ def submit_quiz_answer():
     if not content:
         return jsonify({'error': 'Content not found'}), 404
     
+    user = User.query.get(user_id)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    # Binary quiz outcome as a 0-1 score
+    score = 1.0 if correct else 0.0
+    
+    # Counted in the same transaction update_progress commits
+    record_attempt(user_id, bool(correct), score)
+    
     # Update progress with spaced repetition algorithm
     progress = engine.update_progress(
         user_id=user_id,
@@ -149,39 +161,44 @@ def submit_quiz_answer():
     # Check for story progress updates
     story_rewards = []
     try:
+        from ..services.progress_membership import completed_story_quests
+        from ..services.story_catalog import story_catalog
         from ..services.story_service import StoryService
-        from ..models import StoryQuest, StoryProgress
         
         story_service = StoryService()
         
         # Find quests that might be related to this content
-        related_quests = StoryQuest.query.filter(
-            StoryQuest.topics.contains([content.topic])
-        ).all()
+        related_quests = story_catalog.get().topic_quests(content.topic)
+        
+        # Only good performance can complete a quest
+        if related_quests and quality_score >= 3:
+            progress_by_story = story_service.get_progress_for_stories(
+                user_id, {quest.story_id for quest in related_quests}
+            )
+            already_completed = completed_story_quests(user_id, [quest.id for quest in related_quests])
+        else:
+            progress_by_story, already_completed = {}, set()
         
         for quest in related_quests:
             # Check if user has completed this quest
-            story_progress = StoryProgress.query.filter_by(
-                user_id=user_id, story_id=quest.chapter.story_id
-            ).first()
+            story_progress = progress_by_story.get(quest.story_id)
             
-            if story_progress and quest.id not in story_progress.completed_quests:
-                # Check if this performance qualifies for quest completion
-                if quality_score >= 3:  # Good performance
-                    story_result = story_service.update_story_progress(
-                        user_id, quest.id, quality_score * 20, 0  # Convert to 0-100 scale
-                    )
+            if story_progress and quest.id not in already_completed:
+                story_result = story_service.update_story_progress(
+                    user_id, quest.id, quality_score * 20, 0,  # Convert to 0-100 scale
+                    story_progress=story_progress
+                )
+                
+                if story_result.get("rewards"):
+                    story_rewards.extend(story_result["rewards"])
                     
-                    if story_result.get("rewards"):
-                        story_rewards.extend(story_result["rewards"])
-                        
-                        # Emit story progress update
-                        socketio.emit("story_progress_update", {
-                            "user_id": user_id,
-                            "quest_id": quest.id,
-                            "rewards": story_result["rewards"],
-                            "timestamp": datetime.utcnow().isoformat()
-                        }, room=str(user_id))
+                    # Emit story progress update
+                    socketio.emit("story_progress_update", {
+                        "user_id": user_id,
+                        "quest_id": quest.id,
+                        "rewards": story_result["rewards"],
+                        "timestamp": datetime.utcnow().isoformat()
+                    }, room=str(user_id))
         
         story_included = True
     except Exception as e:
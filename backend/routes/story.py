@@ -2,6 +2,8 @@ from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from .. import db, socketio
 from ..models import User, Story, Chapter, StoryQuest, StoryProgress, StoryReward
+from ..services.progress_membership import load_story_completions
+from ..services.story_catalog import story_catalog
 from ..services.story_service import StoryService
 from datetime import datetime
 
@@ -138,7 +140,7 @@ def get_chapter_details(chapter_id):
     user_id = int(get_jwt_identity())
     
     try:
-        chapter = Chapter.query.get(chapter_id)
+        chapter = story_catalog.get().chapter(chapter_id)
         if not chapter:
             return jsonify({
                 "error": "Chapter not found"
@@ -154,12 +156,13 @@ def get_chapter_details(chapter_id):
                 "error": "Story progress not found"
             }), 404
         
-        if not story_service._is_chapter_unlocked(user_id, chapter, story_progress):
+        completions = load_story_completions(user_id, chapter.story_id)
+        if not story_service._is_chapter_unlocked(user_id, chapter, story_progress, completions):
             return jsonify({
                 "error": "Chapter not unlocked"
             }), 403
         
-        chapter_data = story_service._format_chapter_data(chapter, story_progress)
+        chapter_data = story_service._format_chapter_data(chapter, completions)
         
         return jsonify({
             "success": True,
@@ -180,7 +183,8 @@ def get_quest_details(quest_id):
     user_id = int(get_jwt_identity())
     
     try:
-        quest = StoryQuest.query.get(quest_id)
+        catalog = story_catalog.get()
+        quest = catalog.quest(quest_id)
         if not quest:
             return jsonify({
                 "error": "Quest not found"
@@ -188,7 +192,7 @@ def get_quest_details(quest_id):
         
         # Check if user has access to this quest
         story_progress = StoryProgress.query.filter_by(
-            user_id=user_id, story_id=quest.chapter.story_id
+            user_id=user_id, story_id=quest.story_id
         ).first()
         
         if not story_progress:
@@ -196,12 +200,13 @@ def get_quest_details(quest_id):
                 "error": "Story progress not found"
             }), 404
         
-        if not story_service._is_chapter_unlocked(user_id, quest.chapter, story_progress):
+        completions = load_story_completions(user_id, quest.story_id)
+        if not story_service._is_chapter_unlocked(user_id, catalog.chapter(quest.chapter_id), story_progress, completions):
             return jsonify({
                 "error": "Quest not unlocked"
             }), 403
         
-        quest_data = story_service._format_quest_data(quest, story_progress)
+        quest_data = story_service._format_quest_data(quest, completions)
         
         return jsonify({
             "success": True,
@@ -220,7 +225,7 @@ def get_quest_details(quest_id):
 def get_available_stories():
     """Get all available stories"""
     try:
-        stories = Story.query.filter_by(is_active=True).order_by(Story.id).all()
+        stories = story_catalog.get().active_stories()
         
         stories_data = [story_service._format_story_data(story) for story in stories]
         
@@ -243,7 +248,7 @@ def start_story(story_id):
     user_id = int(get_jwt_identity())
     
     try:
-        story = Story.query.get(story_id)
+        story = story_catalog.get().story(story_id)
         if not story or not story.is_active:
             return jsonify({
                 "error": "Story not found or not available"
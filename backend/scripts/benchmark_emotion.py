@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Benchmark the emotion detection path on a fixed image corpus.
+
+The corpus is the bundled sample photos plus deterministic synthetic faces,
+JPEG-encoded and base64-wrapped the way clients send them. Every detector
+runs in its own process so peak RSS is attributable, and each frame is timed
+in these stages:
+
+- decode:           base64 decode + cv2.imdecode
+- classify:         detect_emotion_from_image_data(), the call /api/emotion makes
+                    (including the detector's own face detection)
+- end_to_end:       decode + classify, the production path
+- detect:           OpenCV Haar face detection on its own, for reference
+- classify_batched: classify_faces() on the Haar crops (the whole frame when
+                    none is found); not part of end_to_end
+
+The report (p50/p99 per stage, end-to-end throughput, peak RSS) is printed as
+JSON so runs before and after an upgrade or config change can be diffed.
+
+Usage: python backend/scripts/benchmark_emotion.py --output bench.json
+"""
+import argparse
+import base64
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+SAMPLES_DIR = REPO_ROOT / "backend" / "Face-Emotion-Detector" / "assets" / "samples"
+
+DETECTORS = ("emotion_detector", "deepface_inline", "onnx", "mock")
+
+
+def _synthetic_face(rng: np.random.Generator, width: int = 640, height: int = 480) -> np.ndarray:
+    """Draw a simple face on a noisy background; seeded, so identical on every run"""
+    frame = rng.integers(40, 90, size=(height, width, 3), dtype=np.uint8)
+    cx = int(rng.integers(width // 3, 2 * width // 3))
+    cy = int(rng.integers(height // 3, 2 * height // 3))
+    rx, ry = int(rng.integers(60, 110)), int(rng.integers(80, 140))
+    skin = tuple(int(c) for c in rng.integers(120, 220, size=3))
+    cv2.ellipse(frame, (cx, cy), (rx, ry), 0, 0, 360, skin, -1)
+    for dx in (-rx // 2, rx // 2):
+        cv2.circle(frame, (cx + dx, cy - ry // 4), max(rx // 8, 4), (30, 30, 30), -1)
+    # Mouth curvature varies between a smile and a frown
+    start, end = (20, 160) if rng.random() > 0.5 else (200, 340)
+    cv2.ellipse(frame, (cx, cy + ry // 2), (rx // 2, ry // 6), 0, start, end, (40, 40, 120), 3)
+    return cv2.GaussianBlur(frame, (3, 3), 0)
+
+
+def build_corpus(synthetic: int = 24, seed: int = 7, extra_dir: str = None) -> list:
+    """Return the benchmark corpus as base64 JPEG strings in a stable order"""
+    images = [cv2.imread(str(p)) for p in sorted(SAMPLES_DIR.glob("*.jpg"))]
+    if extra_dir:
+        for pattern in ("*.jpg", "*.jpeg", "*.png"):
+            images.extend(cv2.imread(str(p)) for p in sorted(Path(extra_dir).glob(pattern)))
+
+    rng = np.random.default_rng(seed)
+    images.extend(_synthetic_face(rng) for _ in range(synthetic))
+
+    corpus = []
+    for img in images:
+        if img is None:
+            continue
+        ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        if ok:
+            corpus.append(base64.b64encode(encoded.tobytes()).decode("ascii"))
+    return corpus
+
+
+def _load_detector(name: str, onnx_model: str = None, onnx_threads: int = 0):
+    sys.path.insert(0, str(REPO_ROOT))
+    from backend.services import emotion_service
+
+    if name == "emotion_detector":
+        if emotion_service.EmotionDetector is None:
+            raise ImportError("Face-Emotion-Detector EmotionDetector is unavailable")
+        return emotion_service.EmotionDetector()
+    if name == "deepface_inline":
+        if emotion_service.DeepFace is None:
+            raise ImportError("DeepFace is not installed")
+        return emotion_service.DeepFaceEmotionDetector()
+    if name == "onnx":
+        return emotion_service.create_detector("onnx", onnx_model_path=onnx_model, onnx_threads=onnx_threads)
+    return emotion_service.MockEmotionDetector()
+
+
+def _stats(samples_ms: list) -> dict:
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    return {
+        "p50_ms": round(float(np.percentile(samples, 50)), 3),
+        "p99_ms": round(float(np.percentile(samples, 99)), 3),
+        "mean_ms": round(float(samples.mean()), 3),
+    }
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def run_detector(name: str, corpus: list, iterations: int, warmup: int,
+                 onnx_model: str = None, onnx_threads: int = 0) -> dict:
+    try:
+        detector = _load_detector(name, onnx_model, onnx_threads)
+    except Exception as e:
+        return {"skipped": str(e)}
+
+    cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+    timings = {"decode": [], "classify": [], "end_to_end": [], "detect": [], "classify_batched": []}
+    faces_found = 0
+
+    frames = corpus * iterations
+    for index, image_b64 in enumerate(corpus[:warmup] + frames):
+        t0 = time.perf_counter()
+        img = cv2.imdecode(np.frombuffer(base64.b64decode(image_b64), np.uint8), cv2.IMREAD_COLOR)
+        t1 = time.perf_counter()
+        detector.detect_emotion_from_image_data(img, show_result=False)
+        t2 = time.perf_counter()
+
+        # Batched path over the same frame, timed separately from the production call
+        faces = cascade.detectMultiScale(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), 1.1, 4)
+        crops = [img[y:y + h, x:x + w] for (x, y, w, h) in faces] or [img]
+        t3 = time.perf_counter()
+        detector.classify_faces(crops)
+        t4 = time.perf_counter()
+
+        if index < warmup:
+            continue
+        faces_found += int(len(faces) > 0)
+        timings["decode"].append((t1 - t0) * 1000.0)
+        timings["classify"].append((t2 - t1) * 1000.0)
+        timings["end_to_end"].append((t2 - t0) * 1000.0)
+        timings["detect"].append((t3 - t2) * 1000.0)
+        timings["classify_batched"].append((t4 - t3) * 1000.0)
+
+    total_s = sum(timings["end_to_end"]) / 1000.0
+    report = {stage: _stats(samples) for stage, samples in timings.items()}
+    report.update({
+        "frames": len(frames),
+        "faces_detected": faces_found,
+        "throughput_fps": round(len(frames) / total_s, 2) if total_s else None,
+        "peak_rss_mb": _peak_rss_mb(),
+    })
+    return report
+
+
+def _worker(queue, name, corpus, iterations, warmup, onnx_model, onnx_threads):
+    # Keep detector import chatter off stdout, which carries the JSON report
+    sys.stdout = sys.stderr
+    try:
+        queue.put(run_detector(name, corpus, iterations, warmup, onnx_model, onnx_threads))
+    except Exception as e:
+        queue.put({"error": str(e)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark emotion detectors on a fixed corpus")
+    parser.add_argument("--detectors", default=",".join(DETECTORS),
+                        help=f"Comma-separated subset of {', '.join(DETECTORS)}")
+    parser.add_argument("--iterations", type=int, default=3, help="Passes over the corpus per detector")
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed frames before measuring")
+    parser.add_argument("--synthetic", type=int, default=24, help="Synthetic faces in the corpus")
+    parser.add_argument("--seed", type=int, default=7, help="Seed for the synthetic faces")
+    parser.add_argument("--corpus-dir", default=None, help="Extra directory of images to include")
+    parser.add_argument("--onnx-model", default=None, help="ONNX model for the onnx detector")
+    parser.add_argument("--onnx-threads", type=int, default=0, help="ONNX Runtime intra-op threads")
+    parser.add_argument("--output", default=None, help="Also write the JSON report here")
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.synthetic, args.seed, args.corpus_dir)
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+        },
+        "corpus": {"images": len(corpus), "synthetic": args.synthetic, "seed": args.seed},
+        "detectors": {},
+    }
+
+    ctx = multiprocessing.get_context("spawn")
+    for name in [d.strip() for d in args.detectors.split(",") if d.strip()]:
+        if name not in DETECTORS:
+            parser.error(f"unknown detector '{name}'")
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_worker, args=(
+            queue, name, corpus, args.iterations, args.warmup, args.onnx_model, args.onnx_threads
+        ))
+        proc.start()
+        result = queue.get()
+        proc.join()
+        report["detectors"][name] = result
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output)
+
+
+if __name__ == "__main__":
+    main()
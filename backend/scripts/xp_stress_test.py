@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Concurrency stress test for the XP ledger.
+
+Many threads grant XP to the same few users at once, mixing single grants
+and batched grant_many calls. Afterwards every user's total_xp must equal
+the sum of the grants that committed, the XPTransaction rows must add up to
+the same amount, and the level columns must match the closed-form curve.
+
+Runs against DATABASE_URL (use PostgreSQL to exercise row locking) or a
+throwaway SQLite file by default. Exits non-zero on any lost update.
+
+Usage: python backend/scripts/xp_stress_test.py --threads 16 --grants 200
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+
+
+def build_app(database_url):
+    from flask import Flask
+    from backend import db
+
+    app = Flask("xp_stress_test")
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_url
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    if database_url.startswith("sqlite"):
+        # Writers queue on SQLite's database lock instead of failing fast
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"connect_args": {"timeout": 60}}
+    db.init_app(app)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress the XP ledger with concurrent grants")
+    parser.add_argument("--threads", type=int, default=16, help="Concurrent writers")
+    parser.add_argument("--grants", type=int, default=200, help="Grant calls per thread")
+    parser.add_argument("--users", type=int, default=3, help="Users sharing the contention")
+    parser.add_argument("--batch-every", type=int, default=5,
+                        help="Every Nth call is a grant_many batch across all users")
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        database_url = f"sqlite:///{tempfile.mkdtemp()}/xp_stress.db"
+    if database_url.startswith("postgres://"):
+        database_url = database_url.replace("postgres://", "postgresql://", 1)
+
+    app = build_app(database_url)
+
+    from backend import db
+    from backend.models import User, UserXP, XPTransaction
+    from backend.services.xp_ledger import XPGrant, level_progress, xp_ledger
+
+    with app.app_context():
+        db.create_all()
+        tag = f"stress-{int(time.time())}"
+        users = [User(name=f"{tag}-{i}", email=f"{tag}-{i}@example.com", password_hash="x")
+                 for i in range(args.users)]
+        db.session.add_all(users)
+        db.session.commit()
+        user_ids = [u.id for u in users]
+
+    committed = {user_id: 0 for user_id in user_ids}
+    failures = []
+    lock = threading.Lock()
+
+    def worker(index):
+        rng = random.Random(args.seed + index)
+        with app.app_context():
+            for call in range(args.grants):
+                if call % args.batch_every == 0:
+                    grants = [XPGrant(u, rng.randint(1, 50), "stress_batch") for u in user_ids]
+                else:
+                    grants = [XPGrant(rng.choice(user_ids), rng.randint(1, 50), "stress")]
+                try:
+                    xp_ledger.grant_many(grants)
+                except Exception as e:
+                    db.session.rollback()
+                    with lock:
+                        failures.append(str(e))
+                    continue
+                with lock:
+                    for g in grants:
+                        committed[g.user_id] += g.amount
+            db.session.remove()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    problems = []
+    with app.app_context():
+        for user_id in user_ids:
+            row = UserXP.query.filter_by(user_id=user_id).one()
+            ledger_sum = db.session.query(db.func.sum(XPTransaction.amount))\
+                .filter_by(user_id=user_id).scalar() or 0
+            expected = committed[user_id]
+            if row.total_xp != expected:
+                problems.append(f"user {user_id}: total_xp {row.total_xp} != committed {expected}")
+            if ledger_sum != expected:
+                problems.append(f"user {user_id}: transactions sum {ledger_sum} != committed {expected}")
+            progress = level_progress(row.total_xp)
+            if (row.current_level, row.xp_in_current_level) != (
+                    progress["current_level"], progress["xp_in_current_level"]):
+                problems.append(f"user {user_id}: level columns out of sync with total {row.total_xp}")
+
+    print(json.dumps({
+        "database": database_url.split("@")[-1],
+        "threads": args.threads,
+        "calls": args.threads * args.grants,
+        "failed_calls": len(failures),
+        "elapsed_s": round(elapsed, 2),
+        "calls_per_s": round(args.threads * args.grants / elapsed, 1) if elapsed else None,
+        "committed_xp": committed,
+        "problems": problems,
+    }, indent=2))
+    if failures:
+        print(f"First failure: {failures[0]}", file=sys.stderr)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+
+from .. import db
+from ..models import EmotionRollup, PerformanceLog, UserActivityCounter, UserActivityDay, UserQuest
+
+logger = logging.getLogger(__name__)
+
+# Counter names
+ATTEMPTS = "attempts"
+CORRECT = "correct"
+QUESTS_COMPLETED = "quests_completed"
+EMOTION_PREFIX = "emotion:"
+
+# Rows per upsert statement, kept well under SQLite's bound-parameter limit
+UPSERT_CHUNK = 500
+
+
+def attempt_accuracy(correct: bool, score: Optional[float]) -> float:
+    """Explicit scores win; otherwise a correct answer counts as 1.0"""
+    return float(score) if score is not None else float(bool(correct))
+
+
+def _upsert(model, keys: List[str], sums: List[str], values: List[Dict]):
+    """INSERT .. ON CONFLICT adding ``sums`` onto existing rows; read-modify-write elsewhere"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        table = model.__table__
+        for i in range(0, len(values), UPSERT_CHUNK):
+            stmt = insert(table).values(values[i:i + UPSERT_CHUNK])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=keys,
+                set_={column: table.c[column] + stmt.excluded[column] for column in sums},
+            )
+            db.session.execute(stmt)
+        return
+
+    for value in values:
+        row = model.query.filter_by(**{key: value[key] for key in keys}).first()
+        if row:
+            for column in sums:
+                setattr(row, column, (getattr(row, column) or 0) + value[column])
+        else:
+            db.session.add(model(**value))
+
+
+def increment(deltas: Iterable[Tuple[int, str, int]]) -> int:
+    """Add (user_id, counter name, delta) triples to the counters. The caller commits."""
+    totals: Dict[Tuple[int, str], int] = {}
+    for user_id, name, delta in deltas:
+        totals[(user_id, name)] = totals.get((user_id, name), 0) + int(delta)
+    values = [
+        {"user_id": user_id, "name": name, "value": delta}
+        for (user_id, name), delta in totals.items() if delta
+    ]
+    if values:
+        _upsert(UserActivityCounter, ["user_id", "name"], ["value"], values)
+    return len(values)
+
+
+def record_attempts(attempts: Iterable[Dict]) -> int:
+    """Count answered questions ({user_id, correct, score, timestamp}). The caller commits."""
+    counts: Dict[int, List[int]] = {}
+    days: Dict[Tuple[int, date], List[float]] = {}
+    for attempt in attempts:
+        user_id = attempt["user_id"]
+        user_counts = counts.setdefault(user_id, [0, 0])
+        user_counts[0] += 1
+        user_counts[1] += 1 if attempt["correct"] else 0
+        day = (attempt.get("timestamp") or datetime.utcnow()).date()
+        entry = days.setdefault((user_id, day), [0, 0.0])
+        entry[0] += 1
+        entry[1] += attempt_accuracy(attempt["correct"], attempt.get("score"))
+
+    if days:
+        _upsert(UserActivityDay, ["user_id", "day"], ["attempts", "accuracy_sum"], [
+            {"user_id": user_id, "day": day, "attempts": count, "accuracy_sum": accuracy_sum}
+            for (user_id, day), (count, accuracy_sum) in days.items()
+        ])
+    return increment(
+        (user_id, name, count)
+        for user_id, (attempted, correct) in counts.items()
+        for name, count in ((ATTEMPTS, attempted), (CORRECT, correct))
+    )
+
+
+def record_attempt(user_id: int, correct: bool, score: Optional[float] = None) -> int:
+    return record_attempts([{"user_id": user_id, "correct": correct, "score": score}])
+
+
+def record_emotions(rows: Iterable[Dict]) -> int:
+    """Count emotion readings ({user_id, emotion, ...}). The caller commits."""
+    return increment((row["user_id"], EMOTION_PREFIX + row["emotion"], 1) for row in rows)
+
+
+def record_quest_completed(user_id: int) -> int:
+    return increment([(user_id, QUESTS_COMPLETED, 1)])
+
+
+def get_counters(user_id: int) -> Dict[str, int]:
+    """All of a user's counters in one query"""
+    rows = db.session.query(UserActivityCounter.name, UserActivityCounter.value)\
+        .filter(UserActivityCounter.user_id == user_id)
+    return {name: int(value or 0) for name, value in rows}
+
+
+def get_emotion_counts(counters: Dict[str, int]) -> Dict[str, int]:
+    return {name[len(EMOTION_PREFIX):]: value for name, value in counters.items()
+            if name.startswith(EMOTION_PREFIX)}
+
+
+def get_accuracy(user_id: int, days: int) -> Tuple[int, float]:
+    """(attempts, mean accuracy) over the last ``days`` UTC days, today included"""
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    attempts, accuracy_sum = db.session.query(
+        db.func.sum(UserActivityDay.attempts), db.func.sum(UserActivityDay.accuracy_sum)
+    ).filter(UserActivityDay.user_id == user_id, UserActivityDay.day >= since).one()
+    attempts = int(attempts or 0)
+    return attempts, (accuracy_sum or 0.0) / attempts if attempts else 0.0
+
+
+def backfill_activity_counters(chunk_size: int = 5000) -> int:
+    """Build counters from existing logs when the counter table is empty"""
+    if UserActivityCounter.query.first() is not None:
+        return 0
+
+    logs = db.session.query(
+        PerformanceLog.user_id, PerformanceLog.correct, PerformanceLog.score, PerformanceLog.timestamp
+    ).yield_per(chunk_size)
+    written = record_attempts(
+        {"user_id": user_id, "correct": correct, "score": score, "timestamp": timestamp}
+        for user_id, correct, score, timestamp in logs
+    )
+
+    emotions = db.session.query(
+        EmotionRollup.user_id, EmotionRollup.emotion, db.func.sum(EmotionRollup.sample_count)
+    ).group_by(EmotionRollup.user_id, EmotionRollup.emotion)
+    written += increment((user_id, EMOTION_PREFIX + emotion, count or 0) for user_id, emotion, count in emotions)
+
+    quests = db.session.query(UserQuest.user_id, db.func.count(UserQuest.id))\
+        .filter(UserQuest.status == "completed").group_by(UserQuest.user_id)
+    written += increment((user_id, QUESTS_COMPLETED, count) for user_id, count in quests)
+
+    if written:
+        db.session.commit()
+        logger.info(f"Backfilled {written} activity counters")
+    return written
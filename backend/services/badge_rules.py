@@ -0,0 +1,254 @@
+from typing import Callable, Dict, Iterable, List, Optional
+import logging
+import threading
+
+from .. import db
+from ..models import Badge, UserActivityCounter, UserStreak, UserXP
+from .activity_counters import (
+    ATTEMPTS, EMOTION_PREFIX, QUESTS_COMPLETED, get_accuracy, get_emotion_counts
+)
+from .mastery_store import get_user_mastery
+
+logger = logging.getLogger(__name__)
+
+# Event types a badge check can be triggered by
+TRIGGERS = ("xp", "level", "streak", "mastery", "performance", "emotion", "quest")
+
+# Rolling window for accuracy requirements
+ACCURACY_WINDOW_DAYS = 30
+
+
+class UserStatsSnapshot:
+    """Per-user stats for one badge check, each facet loaded by a single query on first use"""
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self._facets: Dict[str, object] = {}
+
+    def __getitem__(self, facet: str):
+        if facet not in self._facets:
+            self._facets[facet] = _FACET_LOADERS[facet](self.user_id)
+        return self._facets[facet]
+
+    def discard(self, facet: str):
+        """Forget a facet so the next read reloads it"""
+        self._facets.pop(facet, None)
+
+
+def _load_xp(user_id: int) -> Dict:
+    row = db.session.query(UserXP.total_xp, UserXP.current_level).filter_by(user_id=user_id).first()
+    return {"total_xp": row[0] or 0, "level": row[1] or 1} if row else {"total_xp": 0, "level": 1}
+
+
+def _load_streaks(user_id: int) -> Dict[str, int]:
+    rows = db.session.query(UserStreak.streak_type, UserStreak.longest_streak).filter_by(user_id=user_id)
+    return {streak_type: longest or 0 for streak_type, longest in rows}
+
+
+def _load_mastery(user_id: int) -> Dict[str, float]:
+    return {topic: state.mastery_score for topic, state in get_user_mastery(user_id).items()}
+
+
+def _load_performance(user_id: int) -> Dict:
+    total = db.session.query(UserActivityCounter.value)\
+        .filter_by(user_id=user_id, name=ATTEMPTS).scalar()
+    window_attempts, window_accuracy = get_accuracy(user_id, ACCURACY_WINDOW_DAYS)
+    return {
+        "total_attempts": total or 0,
+        "window_attempts": window_attempts,
+        "window_accuracy": window_accuracy,
+    }
+
+
+def _load_emotions(user_id: int) -> Dict[str, int]:
+    rows = db.session.query(UserActivityCounter.name, UserActivityCounter.value).filter(
+        UserActivityCounter.user_id == user_id, UserActivityCounter.name.startswith(EMOTION_PREFIX)
+    )
+    return get_emotion_counts(dict(rows))
+
+
+def _load_quests(user_id: int) -> int:
+    return db.session.query(UserActivityCounter.value)\
+        .filter_by(user_id=user_id, name=QUESTS_COMPLETED).scalar() or 0
+
+
+_FACET_LOADERS = {
+    "xp": _load_xp,
+    "streaks": _load_streaks,
+    "mastery": _load_mastery,
+    "performance": _load_performance,
+    "emotions": _load_emotions,
+    "quests": _load_quests,
+}
+
+
+class BadgeRule:
+    """A badge's requirements compiled to predicates over a UserStatsSnapshot"""
+
+    def __init__(self, badge_id: int, name: str):
+        self.badge_id = badge_id
+        self.name = name
+        self.triggers = set()
+        self.predicates: List[Callable[[UserStatsSnapshot], bool]] = []
+
+    def add(self, trigger: str, predicate: Callable[[UserStatsSnapshot], bool]):
+        self.triggers.add(trigger)
+        self.predicates.append(predicate)
+
+    def matches(self, stats: UserStatsSnapshot) -> bool:
+        return all(predicate(stats) for predicate in self.predicates)
+
+
+def _mastery_predicate(requirements: Dict) -> Callable[[UserStatsSnapshot], bool]:
+    def check(stats):
+        scores = stats["mastery"]
+        for topic, minimum in requirements.items():
+            if topic in ("any_topic", "perfect_mastery"):
+                if not any(score >= minimum for score in scores.values()):
+                    return False
+            elif topic == "multiple_topics":
+                if sum(1 for score in scores.values() if score >= minimum) < 3:
+                    return False
+            elif scores.get(topic, 0.0) < minimum:
+                return False
+        return True
+    return check
+
+
+def _accuracy_predicate(min_accuracy: float, min_attempts: int) -> Callable[[UserStatsSnapshot], bool]:
+    def check(stats):
+        performance = stats["performance"]
+        return (performance["window_attempts"] >= min_attempts
+                and performance["window_accuracy"] >= min_accuracy)
+    return check
+
+
+def _normalised_requirements(badge: Badge) -> Dict:
+    requirements = dict(badge.requirements or {})
+    # Badge seeds put accuracy requirements at the top level
+    if "min_accuracy" in requirements:
+        performance = dict(requirements.get("performance_requirements") or {})
+        performance["min_accuracy"] = requirements.pop("min_accuracy")
+        if "min_attempts" in requirements:
+            performance["min_attempts"] = requirements.pop("min_attempts")
+        requirements["performance_requirements"] = performance
+    return requirements
+
+
+def compile_badge(badge: Badge) -> Optional[BadgeRule]:
+    """
+    Compile a badge's requirements JSON into a BadgeRule
+
+    Returns None for badges without requirements or with requirement kinds
+    that cannot be evaluated from stats (e.g. "early_bird"); those are only
+    awarded explicitly, never by the rule engine.
+    """
+    requirements = _normalised_requirements(badge)
+    if not requirements:
+        return None
+
+    rule = BadgeRule(badge.id, badge.name)
+    for kind, value in requirements.items():
+        if kind == "min_xp":
+            rule.add("xp", lambda s, v=value: s["xp"]["total_xp"] >= v)
+        elif kind == "min_level":
+            rule.add("level", lambda s, v=value: s["xp"]["level"] >= v)
+        elif kind == "streak_requirements":
+            rule.add("streak", lambda s, v=value: all(
+                s["streaks"].get(streak_type, 0) >= minimum for streak_type, minimum in v.items()
+            ))
+        elif kind == "mastery_requirements":
+            rule.add("mastery", _mastery_predicate(value))
+        elif kind == "performance_requirements":
+            if "min_accuracy" in value:
+                rule.add("performance", _accuracy_predicate(value["min_accuracy"], value.get("min_attempts", 10)))
+            else:
+                rule.add("performance", lambda s, v=value.get("min_attempts", 1):
+                         s["performance"]["total_attempts"] >= v)
+        elif kind == "min_attempts":
+            rule.add("performance", lambda s, v=value: s["performance"]["total_attempts"] >= v)
+        elif kind == "emotion_count":
+            rule.add("emotion", lambda s, v=value: all(
+                s["emotions"].get(emotion, 0) >= count for emotion, count in v.items()
+            ))
+        elif kind == "quests_completed":
+            rule.add("quest", lambda s, v=value: s["quests"] >= v)
+        else:
+            logger.debug(f"Badge '{badge.name}' has unsupported requirement '{kind}'; not rule-evaluated")
+            return None
+
+    return rule
+
+
+def requirement_progress(badge: Badge, stats: UserStatsSnapshot) -> List[Dict]:
+    """
+    "Current of target" for each countable requirement, read from the snapshot
+
+    Returns:
+        list: [{requirement, current, target}]; mastery and unsupported kinds are skipped
+    """
+    progress = []
+
+    def add(requirement, current, target):
+        progress.append({"requirement": requirement, "current": current, "target": target})
+
+    for kind, value in _normalised_requirements(badge).items():
+        if kind == "min_xp":
+            add(kind, stats["xp"]["total_xp"], value)
+        elif kind == "min_level":
+            add(kind, stats["xp"]["level"], value)
+        elif kind == "streak_requirements":
+            for streak_type, minimum in value.items():
+                add(f"streak:{streak_type}", stats["streaks"].get(streak_type, 0), minimum)
+        elif kind == "performance_requirements":
+            if "min_accuracy" in value:
+                add("attempts_in_window", stats["performance"]["window_attempts"], value.get("min_attempts", 10))
+                add("accuracy", round(stats["performance"]["window_accuracy"], 3), value["min_accuracy"])
+            else:
+                add("attempts", stats["performance"]["total_attempts"], value.get("min_attempts", 1))
+        elif kind == "min_attempts":
+            add("attempts", stats["performance"]["total_attempts"], value)
+        elif kind == "emotion_count":
+            for emotion, count in value.items():
+                add(f"emotion:{emotion}", stats["emotions"].get(emotion, 0), count)
+        elif kind == "quests_completed":
+            add(kind, stats["quests"], value)
+    return progress
+
+
+class BadgeRuleEngine:
+    """Compiled badge rules indexed by trigger type; built once per process"""
+
+    def __init__(self):
+        self._by_trigger: Optional[Dict[str, List[BadgeRule]]] = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Drop the compiled rules, e.g. after badges are added or edited"""
+        with self._lock:
+            self._by_trigger = None
+
+    def _index(self) -> Dict[str, List[BadgeRule]]:
+        with self._lock:
+            if self._by_trigger is None:
+                by_trigger = {trigger: [] for trigger in TRIGGERS}
+                for badge in Badge.query.all():
+                    rule = compile_badge(badge)
+                    if rule is None:
+                        continue
+                    for trigger in rule.triggers:
+                        by_trigger[trigger].append(rule)
+                self._by_trigger = by_trigger
+            return self._by_trigger
+
+    def rules_for(self, triggers: Optional[Iterable[str]] = None) -> List[BadgeRule]:
+        """Rules with a predicate on any of the given triggers (all rules when None)"""
+        index = self._index()
+        rules = {}
+        for trigger in (TRIGGERS if triggers is None else triggers):
+            for rule in index.get(trigger, []):
+                rules[rule.badge_id] = rule
+        return list(rules.values())
+
+
+badge_rules = BadgeRuleEngine()
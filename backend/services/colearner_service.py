@@ -5,6 +5,7 @@ from typing import Optional, Dict, Any
 
 from .. import db, socketio
 from ..models import CoLearnerProfile, CoLearnerDialogLog, CoLearnerActivity
+from .xp_ledger import xp_ledger
 
 PRESETS_PATH = os.path.join(os.path.dirname(__file__), 'persona_presets.json')
 
@@ -47,12 +48,10 @@ def log_dialog(user_id: int, direction: str, text: str, metadata: Optional[dict]
 
 def add_xp(user_id: int, amount: int, reason: str = "activity"):
     profile = get_or_create_profile(user_id)
-    old_level = profile.level
-    profile.xp = (profile.xp or 0) + int(amount)
-    
-    # Calculate new level (every 100 XP)
-    new_level = (profile.xp // 100) + 1
-    profile.level = new_level
+    # Atomic increment; the level (every 100 XP) is derived from the new total
+    result = xp_ledger.grant_colearner(user_id, amount, commit=False)
+    old_level = result["old_level"]
+    new_level = result["level"]
     
     # Check for trait unlocks
     new_traits = []
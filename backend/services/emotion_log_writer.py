@@ -0,0 +1,227 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+import atexit
+import logging
+import threading
+
+from flask import current_app
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+from .. import db, socketio
+from ..models import EmotionLog
+from .activity_counters import record_emotions
+from .emotion_rollup import record_rollups
+from .gamification_service import GamificationService
+
+logger = logging.getLogger(__name__)
+
+
+class EmotionLogWriter:
+    """Buffer EmotionLog rows and write them with one bulk INSERT per flush.
+
+    Rows are flushed every ``flush_interval_ms`` or as soon as ``max_batch_size``
+    rows are queued, whichever comes first. The per-minute EmotionRollup buckets
+    are updated in the same transaction, and each flush emits one coalesced
+    ``emotion_update`` per user carrying that user's latest reading. A batch the
+    database rejects is bisected so only the offending rows are discarded.
+    """
+
+    def __init__(self, flush_interval_ms: int = 500, max_batch_size: int = 200, max_pending: int = 20000):
+        self.flush_interval_ms = flush_interval_ms
+        self.max_batch_size = max_batch_size
+        self.max_pending = max_pending
+        self.app = None
+        self._buffer: List[Dict] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, app):
+        """Start the background flush loop for the given app"""
+        if self.running:
+            return
+
+        self.app = app
+        self.flush_interval_ms = app.config.get("EMOTION_LOG_FLUSH_INTERVAL_MS", self.flush_interval_ms)
+        self.max_batch_size = app.config.get("EMOTION_LOG_MAX_BATCH", self.max_batch_size)
+        self.max_pending = app.config.get("EMOTION_LOG_MAX_PENDING", self.max_pending)
+
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="emotion-log-writer", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"Emotion log writer started (interval={self.flush_interval_ms}ms, batch={self.max_batch_size})"
+        )
+
+        # Drain whatever is still buffered when the process exits
+        atexit.register(self.shutdown)
+
+    def shutdown(self):
+        """Stop the flush loop and write any buffered rows"""
+        if not self.running:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        self._thread.join(timeout=max(self.flush_interval_ms / 1000.0, 1.0) * 5)
+        self.flush()
+        logger.info("Emotion log writer stopped")
+
+    def submit(self, user_id: int, emotion: str, confidence: float,
+               timestamp: Optional[datetime] = None) -> datetime:
+        """Queue an emotion reading; returns the timestamp it will be stored with"""
+        timestamp = timestamp or datetime.utcnow()
+        with self._lock:
+            self._buffer.append({
+                "user_id": user_id,
+                "emotion": emotion,
+                "confidence": confidence,
+                "timestamp": timestamp,
+            })
+            batch_full = len(self._buffer) >= self.max_batch_size
+
+        if not self.running:
+            # No background loop (scripts, shell) - write through immediately
+            self.flush()
+        elif batch_full:
+            self._wakeup.set()
+
+        return timestamp
+
+    def write_many(self, user_id: int, readings: List[Dict]) -> int:
+        """Write many readings ({"emotion", "confidence", "timestamp"}) for one user in their own transaction
+
+        Bypasses the buffer so the caller knows the rows are stored; raises if the write fails.
+        Must be called inside an app context.
+        """
+        rows = [{
+            "user_id": user_id,
+            "emotion": reading["emotion"],
+            "confidence": reading["confidence"],
+            "timestamp": reading.get("timestamp") or datetime.utcnow(),
+        } for reading in readings]
+        if not rows:
+            return 0
+        try:
+            self._write(rows)
+        except Exception:
+            db.session.rollback()
+            raise
+
+        self._award_badges({user_id})
+        self._emit_updates(rows)
+        return len(rows)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._buffer)
+
+    def flush(self) -> int:
+        """Write all buffered rows in a single INSERT; returns the number written"""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._buffer = self._buffer, []
+            if not rows:
+                return 0
+
+            app = self.app or current_app._get_current_object()
+            with app.app_context():
+                written = self._write_isolating(rows)
+                if written:
+                    self._award_badges({row["user_id"] for row in written})
+
+            self._emit_updates(written)
+            return len(written)
+
+    def _write(self, rows: List[Dict]):
+        db.session.execute(EmotionLog.__table__.insert(), rows)
+        record_rollups(rows)
+        record_emotions(rows)
+        db.session.commit()
+
+    def _write_isolating(self, rows: List[Dict]) -> List[Dict]:
+        """Write a batch, bisecting on failure so rows the database rejects don't take the rest with them
+
+        Rejected single rows are logged and set aside. If the database is unreachable the
+        unwritten rows are requeued for the next flush. Returns the rows that were written.
+        """
+        written: List[Dict] = []
+        pending = [rows]
+        while pending:
+            chunk = pending.pop()
+            try:
+                self._write(chunk)
+                written.extend(chunk)
+            except (OperationalError, InterfaceError) as e:
+                db.session.rollback()
+                self._requeue(chunk + [row for rest in reversed(pending) for row in rest], e)
+                break
+            except Exception as e:
+                db.session.rollback()
+                if len(chunk) == 1:
+                    logger.error(f"Discarding emotion log rejected by the database {chunk[0]}: {e}")
+                else:
+                    middle = len(chunk) // 2
+                    pending.extend([chunk[middle:], chunk[:middle]])
+        return written
+
+    def _requeue(self, rows: List[Dict], error: Exception):
+        """Put unwritten rows back at the front of the queue, keeping at most ``max_pending`` buffered"""
+        with self._lock:
+            self._buffer[:0] = rows
+            dropped = max(len(self._buffer) - self.max_pending, 0)
+            if dropped:
+                del self._buffer[:dropped]
+        if dropped:
+            logger.error(f"Error flushing {len(rows)} emotion logs, buffer full so dropped the oldest {dropped}: {error}")
+        else:
+            logger.error(f"Error flushing {len(rows)} emotion logs, retrying on the next flush: {error}")
+
+    def _award_badges(self, user_ids):
+        """Evaluate emotion-count badges for the users whose readings were just written"""
+        gamification = GamificationService()
+        for user_id in user_ids:
+            try:
+                for badge in gamification.check_and_award_badges(user_id, triggers=("emotion",)):
+                    socketio.emit("badge_earned", {"user_id": user_id, "badge": badge}, room=str(user_id))
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error checking emotion badges for user {user_id}: {e}")
+
+    def _emit_updates(self, rows: List[Dict]):
+        """Emit one emotion_update per user with their most recent reading"""
+        latest: Dict[int, Dict] = {}
+        samples: Dict[int, int] = {}
+        for row in rows:
+            latest[row["user_id"]] = row
+            samples[row["user_id"]] = samples.get(row["user_id"], 0) + 1
+
+        for user_id, row in latest.items():
+            try:
+                socketio.emit("emotion_update", {
+                    "user_id": user_id,
+                    "emotion": row["emotion"],
+                    "confidence": row["confidence"],
+                    "timestamp": row["timestamp"].isoformat(),
+                    "samples": samples[user_id],
+                })
+            except Exception as e:
+                logger.error(f"Error emitting emotion update for user {user_id}: {e}")
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval_ms / 1000.0)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Emotion log writer loop error: {e}")
+
+
+# Global writer instance
+emotion_log_writer = EmotionLogWriter()
@@ -0,0 +1,121 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Tuple
+import logging
+
+from .. import db
+from ..models import EmotionLog, EmotionRollup
+
+logger = logging.getLogger(__name__)
+
+# Rows per upsert statement, kept well under SQLite's bound-parameter limit
+UPSERT_CHUNK = 500
+
+
+def minute_bucket(timestamp: datetime) -> datetime:
+    return timestamp.replace(second=0, microsecond=0)
+
+
+def _aggregate(rows: Iterable[Dict]) -> Dict[Tuple[int, datetime, str], List[float]]:
+    """Fold raw emotion rows into {(user_id, bucket, emotion): [count, confidence_sum]}"""
+    buckets: Dict[Tuple[int, datetime, str], List[float]] = {}
+    for row in rows:
+        key = (row["user_id"], minute_bucket(row["timestamp"]), row["emotion"])
+        entry = buckets.setdefault(key, [0, 0.0])
+        entry[0] += 1
+        entry[1] += row["confidence"]
+    return buckets
+
+
+def _upsert(values: List[Dict]) -> bool:
+    """Single-statement INSERT .. ON CONFLICT for dialects that support it"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return False
+
+    table = EmotionRollup.__table__
+    stmt = insert(table).values(values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "bucket", "emotion"],
+        set_={
+            "sample_count": table.c.sample_count + stmt.excluded.sample_count,
+            "confidence_sum": table.c.confidence_sum + stmt.excluded.confidence_sum,
+        },
+    )
+    db.session.execute(stmt)
+    return True
+
+
+def record_rollups(rows: Iterable[Dict]) -> int:
+    """Add raw emotion rows to their minute buckets. The caller commits."""
+    buckets = _aggregate(rows)
+    if not buckets:
+        return 0
+
+    values = [
+        {"user_id": user_id, "bucket": bucket, "emotion": emotion,
+         "sample_count": int(count), "confidence_sum": confidence_sum}
+        for (user_id, bucket, emotion), (count, confidence_sum) in buckets.items()
+    ]
+    if all(_upsert(values[i:i + UPSERT_CHUNK]) for i in range(0, len(values), UPSERT_CHUNK)):
+        return len(values)
+
+    # Generic fallback: read-modify-write per bucket
+    for value in values:
+        rollup = EmotionRollup.query.filter_by(
+            user_id=value["user_id"], bucket=value["bucket"], emotion=value["emotion"]
+        ).first()
+        if rollup:
+            rollup.sample_count += value["sample_count"]
+            rollup.confidence_sum += value["confidence_sum"]
+        else:
+            db.session.add(EmotionRollup(**value))
+    return len(values)
+
+
+def get_emotion_totals(user_id: int, since: datetime) -> Dict[str, Dict]:
+    """Per-emotion count and confidence sum since the given time"""
+    rows = db.session.query(
+        EmotionRollup.emotion,
+        db.func.sum(EmotionRollup.sample_count),
+        db.func.sum(EmotionRollup.confidence_sum),
+    ).filter(
+        EmotionRollup.user_id == user_id,
+        EmotionRollup.bucket >= minute_bucket(since)
+    ).group_by(EmotionRollup.emotion).all()
+
+    return {
+        emotion: {"count": int(count or 0), "confidence_sum": float(confidence_sum or 0.0)}
+        for emotion, count, confidence_sum in rows
+    }
+
+
+def get_emotion_buckets(user_id: int, since: datetime, newest_first: bool = True) -> List[EmotionRollup]:
+    """Minute buckets since the given time, ordered by bucket"""
+    order = EmotionRollup.bucket.desc() if newest_first else EmotionRollup.bucket.asc()
+    return EmotionRollup.query.filter(
+        EmotionRollup.user_id == user_id,
+        EmotionRollup.bucket >= minute_bucket(since)
+    ).order_by(order).all()
+
+
+def backfill_emotion_rollups(chunk_size: int = 5000) -> int:
+    """Build rollups from existing EmotionLog rows when the rollup table is empty"""
+    if EmotionRollup.query.first() is not None or EmotionLog.query.first() is None:
+        return 0
+
+    logs = db.session.query(
+        EmotionLog.user_id, EmotionLog.timestamp, EmotionLog.emotion, EmotionLog.confidence
+    ).yield_per(chunk_size)
+
+    written = record_rollups(
+        {"user_id": user_id, "timestamp": timestamp, "emotion": emotion, "confidence": confidence}
+        for user_id, timestamp, emotion, confidence in logs
+        if timestamp is not None
+    )
+    db.session.commit()
+    logger.info(f"Backfilled {written} emotion rollup buckets")
+    return written
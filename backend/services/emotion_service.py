@@ -1,11 +1,16 @@
 import base64
 import cv2
 import numpy as np
-from typing import Optional, Tuple
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
 import sys
 import os
+import threading
+import time
 
-face_emotion_path = os.path.join(os.path.dirname(__file__), '..', '..', 'Face-Emotion-Detector')
+from flask import current_app, has_app_context
+
+face_emotion_path = os.path.join(os.path.dirname(__file__), '..', 'Face-Emotion-Detector')
 if face_emotion_path not in sys.path:
     sys.path.append(face_emotion_path)
 
@@ -14,96 +19,274 @@ if face_emotion_backend_path not in sys.path:
     sys.path.append(face_emotion_backend_path)
 
 try:
-    from backend.models.emotion_detector import EmotionDetector
+    from backend.models.emotion_detector import EmotionDetector, load_keras_emotion_model
     print("✅ Real emotion detector imported successfully")
 except ImportError as e:
     print(f"❌ Failed to import real emotion detector: {e}")
     try:
-        from models.emotion_detector import EmotionDetector
+        from models.emotion_detector import EmotionDetector, load_keras_emotion_model
         print("✅ Real emotion detector imported successfully (alternative path)")
     except ImportError as e2:
         print(f"❌ Failed to import real emotion detector (alternative path): {e2}")
+        EmotionDetector = None
+        load_keras_emotion_model = None
+
+try:
+    from models.onnx_emotion_detector import EMOTION_LABELS, OnnxEmotionDetector, preprocess_face
+except ImportError as e:
+    print(f"❌ Failed to import ONNX emotion detector: {e}")
+    OnnxEmotionDetector = None
+    EMOTION_LABELS = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
+    preprocess_face = None
+
+try:
+    from deepface import DeepFace
+except ImportError as e:
+    print(f"❌ Failed to import DeepFace: {e}")
+    DeepFace = None
+
+
+class DeepFaceEmotionDetector:
+    """Direct DeepFace detector used when the Face-Emotion-Detector package is unavailable"""
+
+    def __init__(self):
+        self.model_name = 'emotion'
+        self._emotion_model = None
+        print(f"Initialized DeepFace with {self.model_name} model")
+
+    def classify_faces(self, faces):
+        """Classify already-cropped faces in one batched forward pass; (len(faces), 7) probabilities"""
+        if len(faces) == 0:
+            return np.zeros((0, len(EMOTION_LABELS)), dtype=np.float32)
+        if self._emotion_model is None:
+            if load_keras_emotion_model is None:
+                raise ImportError("Face-Emotion-Detector's emotion model loader is unavailable")
+            self._emotion_model = load_keras_emotion_model()
+        batch = np.stack([preprocess_face(face) for face in faces])
+        return np.asarray(self._emotion_model(batch, training=False))
+
+    def detect_emotion_from_image_data(self, img, show_result=False):
         try:
-            from deepface import DeepFace
-            print("✅ DeepFace imported successfully, creating direct detector")
-            
-            class EmotionDetector:
-                def __init__(self):
-                    self.model_name = 'emotion'
-                    print(f"Initialized DeepFace with {self.model_name} model")
-                
-                def detect_emotion_from_image_data(self, img, show_result=False):
-                    try:
-                        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                        result = DeepFace.analyze(
-                            img_rgb, 
-                            actions=['emotion'],
-                            enforce_detection=False,
-                            silent=True
-                        )
-                        
-                        if result and len(result) > 0:
-                            emotions = result[0]['emotion']
-                            dominant_emotion = result[0]['dominant_emotion']
-                            
-                            emotion_scores = {}
-                            for emotion, score in emotions.items():
-                                emotion_scores[emotion] = score / 100.0
-                            
-                            return [{'emotion': emotion_scores, 'dominant_emotion': dominant_emotion}]
-                        else:
-                            return None
-                    except Exception as e:
-                        print(f"DeepFace analysis error: {e}")
-                        return None
-            
-            print("✅ Direct DeepFace emotion detector created")
-        except ImportError as e3:
-            print(f"❌ Failed to import DeepFace: {e3}")
-            print("Using mock detector instead")
-    # Fallback: create a simple mock detector
-    class EmotionDetector:
-        def __init__(self):
-            pass
-        def detect_emotion_from_image_data(self, img, show_result=False):
-            import random
-            
-            height, width = img.shape[:2]
-            face_size_score = min(height * width / (640 * 480), 1.0)
-            
-            if face_size_score > 0.3:
-                emotions = ['happy', 'surprise', 'neutral', 'sad', 'angry', 'fear', 'disgust']
-                weights = [0.4, 0.2, 0.2, 0.1, 0.05, 0.03, 0.02]
+            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            result = DeepFace.analyze(
+                img_rgb,
+                actions=['emotion'],
+                enforce_detection=False,
+                silent=True
+            )
+
+            if result and len(result) > 0:
+                emotions = result[0]['emotion']
+                dominant_emotion = result[0]['dominant_emotion']
+
+                emotion_scores = {}
+                for emotion, score in emotions.items():
+                    emotion_scores[emotion] = score / 100.0
+
+                return [{'emotion': emotion_scores, 'dominant_emotion': dominant_emotion}]
             else:
-                emotions = ['happy', 'sad', 'angry', 'fear', 'surprise', 'disgust', 'neutral']
-                weights = [0.2, 0.2, 0.2, 0.15, 0.15, 0.05, 0.05]
-            
-            dominant = random.choices(emotions, weights=weights)[0]
-            
-            emotion_scores = {}
-            for emotion in emotions:
-                if emotion == dominant:
-                    emotion_scores[emotion] = random.uniform(0.7, 0.95)
-                else:
-                    emotion_scores[emotion] = random.uniform(0.01, 0.3)
-            
-            return [{'emotion': emotion_scores, 'dominant_emotion': dominant}]
+                return None
+        except Exception as e:
+            print(f"DeepFace analysis error: {e}")
+            return None
 
 
-class EmotionDetectionService:
+class MockEmotionDetector:
+    """Randomised detector for environments without any emotion model"""
+
     def __init__(self):
-        self.detector = EmotionDetector()
+        pass
+
+    def classify_faces(self, faces):
+        """Random probabilities per face crop, in EMOTION_LABELS order"""
+        probs = np.zeros((len(faces), len(EMOTION_LABELS)), dtype=np.float32)
+        for row, face in zip(probs, faces):
+            scores = self.detect_emotion_from_image_data(face)[0]['emotion']
+            row[:] = [scores[label] for label in EMOTION_LABELS]
+            row /= row.sum()
+        return probs
+
+    def detect_emotion_from_image_data(self, img, show_result=False):
+        import random
+
+        height, width = img.shape[:2]
+        face_size_score = min(height * width / (640 * 480), 1.0)
+
+        if face_size_score > 0.3:
+            emotions = ['happy', 'surprise', 'neutral', 'sad', 'angry', 'fear', 'disgust']
+            weights = [0.4, 0.2, 0.2, 0.1, 0.05, 0.03, 0.02]
+        else:
+            emotions = ['happy', 'sad', 'angry', 'fear', 'surprise', 'disgust', 'neutral']
+            weights = [0.2, 0.2, 0.2, 0.15, 0.15, 0.05, 0.05]
+
+        dominant = random.choices(emotions, weights=weights)[0]
+
+        emotion_scores = {}
+        for emotion in emotions:
+            if emotion == dominant:
+                emotion_scores[emotion] = random.uniform(0.7, 0.95)
+            else:
+                emotion_scores[emotion] = random.uniform(0.01, 0.3)
+
+        return [{'emotion': emotion_scores, 'dominant_emotion': dominant}]
+
+
+DETECTOR_BACKENDS = ("auto", "deepface", "onnx", "mock")
+
+
+def create_detector(backend: str = "auto", onnx_model_path: Optional[str] = None,
+                    onnx_threads: Optional[int] = None):
+    """
+    Build the emotion detector for the configured backend
+
+    "auto" keeps the historical preference: Face-Emotion-Detector's EmotionDetector,
+    then direct DeepFace, then the mock detector.
+    """
+    backend = (backend or "auto").lower()
+    if backend not in DETECTOR_BACKENDS:
+        raise ValueError(f"Unknown emotion detector backend '{backend}', expected one of {DETECTOR_BACKENDS}")
+
+    if backend == "onnx":
+        if OnnxEmotionDetector is None:
+            raise ImportError("ONNX emotion detector is unavailable")
+        print("✅ Using ONNX Runtime emotion detector")
+        return OnnxEmotionDetector(onnx_model_path, intra_op_threads=onnx_threads)
+
+    if backend == "mock":
+        print("Using mock detector")
+        return MockEmotionDetector()
+
+    if EmotionDetector is not None:
+        return EmotionDetector()
+
+    if DeepFace is not None:
+        print("✅ Direct DeepFace emotion detector created")
+        return DeepFaceEmotionDetector()
+
+    if backend == "deepface":
+        raise ImportError("DeepFace emotion detector is unavailable")
+
+    print("Using mock detector instead")
+    return MockEmotionDetector()
+
+
+def perceptual_hash(image_bgr: np.ndarray) -> int:
+    """64-bit difference hash: stable under JPEG noise and small lighting changes"""
+    gray = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY) if image_bgr.ndim == 3 else image_bgr
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+class FrameResultCache:
+    """
+    Short-lived per-user cache of emotion results keyed by perceptual hash
+
+    A frame hits when its hash is within ``max_distance`` bits of a cached frame
+    for the same user that is younger than ``ttl_seconds``.
+    """
+
+    def __init__(self, ttl_seconds: float = 5.0, max_distance: int = 4,
+                 entries_per_user: int = 8, max_users: int = 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self.entries_per_user = entries_per_user
+        self.max_users = max_users
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, phash: int) -> Optional[Tuple[str, float]]:
+        now = time.monotonic()
+        with self._lock:
+            entries = self._entries.get(key)
+            if entries:
+                entries[:] = [e for e in entries if e[2] > now]
+                for cached_hash, result, _ in entries:
+                    if bin(cached_hash ^ phash).count("1") <= self.max_distance:
+                        self.hits += 1
+                        return result
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, phash: int, result: Tuple[str, float]):
+        with self._lock:
+            entries = self._entries.setdefault(key, [])
+            self._entries.move_to_end(key)
+            entries.append((phash, result, time.monotonic() + self.ttl_seconds))
+            del entries[:-self.entries_per_user]
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "users": len(self._entries),
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+class EmotionDetectionService:
+    def __init__(self, backend: Optional[str] = None, onnx_model_path: Optional[str] = None,
+                 onnx_threads: Optional[int] = None, detector=None, cache: Optional[FrameResultCache] = None):
+        self.backend = backend
+        self.onnx_model_path = onnx_model_path
+        self.onnx_threads = onnx_threads
+        self._detector = detector
+        self._cache = cache
+
+    @property
+    def detector(self):
+        # Built on first use so the app config (EMOTION_DETECTOR_BACKEND, ...) is available
+        if self._detector is None:
+            config = current_app.config if has_app_context() else {}
+            self._detector = create_detector(
+                self.backend or config.get("EMOTION_DETECTOR_BACKEND", "auto"),
+                onnx_model_path=self.onnx_model_path or config.get("EMOTION_ONNX_MODEL_PATH"),
+                onnx_threads=self.onnx_threads or config.get("EMOTION_ONNX_THREADS"),
+            )
+        return self._detector
+
+    @property
+    def cache(self) -> FrameResultCache:
+        if self._cache is None:
+            config = current_app.config if has_app_context() else {}
+            self._cache = FrameResultCache(
+                ttl_seconds=config.get("EMOTION_CACHE_TTL_SECONDS", 5.0),
+                max_distance=config.get("EMOTION_CACHE_MAX_DISTANCE", 4),
+            )
+        return self._cache
+
+    def analyze_ndarray(self, image_bgr: np.ndarray,
+                        cache_key: Optional[Hashable] = None) -> Optional[Tuple[str, float]]:
+        """Classify a frame; with a cache_key, near-identical recent frames reuse the last result"""
+        use_cache = cache_key is not None and self.cache.ttl_seconds > 0
+        if use_cache:
+            phash = perceptual_hash(image_bgr)
+            cached = self.cache.get(cache_key, phash)
+            if cached is not None:
+                return cached
 
-    def analyze_ndarray(self, image_bgr: np.ndarray) -> Optional[Tuple[str, float]]:
         result = self.detector.detect_emotion_from_image_data(image_bgr, show_result=False)
         if not result:
             return None
         emotions = result[0]["emotion"]
         dominant = result[0]["dominant_emotion"]
         confidence = float(emotions.get(dominant, 0.0))
+        # DeepFace-style detectors report percentages; EmotionLog stores 0..1
+        if confidence > 1.0:
+            confidence /= 100.0
+
+        if use_cache:
+            self.cache.put(cache_key, phash, (dominant, confidence))
         return dominant, confidence
 
-    def analyze_base64_image(self, data_url_or_b64: str) -> Optional[Tuple[str, float]]:
+    def analyze_base64_image(self, data_url_or_b64: str,
+                             cache_key: Optional[Hashable] = None) -> Optional[Tuple[str, float]]:
         if "," in data_url_or_b64:
             data_url_or_b64 = data_url_or_b64.split(",", 1)[1]
         try:
@@ -112,8 +295,6 @@ class EmotionDetectionService:
             img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
             if img is None:
                 return None
-            return self.analyze_ndarray(img)
+            return self.analyze_ndarray(img, cache_key=cache_key)
         except Exception:
             return None
-
-
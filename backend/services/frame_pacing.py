@@ -0,0 +1,127 @@
+from contextlib import contextmanager
+from typing import Dict, Optional
+import math
+import random
+import threading
+import time
+
+
+# Multipliers applied for the client-reported session state; None pins to the maximum
+SESSION_STATE_FACTORS = {
+    "active": 1.0,
+    "idle": 2.0,
+    "hidden": None,
+}
+
+
+class FramePacer:
+    """Tell emotion capture clients when to send their next frame.
+
+    The hint grows while results are stable (same dominant emotion at or above
+    ``stable_confidence``), snaps back to the minimum when the emotion changes,
+    and is stretched once inference takes more than half of ``inference_budget``
+    (the share of recent wall time the process may spend classifying frames),
+    so clients slow down smoothly before the server saturates. A small jitter
+    keeps clients that started together from staying in lock-step.
+
+    Load is measured as time spent in inference rather than concurrent requests:
+    under a single eventlet worker inference blocks the hub, so at most one runs
+    at a time however overloaded the process is.
+    """
+
+    def __init__(self, min_interval_ms: int = 5000, max_interval_ms: int = 30000,
+                 stable_confidence: float = 0.6, inference_budget: float = 0.8,
+                 load_window_s: float = 10.0):
+        self.min_interval_ms = min_interval_ms
+        self.max_interval_ms = max_interval_ms
+        self.stable_confidence = stable_confidence
+        self.inference_budget = inference_budget
+        self.load_window_s = load_window_s
+        # Exponentially decayed seconds spent in inference, as of _busy_at
+        self._busy_s = 0.0
+        self._busy_at = time.monotonic()
+        self._states: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, app):
+        """Read the pacing limits from the app config"""
+        self.min_interval_ms = app.config.get("EMOTION_FRAME_MIN_INTERVAL_MS", self.min_interval_ms)
+        self.max_interval_ms = app.config.get("EMOTION_FRAME_MAX_INTERVAL_MS", self.max_interval_ms)
+        self.stable_confidence = app.config.get("EMOTION_FRAME_STABLE_CONFIDENCE", self.stable_confidence)
+        self.inference_budget = app.config.get("EMOTION_INFERENCE_BUDGET", self.inference_budget)
+
+    @contextmanager
+    def track(self):
+        """Count the block's duration as time spent in inference"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            now = time.monotonic()
+            with self._lock:
+                self._busy_s = self._decayed_busy(now) + (now - started)
+                self._busy_at = now
+
+    def _decayed_busy(self, now: float) -> float:
+        return self._busy_s * math.exp(-(now - self._busy_at) / self.load_window_s)
+
+    def utilization(self) -> float:
+        """Share of the last ``load_window_s`` (exponentially weighted) spent in inference, 0..1"""
+        with self._lock:
+            busy = self._decayed_busy(time.monotonic())
+        return min(busy / self.load_window_s, 1.0)
+
+    def load(self) -> float:
+        """Inference utilization relative to inference_budget"""
+        return self.utilization() / max(self.inference_budget, 1e-6)
+
+    def saturated(self) -> bool:
+        """True once inference uses the whole budget; new frames should be shed"""
+        return self.load() >= 1.0
+
+    def next_interval_ms(self, key: str, emotion: Optional[str] = None, confidence: float = 0.0,
+                         session_state: Optional[str] = None) -> int:
+        """Record a result for ``key`` (user id or client address) and return its next interval"""
+        now = time.monotonic()
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                state = self._states[key] = {"emotion": None, "streak": 0}
+                self._prune(now)
+            state["seen"] = now
+
+            if emotion is None:
+                # No face: back off gently, the learner may have stepped away
+                state["streak"] = min(state["streak"] + 1, 4)
+            elif emotion == state["emotion"] and confidence >= self.stable_confidence:
+                state["streak"] += 1
+            else:
+                state["streak"] = 0
+            state["emotion"] = emotion
+
+            interval = self.min_interval_ms * 2 ** min(state["streak"], 8)
+
+        factor = SESSION_STATE_FACTORS.get(session_state or "active", 1.0)
+        if factor is None:
+            return self.max_interval_ms
+        interval *= factor
+
+        load = min(self.load(), 1.0)
+        if load > 0.5:
+            interval *= 1 + (load - 0.5) * 4
+
+        interval *= random.uniform(0.9, 1.1)
+        return int(min(max(interval, self.min_interval_ms), self.max_interval_ms))
+
+    def backoff_ms(self) -> int:
+        """Hint for a frame that was shed without running inference"""
+        return int(min(self.max_interval_ms, self.min_interval_ms * (1 + min(self.load(), 1.0) * 2)))
+
+    def _prune(self, now: float, max_age_s: float = 600.0):
+        if len(self._states) < 1024:
+            return
+        for key in [k for k, s in self._states.items() if now - s.get("seen", now) > max_age_s]:
+            del self._states[key]
+
+
+frame_pacer = FramePacer()
@@ -1,10 +1,16 @@
 from datetime import datetime, timedelta, date
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 from ..models import (
     UserXP, UserStreak, UserBadge, Badge, XPTransaction,
     PerformanceLog, EmotionLog, TopicMastery, User
 )
-from .. import db
+from .. import db, socketio
+from .badge_rules import UserStatsSnapshot, badge_rules, requirement_progress
+from .gamification_status import GamificationView
+from .leaderboard import leaderboard_service
+from .mastery_events import subscribe
+from .xp_ledger import xp_ledger
+from .streak_evaluator import user_today
 
 
 class GamificationService:
@@ -63,50 +69,13 @@ class GamificationService:
         }
     
     def award_xp(self, user_id: int, source: str, source_id: int = None, 
-                custom_amount: int = None, description: str = None) -> Dict:
+                custom_amount: int = None, description: str = None, commit: bool = True) -> Dict:
         amount = custom_amount or self.xp_sources.get(source, 0)
         if amount <= 0:
             return {"error": "Invalid XP amount"}
         
-        user_xp = UserXP.query.filter_by(user_id=user_id).first()
-        if not user_xp:
-            user_xp = UserXP(user_id=user_id)
-            db.session.add(user_xp)
-        
-        old_level = user_xp.current_level
-        user_xp.total_xp += amount
-        user_xp.xp_in_current_level += amount
-        
-        levels_gained = 0
-        while user_xp.xp_in_current_level >= user_xp.xp_to_next_level:
-            user_xp.xp_in_current_level -= user_xp.xp_to_next_level
-            user_xp.current_level += 1
-            levels_gained += 1
-            
-            # Calculate XP needed for next level (exponential growth)
-            user_xp.xp_to_next_level = int(100 * (1.2 ** user_xp.current_level))
-        
-        # Record XP transaction
-        transaction = XPTransaction(
-            user_id=user_id,
-            amount=amount,
-            source=source,
-            source_id=source_id,
-            description=description or f"XP from {source}"
-        )
-        db.session.add(transaction)
-        
-        db.session.commit()
-        
-        return {
-            "success": True,
-            "xp_awarded": amount,
-            "total_xp": user_xp.total_xp,
-            "current_level": user_xp.current_level,
-            "levels_gained": levels_gained,
-            "xp_to_next_level": user_xp.xp_to_next_level,
-            "xp_in_current_level": user_xp.xp_in_current_level
-        }
+        return xp_ledger.grant(user_id, amount, source, source_id,
+                               description or f"XP from {source}", commit=commit)
     
     def update_streak(self, user_id: int, streak_type: str) -> Dict:
         """
@@ -122,7 +91,9 @@ class GamificationService:
         if streak_type not in self.streak_types:
             return {"error": "Invalid streak type"}
         
-        today = date.today()
+        # Days roll over at the user's local midnight; lapsed streaks are
+        # already reset by the hourly expiry job
+        today = user_today(user_id)
         
         # Get or create streak record
         streak = UserStreak.query.filter_by(
@@ -182,50 +153,58 @@ class GamificationService:
             self.award_xp(user_id, "streak_milestone", streak.id, xp_bonus, 
                          f"{streak_type} streak milestone: {streak.current_streak} days")
         
+        new_badges = self.check_and_award_badges(
+            user_id, triggers=("streak", "xp", "level") if xp_bonus > 0 else ("streak",)
+        )
+        
         return {
             "success": True,
             "current_streak": streak.current_streak,
             "longest_streak": streak.longest_streak,
             "xp_bonus": xp_bonus,
+            "new_badges": new_badges,
             "message": f"Streak updated: {streak.current_streak} days"
         }
     
-    def check_and_award_badges(self, user_id: int) -> List[Dict]:
+    def check_and_award_badges(self, user_id: int, triggers: Optional[Iterable[str]] = None) -> List[Dict]:
         """
         Check for new badge achievements and award them
         
+        Only badges with a requirement on one of ``triggers`` are evaluated,
+        against a single stats snapshot; None checks every rule-evaluated badge.
+        
         Args:
             user_id: User ID
+            triggers: Event types that just changed, e.g. ("streak",) or ("quest", "xp")
             
         Returns:
             List of newly awarded badges
         """
         new_badges = []
-        
-        # Get user's current badges
-        user_badges = UserBadge.query.filter_by(user_id=user_id).all()
-        user_badge_ids = [ub.badge_id for ub in user_badges]
-        
-        # Get all badges
-        all_badges = Badge.query.all()
-        
-        for badge in all_badges:
-            if badge.id in user_badge_ids:
-                continue  # Already earned
+        earned = {badge_id for (badge_id,) in db.session.query(UserBadge.badge_id).filter_by(user_id=user_id)}
+        stats = UserStatsSnapshot(user_id)
+        
+        while True:
+            candidates = [rule for rule in badge_rules.rules_for(triggers) if rule.badge_id not in earned]
+            matched = [rule.badge_id for rule in candidates if rule.matches(stats)]
+            if not matched:
+                break
             
-            if self._check_badge_requirements(user_id, badge):
-                # Award badge
+            xp_awarded = False
+            for badge in Badge.query.filter(Badge.id.in_(matched)).all():
+                earned.add(badge.id)
                 user_badge = UserBadge(
                     user_id=user_id,
                     badge_id=badge.id,
-                    progress_data=self._get_badge_progress_data(user_id, badge)
+                    progress_data=self._get_badge_progress_data(stats, badge)
                 )
                 db.session.add(user_badge)
                 
                 # Award badge XP
                 if badge.xp_reward > 0:
                     self.award_xp(user_id, "badge_earned", badge.id, badge.xp_reward, 
-                                 f"Earned badge: {badge.name}")
+                                 f"Earned badge: {badge.name}", commit=False)
+                    xp_awarded = True
                 
                 new_badges.append({
                     "id": badge.id,
@@ -235,163 +214,68 @@ class GamificationService:
                     "rarity": badge.rarity,
                     "xp_reward": badge.xp_reward
                 })
+            
+            if not xp_awarded:
+                break
+            # Badge XP may unlock XP/level badges in turn
+            stats.discard("xp")
+            triggers = ("xp", "level")
         
         db.session.commit()
         return new_badges
     
-    def _check_badge_requirements(self, user_id: int, badge: Badge) -> bool:
-        """Check if user meets badge requirements"""
-        if not badge.requirements:
-            return False
-        
-        requirements = badge.requirements
-        
-        # Check XP requirements
-        if "min_xp" in requirements:
-            user_xp = UserXP.query.filter_by(user_id=user_id).first()
-            if not user_xp or user_xp.total_xp < requirements["min_xp"]:
-                return False
-        
-        # Check level requirements
-        if "min_level" in requirements:
-            user_xp = UserXP.query.filter_by(user_id=user_id).first()
-            if not user_xp or user_xp.current_level < requirements["min_level"]:
-                return False
-        
-        # Check streak requirements
-        if "streak_requirements" in requirements:
-            for streak_type, min_streak in requirements["streak_requirements"].items():
-                streak = UserStreak.query.filter_by(
-                    user_id=user_id, 
-                    streak_type=streak_type
-                ).first()
-                if not streak or streak.longest_streak < min_streak:
-                    return False
-        
-        # Check mastery requirements
-        if "mastery_requirements" in requirements:
-            mastery_reqs = requirements["mastery_requirements"]
-            for topic, min_mastery in mastery_reqs.items():
-                topic_mastery = TopicMastery.query.filter_by(
-                    user_id=user_id, 
-                    topic=topic
-                ).first()
-                if not topic_mastery or topic_mastery.mastery_score < min_mastery:
-                    return False
-        
-        # Check performance requirements
-        if "performance_requirements" in requirements:
-            perf_reqs = requirements["performance_requirements"]
-            if "min_accuracy" in perf_reqs:
-                # Calculate average accuracy from recent performance logs
-                recent_logs = PerformanceLog.query.filter(
-                    PerformanceLog.user_id == user_id,
-                    PerformanceLog.timestamp >= datetime.utcnow() - timedelta(days=30)
-                ).all()
-                
-                if len(recent_logs) < perf_reqs.get("min_attempts", 10):
-                    return False
-                
-                avg_accuracy = sum(log.score for log in recent_logs) / len(recent_logs)
-                if avg_accuracy < perf_reqs["min_accuracy"]:
-                    return False
-        
-        return True
-    
-    def _get_badge_progress_data(self, user_id: int, badge: Badge) -> Dict:
-        """Get progress data for badge achievement"""
-        progress_data = {
-            "earned_at": datetime.utcnow().isoformat(),
-            "requirements_met": badge.requirements
-        }
-        
-        # Add current stats
-        user_xp = UserXP.query.filter_by(user_id=user_id).first()
-        if user_xp:
-            progress_data["user_level"] = user_xp.current_level
-            progress_data["total_xp"] = user_xp.total_xp
-        
-        return progress_data
-    
-    def get_gamification_status(self, user_id: int) -> Dict:
-        """Get complete gamification status for user"""
-        # Get XP profile
-        user_xp = UserXP.query.filter_by(user_id=user_id).first()
-        if not user_xp:
-            self.initialize_user_gamification(user_id)
-            user_xp = UserXP.query.filter_by(user_id=user_id).first()
-        
-        # Get streaks
-        streaks = UserStreak.query.filter_by(user_id=user_id).all()
-        streak_data = {}
-        for streak in streaks:
-            streak_data[streak.streak_type] = {
-                "current": streak.current_streak,
-                "longest": streak.longest_streak,
-                "last_activity": streak.last_activity_date.isoformat() if streak.last_activity_date else None,
-                "frozen": streak.streak_frozen
-            }
-        
-        # Get badges
-        user_badges = UserBadge.query.filter_by(user_id=user_id).all()
-        badges_data = []
-        for user_badge in user_badges:
-            badge = Badge.query.get(user_badge.badge_id)
-            if badge:
-                badges_data.append({
+    def get_badge_progress(self, user_id: int) -> List[Dict]:
+        """Progress towards each unearned badge, read from counters and one stats snapshot"""
+        earned = db.session.query(UserBadge.badge_id).filter(UserBadge.user_id == user_id)
+        stats = UserStatsSnapshot(user_id)
+        progress = []
+        for badge in Badge.query.filter(~Badge.id.in_(earned)).all():
+            requirements = requirement_progress(badge, stats)
+            if requirements:
+                progress.append({
                     "id": badge.id,
                     "name": badge.name,
-                    "description": badge.description,
                     "icon": badge.icon,
                     "rarity": badge.rarity,
-                    "earned_at": user_badge.earned_at.isoformat()
+                    "requirements": requirements
                 })
-        
-        # Get recent XP transactions
-        recent_transactions = XPTransaction.query.filter_by(user_id=user_id)\
-            .order_by(XPTransaction.created_at.desc()).limit(10).all()
-        
-        transactions_data = []
-        for transaction in recent_transactions:
-            transactions_data.append({
-                "amount": transaction.amount,
-                "source": transaction.source,
-                "description": transaction.description,
-                "created_at": transaction.created_at.isoformat()
-            })
-        
+        return progress
+    
+    def _get_badge_progress_data(self, stats: UserStatsSnapshot, badge: Badge) -> Dict:
+        """Get progress data for badge achievement"""
         return {
-            "xp_profile": {
-                "total_xp": user_xp.total_xp,
-                "current_level": user_xp.current_level,
-                "xp_to_next_level": user_xp.xp_to_next_level,
-                "xp_in_current_level": user_xp.xp_in_current_level,
-                "progress_percentage": (user_xp.xp_in_current_level / user_xp.xp_to_next_level) * 100
-            },
-            "streaks": streak_data,
-            "badges": badges_data,
-            "recent_transactions": transactions_data,
-            "total_badges": len(badges_data),
-            "total_streak_days": sum(streak.current_streak for streak in streaks)
+            "earned_at": datetime.utcnow().isoformat(),
+            "requirements_met": badge.requirements,
+            "user_level": stats["xp"]["level"],
+            "total_xp": stats["xp"]["total_xp"]
         }
     
-    def get_leaderboard(self, limit: int = 10) -> List[Dict]:
-        """Get leaderboard of top users by XP"""
-        top_users = UserXP.query.order_by(UserXP.total_xp.desc()).limit(limit).all()
-        
-        leaderboard = []
-        for i, user_xp in enumerate(top_users):
-            user = User.query.get(user_xp.user_id)
-            if user:
-                leaderboard.append({
-                    "rank": i + 1,
-                    "user_id": user.id,
-                    "name": user.name,
-                    "total_xp": user_xp.total_xp,
-                    "level": user_xp.current_level
-                })
-        
+    def get_gamification_status(self, user_id: int) -> Dict:
+        """Get complete gamification status for user"""
+        return GamificationView(user_id).status()
+    
+    def get_leaderboard(self, limit: int = 10, window: str = "all") -> List[Dict]:
+        """Get leaderboard of top users by XP (all-time, weekly or monthly)"""
+        leaderboard = leaderboard_service.top("xp", window, limit)
+        levels = self._levels([entry["user_id"] for entry in leaderboard])
+        for entry in leaderboard:
+            entry["total_xp" if window == "all" else "period_xp"] = int(entry.pop("score"))
+            entry["level"] = levels.get(entry["user_id"], 1)
         return leaderboard
+
+    def get_leaderboard_position(self, user_id: int, window: str = "all", radius: int = 2) -> Dict:
+        """A user's XP rank with the entries just above and below"""
+        position = leaderboard_service.around(user_id, "xp", window, radius)
+        levels = self._levels([entry["user_id"] for entry in position["neighbours"]])
+        for entry in position["neighbours"]:
+            entry["total_xp" if window == "all" else "period_xp"] = int(entry.pop("score"))
+            entry["level"] = levels.get(entry["user_id"], 1)
+        return position
+
+    def _levels(self, user_ids: List[int]) -> Dict[int, int]:
+        if not user_ids:
+            return {}
+        return dict(db.session.query(UserXP.user_id, UserXP.current_level).filter(UserXP.user_id.in_(user_ids)))
     
     def freeze_streak(self, user_id: int, streak_type: str) -> Dict:
         """Freeze a user's streak (prevent it from breaking)"""
@@ -430,3 +314,14 @@ class GamificationService:
             "message": f"{streak_type} streak unfrozen",
             "current_streak": streak.current_streak
         }
+
+
+@subscribe
+def _award_badges_on_mastery(user_id: int, topic: str, mastery_score: float):
+    """Evaluate mastery badges whenever a topic's mastery changes"""
+    try:
+        for badge in GamificationService().check_and_award_badges(user_id, triggers=("mastery",)):
+            socketio.emit("badge_earned", {"user_id": user_id, "badge": badge}, room=str(user_id))
+    except Exception:
+        db.session.rollback()
+        raise
@@ -0,0 +1,173 @@
+from datetime import datetime, timedelta
+from typing import Dict, List
+import hashlib
+
+from sqlalchemy import func, select
+
+from .. import db
+from ..models import Badge, UserBadge, UserStreak, UserXP
+from .xp_ledger import level_progress
+from .xp_rollup import get_transactions_page, get_xp_totals
+
+
+def gamification_version(user_id: int) -> str:
+    """
+    Version stamp for a user's gamification state, read in one query
+
+    Combines the XP row's updated_at and total, the latest streak update and
+    the newest earned badge; every gamification write moves at least one of
+    them. The UTC date is mixed in because "recent activity" windows slide
+    without any write.
+    """
+    row = db.session.execute(select(
+        select(UserXP.updated_at).where(UserXP.user_id == user_id).scalar_subquery(),
+        select(UserXP.total_xp).where(UserXP.user_id == user_id).scalar_subquery(),
+        select(func.max(UserStreak.updated_at)).where(UserStreak.user_id == user_id).scalar_subquery(),
+        select(func.max(UserBadge.id)).where(UserBadge.user_id == user_id).scalar_subquery(),
+        select(func.count(UserBadge.id)).where(UserBadge.user_id == user_id).scalar_subquery(),
+    )).one()
+    stamp = f"{user_id}|{datetime.utcnow().date()}|" + "|".join(str(value) for value in row)
+    return hashlib.sha1(stamp.encode()).hexdigest()[:20]
+
+
+class GamificationView:
+    """Read-only gamification facets for one user, each loaded by a single query on first use.
+
+    Missing rows read as a fresh profile instead of being created, so reads
+    never write.
+    """
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self._facets: Dict[str, object] = {}
+
+    def _facet(self, name: str, loader):
+        if name not in self._facets:
+            self._facets[name] = loader()
+        return self._facets[name]
+
+    @property
+    def xp(self) -> Dict:
+        def load():
+            row = db.session.query(UserXP.total_xp, UserXP.current_level, UserXP.xp_to_next_level,
+                                   UserXP.xp_in_current_level).filter_by(user_id=self.user_id).first()
+            if row is None:
+                return {"total_xp": 0, **level_progress(0)}
+            return {"total_xp": row[0] or 0, "current_level": row[1], "xp_to_next_level": row[2],
+                    "xp_in_current_level": row[3]}
+        return self._facet("xp", load)
+
+    @property
+    def streaks(self) -> List[UserStreak]:
+        return self._facet("streaks", lambda: UserStreak.query.filter_by(user_id=self.user_id).all())
+
+    @property
+    def badges(self) -> List[tuple]:
+        """(UserBadge, Badge) pairs, joined in one query"""
+        return self._facet("badges", lambda: db.session.query(UserBadge, Badge)
+                           .join(Badge, UserBadge.badge_id == Badge.id)
+                           .filter(UserBadge.user_id == self.user_id)
+                           .order_by(UserBadge.earned_at).all())
+
+    def xp_profile(self) -> Dict:
+        xp = self.xp
+        return {
+            "total_xp": xp["total_xp"],
+            "current_level": xp["current_level"],
+            "xp_to_next_level": xp["xp_to_next_level"],
+            "xp_in_current_level": xp["xp_in_current_level"],
+        }
+
+    def total_streak_days(self) -> int:
+        return sum(streak.current_streak or 0 for streak in self.streaks)
+
+    def status(self) -> Dict:
+        """Payload for /status"""
+        recent_transactions, _ = get_transactions_page(self.user_id, 10)
+        profile = self.xp_profile()
+        profile["progress_percentage"] = (profile["xp_in_current_level"] / profile["xp_to_next_level"]) * 100
+        badges = [
+            {
+                "id": badge.id,
+                "name": badge.name,
+                "description": badge.description,
+                "icon": badge.icon,
+                "rarity": badge.rarity,
+                "earned_at": user_badge.earned_at.isoformat()
+            }
+            for user_badge, badge in self.badges
+        ]
+        return {
+            "xp_profile": profile,
+            "streaks": {
+                streak.streak_type: {
+                    "current": streak.current_streak,
+                    "longest": streak.longest_streak,
+                    "last_activity": streak.last_activity_date.isoformat() if streak.last_activity_date else None,
+                    "frozen": streak.streak_frozen
+                }
+                for streak in self.streaks
+            },
+            "badges": badges,
+            "recent_transactions": [
+                {
+                    "amount": transaction.amount,
+                    "source": transaction.source,
+                    "description": transaction.description,
+                    "created_at": transaction.created_at.isoformat()
+                }
+                for transaction in recent_transactions
+            ],
+            "total_badges": len(badges),
+            "total_streak_days": self.total_streak_days()
+        }
+
+    def stats(self) -> Dict:
+        """Payload for /stats"""
+        since = (datetime.utcnow() - timedelta(days=7)).date()
+        badge_count = db.session.query(func.count(UserBadge.id)).filter_by(user_id=self.user_id).scalar()
+        return {
+            "xp_profile": self.xp_profile(),
+            "streak_stats": {
+                streak.streak_type: {
+                    "current": streak.current_streak,
+                    "longest": streak.longest_streak,
+                    "frozen": streak.streak_frozen
+                }
+                for streak in self.streaks
+            },
+            "badge_count": badge_count,
+            "recent_activity": get_xp_totals(self.user_id, since)["transaction_count"],
+            "total_streak_days": self.total_streak_days()
+        }
+
+    def achievements(self) -> Dict:
+        """Payload for /achievements"""
+        badges_by_category = {}
+        for user_badge, badge in self.badges:
+            badges_by_category.setdefault(badge.category, []).append({
+                "name": badge.name,
+                "description": badge.description,
+                "icon": badge.icon,
+                "rarity": badge.rarity,
+                "earned_at": user_badge.earned_at.isoformat()
+            })
+
+        streak_achievements = [
+            {
+                "type": streak.streak_type,
+                "days": streak.longest_streak,
+                "milestone": "weekly" if streak.longest_streak >= 7 else "monthly" if streak.longest_streak >= 30 else "daily"
+            }
+            for streak in self.streaks
+            if (streak.longest_streak or 0) >= 7
+        ]
+
+        return {
+            "level": self.xp["current_level"],
+            "total_xp": self.xp["total_xp"],
+            "badges_by_category": badges_by_category,
+            "streak_achievements": streak_achievements,
+            "total_badges": len(self.badges),
+            "total_streak_days": self.total_streak_days()
+        }
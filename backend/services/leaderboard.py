@@ -0,0 +1,358 @@
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import logging
+import threading
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from .. import db
+from ..models import TopicMastery, User, UserXP
+from .mastery_store import decayed_score_column, write_pending_mastery
+from .xp_rollup import get_window_totals
+
+try:
+    import redis
+except ImportError:  # Redis is optional; boards fall back to in-process sorted sets
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+WINDOWS = ("all", "weekly", "monthly")
+
+# Users need this many studied topics to appear on the mastery board
+MASTERY_MIN_TOPICS = 3
+
+
+class LocalSortedSet:
+    """In-process stand-in for a Redis sorted set (highest score ranks first).
+
+    Rank lookups are a binary search over a list kept in (-score, member)
+    order; updates are a binary search plus a list insert.
+    """
+
+    def __init__(self):
+        self._scores: Dict[int, float] = {}
+        self._order: List[Tuple[float, int]] = []
+        self._lock = threading.Lock()
+
+    def _remove(self, member: int):
+        score = self._scores.pop(member, None)
+        if score is not None:
+            del self._order[bisect_left(self._order, (-score, member))]
+
+    def set(self, member: int, score: float):
+        with self._lock:
+            self._remove(member)
+            self._scores[member] = score
+            insort(self._order, (-score, member))
+
+    def incr(self, member: int, delta: float) -> float:
+        with self._lock:
+            score = self._scores.get(member, 0) + delta
+            self._remove(member)
+            self._scores[member] = score
+            insort(self._order, (-score, member))
+            return score
+
+    def remove(self, member: int):
+        with self._lock:
+            self._remove(member)
+
+    def replace_all(self, scores: Dict[int, float]):
+        with self._lock:
+            self._scores = dict(scores)
+            self._order = sorted((-score, member) for member, score in self._scores.items())
+
+    def rank(self, member: int) -> Optional[int]:
+        """0-based rank, or None if the member is not on the board"""
+        with self._lock:
+            score = self._scores.get(member)
+            return None if score is None else bisect_left(self._order, (-score, member))
+
+    def range(self, start: int, stop: int) -> List[Tuple[int, float]]:
+        """Members ranked start..stop inclusive, best first"""
+        with self._lock:
+            return [(member, -neg) for neg, member in self._order[max(start, 0):stop + 1]]
+
+    def size(self) -> int:
+        return len(self._scores)
+
+
+class RedisSortedSet:
+    """The same interface backed by a Redis sorted set, shared across workers"""
+
+    def __init__(self, client, key: str, ttl_seconds: Optional[int] = None):
+        self.client = client
+        self.key = key
+        self.ttl_seconds = ttl_seconds
+
+    def set(self, member: int, score: float):
+        self.client.zadd(self.key, {member: score})
+
+    def incr(self, member: int, delta: float) -> float:
+        score = self.client.zincrby(self.key, delta, member)
+        if self.ttl_seconds:
+            self.client.expire(self.key, self.ttl_seconds)
+        return score
+
+    def remove(self, member: int):
+        self.client.zrem(self.key, member)
+
+    def replace_all(self, scores: Dict[int, float]):
+        pipe = self.client.pipeline()
+        pipe.delete(self.key)
+        if scores:
+            pipe.zadd(self.key, scores)
+        if self.ttl_seconds:
+            pipe.expire(self.key, self.ttl_seconds)
+        pipe.execute()
+
+    def rank(self, member: int) -> Optional[int]:
+        return self.client.zrevrank(self.key, member)
+
+    def range(self, start: int, stop: int) -> List[Tuple[int, float]]:
+        return [(int(m), s) for m, s in self.client.zrevrange(self.key, max(start, 0), stop, withscores=True)]
+
+    def size(self) -> int:
+        return self.client.zcard(self.key)
+
+
+def window_key(window: str, at: Optional[datetime] = None) -> str:
+    """Board suffix for a time window, e.g. 'weekly:2026-W42' or 'monthly:2026-10'"""
+    at = at or datetime.utcnow()
+    if window == "weekly":
+        year, week, _ = at.isocalendar()
+        return f"weekly:{year}-W{week:02d}"
+    if window == "monthly":
+        return f"monthly:{at:%Y-%m}"
+    return "all"
+
+
+def window_start(window: str, at: Optional[datetime] = None) -> Optional[datetime]:
+    at = at or datetime.utcnow()
+    day = at.replace(hour=0, minute=0, second=0, microsecond=0)
+    if window == "weekly":
+        return datetime.fromordinal(day.toordinal() - day.weekday())
+    if window == "monthly":
+        return day.replace(day=1)
+    return None
+
+
+class LeaderboardService:
+    """Materialized XP and mastery leaderboards.
+
+    XP boards (all-time, weekly, monthly) are updated from XP ledger grants
+    and mastery averages from TopicMastery flushes, both applied only once the
+    writing transaction commits. A background loop rebuilds every board from
+    the database every ``reconcile_seconds`` to repair drift. With
+    LEADERBOARD_REDIS_URL set, boards live in Redis sorted sets shared by all
+    workers; otherwise each process keeps its own LocalSortedSet.
+    """
+
+    def __init__(self, reconcile_seconds: int = 300):
+        self.reconcile_seconds = reconcile_seconds
+        self.app = None
+        self.redis_client = None
+        self._boards: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, app):
+        """Build the boards from the database and start the reconcile loop"""
+        self.app = app
+        self.reconcile_seconds = app.config.get("LEADERBOARD_RECONCILE_SECONDS", self.reconcile_seconds)
+        redis_url = app.config.get("LEADERBOARD_REDIS_URL")
+        if redis_url:
+            if redis is None:
+                logger.warning("LEADERBOARD_REDIS_URL is set but redis is not installed; using local boards")
+            else:
+                self.redis_client = redis.Redis.from_url(redis_url, decode_responses=True)
+
+        self.reconcile()
+        if self._thread is None and self.reconcile_seconds > 0:
+            self._thread = threading.Thread(target=self._run, name="leaderboard-reconcile", daemon=True)
+            self._thread.start()
+
+    def shutdown(self):
+        self._stopping.set()
+
+    def board(self, name: str):
+        with self._lock:
+            if name not in self._boards:
+                if self.redis_client is not None:
+                    # Windowed boards only need to outlive their window
+                    ttl = None if name in ("xp:all", "mastery:all") else 40 * 86400
+                    self._boards[name] = RedisSortedSet(self.redis_client, f"leaderboard:{name}", ttl)
+                else:
+                    self._boards[name] = LocalSortedSet()
+            return self._boards[name]
+
+    def _board_name(self, metric: str, window: str = "all", at: Optional[datetime] = None) -> str:
+        return f"{metric}:{window_key(window, at)}"
+
+    # ----- incremental updates -----
+
+    def record_xp(self, user_id: int, total_xp: int, delta: int, at: Optional[datetime] = None):
+        self.board("xp:all").set(user_id, total_xp)
+        for window in ("weekly", "monthly"):
+            self.board(self._board_name("xp", window, at)).incr(user_id, delta)
+
+    def record_mastery(self, user_id: int, average: Optional[float], topic_count: int):
+        if average is None or topic_count < MASTERY_MIN_TOPICS:
+            self.board("mastery:all").remove(user_id)
+        else:
+            self.board("mastery:all").set(user_id, round(average, 3))
+
+    # ----- reads -----
+
+    def top(self, metric: str = "xp", window: str = "all", limit: int = 10) -> List[Dict]:
+        board = self.board(self._board_name(metric, window))
+        while True:
+            ranked = board.range(0, limit - 1)
+            names = self._names(board, ranked)
+            if names is not None:
+                return self._entries(ranked, names, start_rank=1)
+
+    def around(self, user_id: int, metric: str = "xp", window: str = "all", radius: int = 2) -> Dict:
+        """The user's rank plus ``radius`` neighbours on either side"""
+        board = self.board(self._board_name(metric, window))
+        while True:
+            rank = board.rank(user_id)
+            if rank is None:
+                return {"rank": None, "neighbours": [], "total": board.size()}
+            start = max(rank - radius, 0)
+            ranked = board.range(start, rank + radius)
+            names = self._names(board, ranked)
+            if names is not None:
+                return {
+                    "rank": rank + 1,
+                    "neighbours": self._entries(ranked, names, start_rank=start + 1),
+                    "total": board.size(),
+                }
+
+    def _names(self, board, ranked: List[Tuple[int, float]]) -> Optional[Dict[int, str]]:
+        """
+        Names of the ranked members, or None after removing members whose user
+        no longer exists from the board; the caller then re-reads its range so
+        ranks and totals stay consecutive
+        """
+        ids = [member for member, _ in ranked]
+        names = dict(db.session.query(User.id, User.name).filter(User.id.in_(ids))) if ids else {}
+        orphans = [member for member in ids if member not in names]
+        for member in orphans:
+            board.remove(member)
+        return None if orphans else names
+
+    def _entries(self, ranked: List[Tuple[int, float]], names: Dict[int, str], start_rank: int) -> List[Dict]:
+        return [
+            {"rank": start_rank + i, "user_id": member, "name": names[member], "score": score}
+            for i, (member, score) in enumerate(ranked)
+        ]
+
+    # ----- reconciliation -----
+
+    def reconcile(self):
+        """Rebuild every current board from the database (one aggregate query each), dropping deleted users"""
+        with self.app.app_context():
+            users = {user_id for (user_id,) in db.session.query(User.id)}
+            self.board("xp:all").replace_all({
+                user_id: total_xp for user_id, total_xp in db.session.query(UserXP.user_id, UserXP.total_xp)
+                if user_id in users
+            })
+
+            now = datetime.utcnow()
+            for window in ("weekly", "monthly"):
+                name = self._board_name("xp", window, now)
+                totals = get_window_totals(window_start(window, now).date())
+                self.board(name).replace_all({user_id: xp for user_id, xp in totals.items() if user_id in users})
+                self._drop_stale(f"xp:{window}:", name)
+
+            rows = db.session.query(TopicMastery.user_id, func.avg(decayed_score_column()))\
+                .group_by(TopicMastery.user_id)\
+                .having(func.count(TopicMastery.id) >= MASTERY_MIN_TOPICS)
+            self.board("mastery:all").replace_all({
+                user_id: round(avg or 0.0, 3) for user_id, avg in rows if user_id in users
+            })
+            db.session.remove()
+
+    def _drop_stale(self, prefix: str, current: str):
+        with self._lock:
+            for name in [n for n in self._boards if n.startswith(prefix) and n != current]:
+                del self._boards[name]
+
+    def _run(self):
+        while not self._stopping.wait(self.reconcile_seconds):
+            try:
+                self.reconcile()
+            except Exception as e:
+                logger.error(f"Leaderboard reconcile failed: {e}")
+
+
+leaderboard_service = LeaderboardService()
+
+
+# ----- transaction hooks: boards change only after the write commits -----
+
+def queue_xp_update(user_id: int, total_xp: int, delta: int):
+    """Called by the XP ledger; applied to the boards after commit"""
+    pending = db.session.info.setdefault("leaderboard_xp", {})
+    entry = pending.setdefault(user_id, [total_xp, 0])
+    entry[0] = total_xp
+    entry[1] += delta
+
+
+def _pending_mastery_users(session):
+    return {
+        obj.user_id for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+        if isinstance(obj, TopicMastery)
+    }
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_mastery_writes(session, flush_context):
+    users = _pending_mastery_users(session)
+    if users:
+        session.info.setdefault("leaderboard_mastery", set()).update(users)
+
+
+@event.listens_for(Session, "before_commit")
+def _load_mastery_averages(session):
+    # before_commit runs ahead of the final flush; flush now so the averages see every write
+    write_pending_mastery(session)
+    if _pending_mastery_users(session):
+        session.flush()
+    users = session.info.pop("leaderboard_mastery", set()) | session.info.pop("mastery_written_users", set())
+    if not users:
+        return
+    rows = session.query(
+        TopicMastery.user_id, func.avg(decayed_score_column(dialect=session.get_bind().dialect.name)),
+        func.count(TopicMastery.id)
+    ).filter(TopicMastery.user_id.in_(users)).group_by(TopicMastery.user_id).all()
+    averages = {user_id: (None, 0) for user_id in users}
+    averages.update({user_id: (avg, count) for user_id, avg, count in rows})
+    session.info["leaderboard_mastery_ready"] = averages
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending(session):
+    xp = session.info.pop("leaderboard_xp", None)
+    mastery = session.info.pop("leaderboard_mastery_ready", None)
+    if leaderboard_service.app is None:
+        return
+    try:
+        for user_id, (total_xp, delta) in (xp or {}).items():
+            leaderboard_service.record_xp(user_id, total_xp, delta)
+        for user_id, (average, count) in (mastery or {}).items():
+            leaderboard_service.record_mastery(user_id, average, count)
+    except Exception as e:
+        # Reconciliation will repair the boards
+        logger.error(f"Leaderboard update failed: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session):
+    for key in ("leaderboard_xp", "leaderboard_mastery", "leaderboard_mastery_ready"):
+        session.info.pop(key, None)
@@ -2,26 +2,20 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 from ..models import LearningProgress, TopicMastery, LearningBadge, User
 from .. import db
+from .mastery_store import (
+    DECAY_RATES, MASTERY_LEVELS, MasteryState, commit_mastery, decay_factor, get_user_mastery, mastery_level,
+    record_mastery_event
+)
 
 
 class LearningDNAEngine:
     """Engine for calculating and managing Learning DNA profiles"""
     
     def __init__(self):
-        self.mastery_levels = {
-            'beginner': (0, 25),
-            'intermediate': (25, 60),
-            'advanced': (60, 85),
-            'expert': (85, 100)
-        }
+        self.mastery_levels = MASTERY_LEVELS
         
-        # Decay rates (per day)
-        self.decay_rates = {
-            'beginner': 0.02,      # 2% per day
-            'intermediate': 0.015,  # 1.5% per day
-            'advanced': 0.01,      # 1% per day
-            'expert': 0.005        # 0.5% per day
-        }
+        # Decay rates (per day), applied when scores are read
+        self.decay_rates = DECAY_RATES
     
     def calculate_mastery_score(self, correct_attempts: int, total_attempts: int, 
                               previous_score: float = 0.0, days_since_last: int = 0) -> float:
@@ -45,13 +39,9 @@ class LearningDNAEngine:
         
         # Apply decay if there's a gap in learning
         if days_since_last > 0 and previous_score > 0:
-            # Determine decay rate based on current level
+            # Exponential decay at the rate of the current level
             current_level = self._get_mastery_level(previous_score)
-            decay_rate = self.decay_rates.get(current_level, 0.01)
-            
-            # Apply exponential decay
-            decay_factor = (1 - decay_rate) ** days_since_last
-            decayed_score = previous_score * decay_factor
+            decayed_score = previous_score * decay_factor(current_level, days_since_last)
             
             # Use weighted average of new performance and decayed score
             # Recent performance gets more weight
@@ -62,13 +52,10 @@ class LearningDNAEngine:
     
     def _get_mastery_level(self, score: float) -> str:
         """Get mastery level based on score"""
-        for level, (min_score, max_score) in self.mastery_levels.items():
-            if min_score <= score < max_score:
-                return level
-        return 'expert' if score >= 100 else 'beginner'
+        return mastery_level(score)
     
     def update_topic_mastery(self, user_id: int, topic: str, score: float, 
-                           time_spent: int = None, quiz_id: str = None) -> Dict:
+                           time_spent: int = None, quiz_id: str = None, commit: bool = True) -> Dict:
         """
         Update topic mastery after a quiz/lesson completion
         
@@ -78,54 +65,38 @@ class LearningDNAEngine:
             score: Score (0.0 to 1.0)
             time_spent: Time spent in seconds
             quiz_id: Quiz/lesson identifier
+            commit: Commit now; otherwise the caller finishes with commit_mastery()
             
         Returns:
             Dictionary with updated mastery data
         """
-        # Create or get existing mastery record
-        mastery = TopicMastery.query.filter_by(user_id=user_id, topic=topic).first()
-        
-        if not mastery:
-            mastery = TopicMastery(
-                user_id=user_id,
-                topic=topic,
-                mastery_score=0.0,
-                total_attempts=0,
-                correct_attempts=0,
-                streak_count=0,
-                mastery_level='beginner'
+        def update(mastery: MasteryState, now: datetime):
+            # Calculate days since last update
+            days_since_last = 0
+            if mastery.last_updated:
+                days_since_last = (now - mastery.last_updated).days
+            
+            # Update attempt counts
+            mastery.total_attempts += 1
+            if score >= 0.6:  # Consider 60%+ as correct
+                mastery.correct_attempts += 1
+            
+            # Calculate new mastery score
+            old_score = mastery.mastery_score
+            mastery.mastery_score = self.calculate_mastery_score(
+                mastery.correct_attempts,
+                mastery.total_attempts,
+                old_score,
+                days_since_last
             )
-            db.session.add(mastery)
-        
-        # Calculate days since last update
-        days_since_last = 0
-        if mastery.last_updated:
-            days_since_last = (datetime.utcnow() - mastery.last_updated).days
-        
-        # Update attempt counts
-        mastery.total_attempts += 1
-        if score >= 0.6:  # Consider 60%+ as correct
-            mastery.correct_attempts += 1
-        
-        # Calculate new mastery score
-        old_score = mastery.mastery_score
-        mastery.mastery_score = self.calculate_mastery_score(
-            mastery.correct_attempts,
-            mastery.total_attempts,
-            old_score,
-            days_since_last
-        )
-        
-        # Update mastery level
-        mastery.mastery_level = self._get_mastery_level(mastery.mastery_score)
-        
-        # Update streak count
-        if mastery.mastery_score > old_score:
-            mastery.streak_count += 1
-        else:
-            mastery.streak_count = 0
+            
+            # Update streak count
+            if mastery.mastery_score > old_score:
+                mastery.streak_count += 1
+            else:
+                mastery.streak_count = 0
         
-        mastery.last_updated = datetime.utcnow()
+        previous, mastery = record_mastery_event(user_id, topic, update)
         
         # Create progress record
         progress = LearningProgress(
@@ -140,7 +111,8 @@ class LearningDNAEngine:
         )
         db.session.add(progress)
         
-        db.session.commit()
+        if commit:
+            commit_mastery()
         
         # Check for badges
         badges_earned = self._check_badges(user_id, topic, mastery)
@@ -151,11 +123,11 @@ class LearningDNAEngine:
             'streak_count': mastery.streak_count,
             'total_attempts': mastery.total_attempts,
             'correct_attempts': mastery.correct_attempts,
-            'improvement': mastery.mastery_score - old_score,
+            'improvement': mastery.mastery_score - previous.mastery_score,
             'badges_earned': badges_earned
         }
     
-    def _check_badges(self, user_id: int, topic: str, mastery: TopicMastery) -> List[Dict]:
+    def _check_badges(self, user_id: int, topic: str, mastery: MasteryState) -> List[Dict]:
         """Check and award badges for achievements"""
         badges_earned = []
         
@@ -227,8 +199,8 @@ class LearningDNAEngine:
     
     def get_learning_dna_profile(self, user_id: int) -> Dict:
         """Get complete Learning DNA profile for a user"""
-        # Get all topic mastery records
-        mastery_records = TopicMastery.query.filter_by(user_id=user_id).all()
+        # Get all topic mastery records, decayed to today
+        mastery_records = list(get_user_mastery(user_id).values())
         
         # Get recent progress (last 30 days)
         since = datetime.utcnow() - timedelta(days=30)
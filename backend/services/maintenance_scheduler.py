@@ -0,0 +1,95 @@
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.cron import CronTrigger
+import atexit
+import logging
+
+from .. import db
+
+logger = logging.getLogger(__name__)
+
+
+class MaintenanceScheduler:
+    """Scheduled database upkeep jobs, each run inside the app context"""
+
+    def __init__(self):
+        self.scheduler = BackgroundScheduler()
+        self.app = None
+
+    def setup_jobs(self):
+        # Reset lapsed streaks (hourly, so each timezone is settled soon after its midnight)
+        self.scheduler.add_job(
+            func=self._in_app_context(self.expire_lapsed_streaks),
+            trigger=CronTrigger(minute=5, timezone="UTC"),
+            id='expire_lapsed_streaks',
+            name='Expire Lapsed Streaks',
+            replace_existing=True
+        )
+
+        # Assign shared weak-topic quests (nightly at 2:00 AM UTC)
+        self.scheduler.add_job(
+            func=self._in_app_context(self.assign_weakness_quests),
+            trigger=CronTrigger(hour=2, minute=0, timezone="UTC"),
+            id='assign_weakness_quests',
+            name='Assign Weakness Quests',
+            replace_existing=True
+        )
+
+        # Archive old XP transactions (daily at 3:30 AM UTC)
+        self.scheduler.add_job(
+            func=self._in_app_context(self.compact_xp_transactions),
+            trigger=CronTrigger(hour=3, minute=30, timezone="UTC"),
+            id='compact_xp_transactions',
+            name='Compact XP Transactions',
+            replace_existing=True
+        )
+
+    def start(self, app):
+        """Register the jobs and start the scheduler"""
+        self.app = app
+        if not self.scheduler.running:
+            self.setup_jobs()
+            self.scheduler.start()
+            logger.info("Maintenance scheduler started")
+            atexit.register(self.shutdown)
+
+    def shutdown(self):
+        if self.scheduler.running:
+            self.scheduler.shutdown()
+            logger.info("Maintenance scheduler stopped")
+
+    def _in_app_context(self, job):
+        def run():
+            with self.app.app_context():
+                try:
+                    job()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Error in {job.__name__}: {e}")
+                finally:
+                    db.session.remove()
+        return run
+
+    def expire_lapsed_streaks(self):
+        """Reset streaks whose owners missed a local day"""
+        from .streak_evaluator import expire_lapsed_streaks
+
+        expire_lapsed_streaks()
+
+    def assign_weakness_quests(self):
+        """Give every user the shared quest for their current weak topics"""
+        from .quest_engine import QuestEngine
+
+        assigned = QuestEngine().assign_weakness_quests()
+        logger.info(f"Assigned {assigned} weakness quests")
+
+    def compact_xp_transactions(self):
+        """Move raw XP transactions past the retention window into archive files"""
+        from .xp_rollup import compact_xp_transactions
+
+        retention_days = self.app.config.get("XP_TRANSACTION_RETENTION_DAYS", 90)
+        if retention_days <= 0:
+            return
+        compact_xp_transactions(retention_days, self.app.config["XP_ARCHIVE_DIR"])
+
+
+maintenance_scheduler = MaintenanceScheduler()
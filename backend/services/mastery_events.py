@@ -0,0 +1,25 @@
+from typing import Callable, List
+import logging
+
+logger = logging.getLogger(__name__)
+
+# handler(user_id, topic, mastery_score), called after the mastery write commits
+MasteryHandler = Callable[[int, str, float], None]
+
+_subscribers: List[MasteryHandler] = []
+
+
+def subscribe(handler: MasteryHandler) -> MasteryHandler:
+    """Register a handler for topic mastery updates; usable as a decorator"""
+    if handler not in _subscribers:
+        _subscribers.append(handler)
+    return handler
+
+
+def publish_mastery_update(user_id: int, topic: str, mastery_score: float):
+    """Notify subscribers that a user's mastery of a topic changed"""
+    for handler in list(_subscribers):
+        try:
+            handler(user_id, topic, mastery_score)
+        except Exception as e:
+            logger.error(f"Mastery update handler {getattr(handler, '__name__', handler)} failed: {e}")
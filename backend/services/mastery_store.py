@@ -0,0 +1,281 @@
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import logging
+import sqlite3
+
+import numpy as np
+from sqlalchemy import DateTime, Integer, case, cast, event, func, literal
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from .. import db
+from ..models import TopicMastery
+from .mastery_events import publish_mastery_update
+
+logger = logging.getLogger(__name__)
+
+# Score ranges (0-100) of the stored mastery levels
+MASTERY_LEVELS = {
+    'beginner': (0, 25),
+    'intermediate': (25, 60),
+    'advanced': (60, 85),
+    'expert': (85, 100)
+}
+
+# Daily decay rate per stored level; a score read d whole days after its last
+# update is score * (1 - rate) ** d, so decay needs no background rewrite
+DECAY_RATES = {
+    'beginner': 0.02,
+    'intermediate': 0.015,
+    'advanced': 0.01,
+    'expert': 0.005
+}
+DEFAULT_DECAY_RATE = 0.01
+
+STATE_COLUMNS = ("mastery_score", "mastery_level", "total_attempts", "correct_attempts",
+                 "streak_count", "last_updated")
+
+
+def mastery_level(score: float) -> str:
+    """Stored mastery level for a 0-100 score"""
+    for level, (min_score, max_score) in MASTERY_LEVELS.items():
+        if min_score <= score < max_score:
+            return level
+    return 'expert' if score >= 100 else 'beginner'
+
+
+def decay_factor(level: str, days: int) -> float:
+    """Fraction of a score left after ``days`` idle days at the given level"""
+    if days <= 0:
+        return 1.0
+    return (1 - DECAY_RATES.get(level, DEFAULT_DECAY_RATE)) ** days
+
+
+class MasteryState:
+    """One (user, topic) mastery row as the store sees it, pending writes included"""
+
+    __slots__ = ("user_id", "topic") + STATE_COLUMNS
+
+    def __init__(self, user_id: int, topic: str, mastery_score: float = 0.0, mastery_level: str = "beginner",
+                 total_attempts: int = 0, correct_attempts: int = 0, streak_count: int = 0,
+                 last_updated: Optional[datetime] = None):
+        self.user_id = user_id
+        self.topic = topic
+        self.mastery_score = mastery_score or 0.0
+        self.mastery_level = mastery_level or "beginner"
+        self.total_attempts = total_attempts or 0
+        self.correct_attempts = correct_attempts or 0
+        self.streak_count = streak_count or 0
+        self.last_updated = last_updated
+
+    def copy(self) -> "MasteryState":
+        return MasteryState(self.user_id, self.topic, *(getattr(self, column) for column in STATE_COLUMNS))
+
+    def as_row(self) -> Dict:
+        row = {"user_id": self.user_id, "topic": self.topic}
+        row.update((column, getattr(self, column)) for column in STATE_COLUMNS)
+        return row
+
+
+def decayed_score(state: MasteryState, now: datetime = None) -> float:
+    """A stored state's score as of ``now``"""
+    if not state.last_updated:
+        return state.mastery_score
+    days = ((now or datetime.utcnow()) - state.last_updated).days
+    return state.mastery_score * decay_factor(state.mastery_level, days)
+
+
+def decay_scores(states: List[MasteryState], now: datetime = None) -> np.ndarray:
+    """Scores of many stored states as of ``now``, in one vectorized pass"""
+    now = now or datetime.utcnow()
+    count = len(states)
+    scores = np.fromiter((state.mastery_score for state in states), dtype=float, count=count)
+    rates = np.fromiter((DECAY_RATES.get(state.mastery_level, DEFAULT_DECAY_RATE) for state in states),
+                        dtype=float, count=count)
+    days = np.fromiter(((now - state.last_updated).days if state.last_updated else 0 for state in states),
+                       dtype=float, count=count)
+    return scores * np.power(1.0 - rates, np.maximum(days, 0.0))
+
+
+def decayed_score_column(now: datetime = None, dialect: str = None):
+    """
+    SQL expression for TopicMastery's score as of ``now``, for bulk reads
+    (averages, thresholds) that must not rewrite rows
+
+    Dialects without known day arithmetic read the stored score.
+    """
+    now = literal(now or datetime.utcnow(), DateTime)
+    dialect = dialect or db.session.get_bind().dialect.name
+    if dialect == "sqlite":
+        days = cast(func.julianday(now) - func.julianday(TopicMastery.last_updated), Integer)
+    elif dialect == "postgresql":
+        days = func.floor(func.extract("epoch", now - TopicMastery.last_updated) / 86400)
+    else:
+        return TopicMastery.mastery_score
+    rate = case(
+        *((TopicMastery.mastery_level == level, rate) for level, rate in DECAY_RATES.items()),
+        else_=DEFAULT_DECAY_RATE
+    )
+    days = func.coalesce(days, 0)
+    return TopicMastery.mastery_score * func.power(1.0 - rate, case((days > 0, days), else_=0))
+
+
+def _states(session) -> Dict[Tuple[int, str], MasteryState]:
+    """States read or written in the current transaction"""
+    return session.info.setdefault("mastery_states", {})
+
+
+def _from_row(user_id: int, topic: str, row) -> MasteryState:
+    return MasteryState(user_id, topic, *row) if row is not None else MasteryState(user_id, topic)
+
+
+def get_mastery(user_id: int, topic: str) -> MasteryState:
+    """Current mastery of one topic (a fresh state if never recorded)"""
+    states = _states(db.session)
+    state = states.get((user_id, topic))
+    if state is None:
+        row = db.session.query(*(getattr(TopicMastery, column) for column in STATE_COLUMNS))\
+            .filter(TopicMastery.user_id == user_id, TopicMastery.topic == topic).first()
+        state = states[(user_id, topic)] = _from_row(user_id, topic, row)
+    return state.copy()
+
+
+def get_user_mastery(user_id: int, topics: Iterable[str] = None, decay: bool = True,
+                     now: datetime = None) -> Dict[str, MasteryState]:
+    """
+    Recorded mastery of all (or the given) topics of a user, in one query
+
+    With ``decay`` the scores are as of ``now`` (levels follow the decayed
+    score); otherwise they are the stored values.
+    """
+    query = db.session.query(TopicMastery.topic, *(getattr(TopicMastery, column) for column in STATE_COLUMNS))\
+        .filter(TopicMastery.user_id == user_id)
+    if topics is not None:
+        topics = list(topics)
+        if not topics:
+            return {}
+        query = query.filter(TopicMastery.topic.in_(topics))
+    mastery = {row[0]: _from_row(user_id, row[0], row[1:]) for row in query}
+
+    # Writes not yet flushed win over the rows just read
+    for (state_user_id, topic), state in db.session.info.get("mastery_pending", {}).items():
+        if state_user_id == user_id and (topics is None or topic in topics):
+            mastery[topic] = state.copy()
+
+    if decay and mastery:
+        states = list(mastery.values())
+        for state, score in zip(states, decay_scores(states, now).tolist()):
+            state.mastery_score = score
+            state.mastery_level = mastery_level(score)
+    return mastery
+
+
+def record_mastery_event(user_id: int, topic: str,
+                         update: Callable[[MasteryState, datetime], None]) -> Tuple[MasteryState, MasteryState]:
+    """
+    Apply one producer's mastery update to a (user, topic)
+
+    ``update(state, now)`` adjusts score, attempts and streak in place; the
+    store clamps the score, derives the level and stamps the time. Events
+    for the same key are merged and written as one UPSERT when the session
+    flushes or commits. Finish with ``commit_mastery()`` so subscribers hear
+    about the new scores.
+
+    Returns:
+        (state before, state after)
+    """
+    session = db.session()
+    states = _states(session)
+    key = (user_id, topic)
+    if key not in states:
+        get_mastery(user_id, topic)
+    state = states[key]
+    before = state.copy()
+
+    now = datetime.utcnow()
+    update(state, now)
+    state.mastery_score = max(0.0, min(100.0, state.mastery_score))
+    state.mastery_level = mastery_level(state.mastery_score)
+    state.last_updated = now
+
+    session.info.setdefault("mastery_pending", {})[key] = state
+    session.info.setdefault("mastery_notify", {})[key] = state.mastery_score
+    return before, state.copy()
+
+
+def write_pending_mastery(session) -> None:
+    """UPSERT every pending (user, topic) state in one statement; safe to call repeatedly"""
+    pending = session.info.pop("mastery_pending", None)
+    if not pending:
+        return
+    rows = [state.as_row() for state in pending.values()]
+    table = TopicMastery.__table__
+    connection = session.connection()
+
+    dialect = connection.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "topic"],
+            set_={column: stmt.excluded[column] for column in STATE_COLUMNS},
+        )
+        connection.execute(stmt)
+    else:
+        for row in rows:
+            values = {column: row[column] for column in STATE_COLUMNS}
+            result = connection.execute(table.update().where(
+                table.c.user_id == row["user_id"], table.c.topic == row["topic"]
+            ).values(**values))
+            if not result.rowcount:
+                connection.execute(table.insert().values(**row))
+
+    session.info.setdefault("mastery_written_users", set()).update(user_id for user_id, _ in pending)
+
+
+def commit_mastery() -> None:
+    """Commit the session, then publish one update per (user, topic) changed since the last publish"""
+    notify = db.session.info.pop("mastery_notify", None)
+    db.session.commit()
+    for (user_id, topic), score in (notify or {}).items():
+        publish_mastery_update(user_id, topic, score)
+
+
+@event.listens_for(Engine, "connect")
+def _sqlite_power(dbapi_connection, connection_record):
+    # SQLite builds without math functions lack power(), which decayed_score_column needs
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    try:
+        dbapi_connection.execute("SELECT power(1, 1)")
+    except sqlite3.OperationalError:
+        dbapi_connection.create_function(
+            "power", 2, lambda base, exponent: None if base is None or exponent is None else base ** exponent
+        )
+
+
+# ----- write coalescing: pending states go out with the next flush or commit -----
+
+@event.listens_for(Session, "before_flush")
+def _write_before_flush(session, flush_context, instances):
+    write_pending_mastery(session)
+
+
+@event.listens_for(Session, "before_commit")
+def _write_before_commit(session):
+    write_pending_mastery(session)
+
+
+@event.listens_for(Session, "after_commit")
+def _forget_states(session):
+    session.info.pop("mastery_states", None)
+    session.info.pop("mastery_written_users", None)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session):
+    for key in ("mastery_states", "mastery_pending", "mastery_notify", "mastery_written_users"):
+        session.info.pop(key, None)
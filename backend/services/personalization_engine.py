@@ -1,10 +1,12 @@
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 from ..models import (
-    TopicMastery, PerformanceLog, EmotionLog, LearningStyle,
+    PerformanceLog, LearningStyle,
     Content, User, UserXP, UserStreak
 )
 from .. import db
+from .emotion_rollup import get_emotion_buckets
+from .mastery_store import MasteryState, commit_mastery, decayed_score, get_user_mastery, record_mastery_event
 
 
 class PersonalizationEngine:
@@ -29,7 +31,7 @@ class PersonalizationEngine:
         }
     
     def update_mastery_profile(self, user_id: int, topic: str, 
-                             performance_score: float, emotion_hint: str = None) -> Dict:
+                             performance_score: float, emotion_hint: str = None, commit: bool = True) -> Dict:
         """
         Update user's mastery profile based on performance and emotion
         
@@ -38,63 +40,45 @@ class PersonalizationEngine:
             topic: Topic name
             performance_score: Performance score (0.0 to 1.0)
             emotion_hint: Detected emotion
+            commit: Commit now; otherwise the caller finishes with commit_mastery()
             
         Returns:
             Dictionary with updated mastery data
         """
-        # Get or create topic mastery record
-        topic_mastery = TopicMastery.query.filter_by(
-            user_id=user_id, 
-            topic=topic
-        ).first()
-        
-        if not topic_mastery:
-            topic_mastery = TopicMastery(
-                user_id=user_id,
-                topic=topic,
-                mastery_score=0.0,
-                total_attempts=0,
-                correct_attempts=0,
-                streak_count=0,
-                mastery_level="beginner"
-            )
-            db.session.add(topic_mastery)
-        
         # Apply emotion-based adjustment
         emotion_multiplier = self.emotion_weights.get(emotion_hint, 1.0) if emotion_hint else 1.0
         adjusted_score = performance_score * emotion_multiplier
         
-        # Update mastery score using weighted average
-        total_attempts = topic_mastery.total_attempts + 1
-        correct_attempts = topic_mastery.correct_attempts + (1 if adjusted_score >= 0.6 else 0)
-        
-        # Calculate new mastery score
-        if total_attempts == 1:
-            new_mastery = adjusted_score * 100
-        else:
-            # Weighted average with recent performance having more weight
-            recent_weight = 0.3
-            historical_weight = 0.7
+        def update(topic_mastery: MasteryState, now: datetime):
+            # Update mastery score using weighted average
+            total_attempts = topic_mastery.total_attempts + 1
             
-            new_mastery = (adjusted_score * 100 * recent_weight) + \
-                         (topic_mastery.mastery_score * historical_weight)
-        
-        # Update mastery record
-        topic_mastery.mastery_score = min(100.0, max(0.0, new_mastery))
-        topic_mastery.total_attempts = total_attempts
-        topic_mastery.correct_attempts = correct_attempts
-        topic_mastery.last_updated = datetime.utcnow()
-        
-        # Update streak count
-        if adjusted_score >= 0.6:
-            topic_mastery.streak_count += 1
-        else:
-            topic_mastery.streak_count = 0
+            # Calculate new mastery score
+            if total_attempts == 1:
+                new_mastery = adjusted_score * 100
+            else:
+                # Weighted average with recent performance having more weight;
+                # the history has decayed since it was last stored
+                recent_weight = 0.3
+                historical_weight = 0.7
+                
+                new_mastery = (adjusted_score * 100 * recent_weight) + \
+                             (decayed_score(topic_mastery, now) * historical_weight)
+            
+            topic_mastery.mastery_score = new_mastery
+            topic_mastery.total_attempts = total_attempts
+            topic_mastery.correct_attempts += 1 if adjusted_score >= 0.6 else 0
+            
+            # Update streak count
+            if adjusted_score >= 0.6:
+                topic_mastery.streak_count += 1
+            else:
+                topic_mastery.streak_count = 0
         
-        # Update mastery level
-        topic_mastery.mastery_level = self._get_mastery_level(topic_mastery.mastery_score)
+        _, topic_mastery = record_mastery_event(user_id, topic, update)
         
-        db.session.commit()
+        if commit:
+            commit_mastery()
         
         return {
             "topic": topic,
@@ -106,17 +90,6 @@ class PersonalizationEngine:
             "emotion_adjustment": emotion_multiplier
         }
     
-    def _get_mastery_level(self, mastery_score: float) -> str:
-        """Get mastery level based on score"""
-        if mastery_score >= self.mastery_thresholds["expert"]:
-            return "expert"
-        elif mastery_score >= self.mastery_thresholds["strong"]:
-            return "strong"
-        elif mastery_score >= self.mastery_thresholds["improving"]:
-            return "improving"
-        else:
-            return "weak"
-    
     def get_learning_insights(self, user_id: int) -> Dict:
         """
         Get comprehensive learning insights for user
@@ -128,7 +101,7 @@ class PersonalizationEngine:
             Dictionary with learning insights
         """
         # Get topic mastery data
-        topic_masteries = TopicMastery.query.filter_by(user_id=user_id).all()
+        topic_masteries = get_user_mastery(user_id).values()
         
         # Categorize topics
         weak_topics = []
@@ -243,28 +216,25 @@ class PersonalizationEngine:
         }
     
     def _analyze_emotion_patterns(self, user_id: int) -> Dict:
-        """Analyze emotion patterns from recent logs"""
-        recent_emotions = EmotionLog.query.filter(
-            EmotionLog.user_id == user_id,
-            EmotionLog.timestamp >= datetime.utcnow() - timedelta(days=7)
-        ).order_by(EmotionLog.timestamp.desc()).all()
+        """Analyze emotion patterns from the last week's per-minute rollups"""
+        buckets = get_emotion_buckets(user_id, datetime.utcnow() - timedelta(days=7))
         
-        if not recent_emotions:
+        if not buckets:
             return {"dominant_emotion": "neutral", "emotion_distribution": {}, "trend": "no_data"}
         
         # Count emotions
         emotion_counts = {}
-        for emotion_log in recent_emotions:
-            emotion = emotion_log.emotion
-            emotion_counts[emotion] = emotion_counts.get(emotion, 0) + 1
+        for bucket in buckets:
+            emotion_counts[bucket.emotion] = emotion_counts.get(bucket.emotion, 0) + bucket.sample_count
+        total_logs = sum(emotion_counts.values())
         
         # Find dominant emotion
         dominant_emotion = max(emotion_counts, key=emotion_counts.get) if emotion_counts else "neutral"
         
-        # Calculate emotion trend (simplified)
-        if len(recent_emotions) >= 5:
-            recent_emotions_list = [log.emotion for log in recent_emotions[:3]]
-            older_emotions_list = [log.emotion for log in recent_emotions[-3:]]
+        # Calculate emotion trend (simplified): compare the newest and oldest minutes
+        if total_logs >= 5:
+            recent_emotions_list = [bucket.emotion for bucket in buckets[:3]]
+            older_emotions_list = [bucket.emotion for bucket in buckets[-3:]]
             
             positive_emotions = ["happy", "confident", "excited"]
             recent_positive = sum(1 for e in recent_emotions_list if e in positive_emotions)
@@ -283,7 +253,7 @@ class PersonalizationEngine:
             "dominant_emotion": dominant_emotion,
             "emotion_distribution": emotion_counts,
             "trend": trend,
-            "total_logs": len(recent_emotions)
+            "total_logs": total_logs
         }
     
     def _generate_recommendations(self, weak_topics: List, improving_topics: List, 
@@ -340,17 +310,11 @@ class PersonalizationEngine:
             List of custom exercise recommendations
         """
         # Get user's weak topics
-        if topic:
-            weak_topics = TopicMastery.query.filter(
-                TopicMastery.user_id == user_id,
-                TopicMastery.topic == topic,
-                TopicMastery.mastery_score < self.mastery_thresholds["weak"]
-            ).all()
-        else:
-            weak_topics = TopicMastery.query.filter(
-                TopicMastery.user_id == user_id,
-                TopicMastery.mastery_score < self.mastery_thresholds["weak"]
-            ).all()
+        masteries = get_user_mastery(user_id, [topic] if topic else None)
+        weak_topics = [
+            mastery for mastery in masteries.values()
+            if mastery.mastery_score < self.mastery_thresholds["weak"]
+        ]
         
         if not weak_topics:
             return []
@@ -421,10 +385,10 @@ class PersonalizationEngine:
             Dictionary with revision schedule
         """
         # Get topics that need review (mastery < 80%)
-        review_topics = TopicMastery.query.filter(
-            TopicMastery.user_id == user_id,
-            TopicMastery.mastery_score < 80.0
-        ).order_by(TopicMastery.mastery_score.asc()).all()
+        review_topics = sorted(
+            (mastery for mastery in get_user_mastery(user_id).values() if mastery.mastery_score < 80.0),
+            key=lambda mastery: mastery.mastery_score
+        )
         
         # Get revision schedules
         from ..models import RevisionSchedule
@@ -0,0 +1,184 @@
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Set
+import logging
+
+from sqlalchemy import literal, select, union_all
+
+from .. import db
+from ..models import (
+    Chapter, QuestTaskCompletion, StoryChapterCompletion, StoryProgress, StoryQuest,
+    StoryQuestCompletion, UserQuest
+)
+
+logger = logging.getLogger(__name__)
+
+# Rows per insert statement, kept well under SQLite's bound-parameter limit
+INSERT_CHUNK = 500
+
+
+def insert_memberships(model, rows: List[Dict]) -> int:
+    """INSERT .. ON CONFLICT DO NOTHING on the primary key; returns rows inserted. The caller commits."""
+    keys = [column.name for column in model.__table__.primary_key.columns]
+    rows = list({tuple(row[key] for key in keys): row for row in rows}.values())
+    if not rows:
+        return 0
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        inserted = 0
+        for i in range(0, len(rows), INSERT_CHUNK):
+            result = db.session.execute(insert(model.__table__).values(rows[i:i + INSERT_CHUNK]).on_conflict_do_nothing())
+            inserted += max(result.rowcount or 0, 0)
+        return inserted
+
+    inserted = 0
+    for row in rows:
+        if db.session.get(model, tuple(row[key] for key in keys)) is None:
+            db.session.add(model(**row))
+            inserted += 1
+    return inserted
+
+
+# ----- quest tasks -----
+
+def complete_quest_tasks(user_id: int, quest_id: int, task_ids: Iterable[str]) -> int:
+    """Mark tasks of a user's quest completed; returns how many were new. The caller commits."""
+    now = datetime.utcnow()
+    return insert_memberships(QuestTaskCompletion, [
+        {"user_id": user_id, "quest_id": quest_id, "task_id": task_id, "completed_at": now}
+        for task_id in task_ids
+    ])
+
+
+def count_completed_tasks(user_id: int, quest_id: int) -> int:
+    return db.session.query(db.func.count()).select_from(QuestTaskCompletion).filter(
+        QuestTaskCompletion.user_id == user_id, QuestTaskCompletion.quest_id == quest_id
+    ).scalar() or 0
+
+
+def get_completed_tasks(user_id: int, quest_ids: Iterable[int]) -> Dict[int, List[str]]:
+    """Completed task ids per quest, in completion order, in one query"""
+    quest_ids = set(quest_ids)
+    if not quest_ids:
+        return {}
+    rows = db.session.query(QuestTaskCompletion.quest_id, QuestTaskCompletion.task_id).filter(
+        QuestTaskCompletion.user_id == user_id, QuestTaskCompletion.quest_id.in_(quest_ids)
+    ).order_by(QuestTaskCompletion.completed_at, QuestTaskCompletion.task_id)
+    completed: Dict[int, List[str]] = {}
+    for quest_id, task_id in rows:
+        completed.setdefault(quest_id, []).append(task_id)
+    return completed
+
+
+# ----- story quests and chapters -----
+
+class StoryCompletions:
+    """A user's completed quests and chapters of one story, in completion order"""
+
+    def __init__(self, quest_ids: Iterable[int] = (), chapter_ids: Iterable[int] = ()):
+        self.quest_ids = list(quest_ids)
+        self.chapter_ids = list(chapter_ids)
+        self.quests = set(self.quest_ids)
+        self.chapters = set(self.chapter_ids)
+
+    def add_quest(self, quest_id: int):
+        if quest_id not in self.quests:
+            self.quests.add(quest_id)
+            self.quest_ids.append(quest_id)
+
+    def add_chapter(self, chapter_id: int):
+        if chapter_id not in self.chapters:
+            self.chapters.add(chapter_id)
+            self.chapter_ids.append(chapter_id)
+
+
+def load_story_completions(user_id: int, story_id: int) -> StoryCompletions:
+    """Completed quests and chapters of a story in one query"""
+    quests = select(literal("quest"), StoryQuestCompletion.quest_id, StoryQuestCompletion.completed_at).where(
+        StoryQuestCompletion.user_id == user_id, StoryQuestCompletion.story_id == story_id
+    )
+    chapters = select(literal("chapter"), StoryChapterCompletion.chapter_id, StoryChapterCompletion.completed_at).where(
+        StoryChapterCompletion.user_id == user_id, StoryChapterCompletion.story_id == story_id
+    )
+    completions = StoryCompletions()
+    for kind, item_id, _ in sorted(db.session.execute(union_all(quests, chapters)), key=lambda row: (row[2], row[1])):
+        if kind == "quest":
+            completions.add_quest(item_id)
+        else:
+            completions.add_chapter(item_id)
+    return completions
+
+
+def completed_story_quests(user_id: int, quest_ids: Iterable[int]) -> Set[int]:
+    """Which of these story quests the user has completed, by primary-key probes"""
+    quest_ids = set(quest_ids)
+    if not quest_ids:
+        return set()
+    return {quest_id for (quest_id,) in db.session.query(StoryQuestCompletion.quest_id).filter(
+        StoryQuestCompletion.user_id == user_id, StoryQuestCompletion.quest_id.in_(quest_ids)
+    )}
+
+
+def complete_story_quest(user_id: int, story_id: int, quest_id: int) -> bool:
+    """Record a completed story quest; False if it already was. The caller commits."""
+    return insert_memberships(StoryQuestCompletion, [
+        {"user_id": user_id, "quest_id": quest_id, "story_id": story_id, "completed_at": datetime.utcnow()}
+    ]) > 0
+
+
+def complete_story_chapter(user_id: int, story_id: int, chapter_id: int) -> bool:
+    """Record a completed story chapter; False if it already was. The caller commits."""
+    return insert_memberships(StoryChapterCompletion, [
+        {"user_id": user_id, "chapter_id": chapter_id, "story_id": story_id, "completed_at": datetime.utcnow()}
+    ]) > 0
+
+
+# ----- migration of the legacy JSON lists -----
+
+def backfill_progress_memberships(chunk_size: int = 1000) -> int:
+    """Copy the JSON progress lists into the membership tables when those are empty"""
+    for model in (QuestTaskCompletion, StoryQuestCompletion, StoryChapterCompletion):
+        if db.session.query(model).first() is not None:
+            return 0
+
+    now = datetime.utcnow()
+
+    # Microsecond offsets keep each list's order
+    task_rows = []
+    user_quests = db.session.query(
+        UserQuest.user_id, UserQuest.quest_id, UserQuest.completed_tasks, UserQuest.updated_at
+    ).yield_per(chunk_size)
+    for user_id, quest_id, task_ids, updated_at in user_quests:
+        for position, task_id in enumerate(task_ids or []):
+            task_rows.append({"user_id": user_id, "quest_id": quest_id, "task_id": str(task_id),
+                              "completed_at": (updated_at or now) + timedelta(microseconds=position)})
+
+    # Completions of quests and chapters that no longer exist are dropped
+    quest_ids = {quest_id for (quest_id,) in db.session.query(StoryQuest.id)}
+    chapter_ids = {chapter_id for (chapter_id,) in db.session.query(Chapter.id)}
+    quest_rows, chapter_rows = [], []
+    progress = db.session.query(
+        StoryProgress.user_id, StoryProgress.story_id, StoryProgress.completed_quests,
+        StoryProgress.completed_chapters, StoryProgress.last_updated
+    ).yield_per(chunk_size)
+    for user_id, story_id, completed_quests, completed_chapters, last_updated in progress:
+        for position, quest_id in enumerate(completed_quests or []):
+            if quest_id in quest_ids:
+                quest_rows.append({"user_id": user_id, "quest_id": quest_id, "story_id": story_id,
+                                   "completed_at": (last_updated or now) + timedelta(microseconds=position)})
+        for position, chapter_id in enumerate(completed_chapters or []):
+            if chapter_id in chapter_ids:
+                chapter_rows.append({"user_id": user_id, "chapter_id": chapter_id, "story_id": story_id,
+                                     "completed_at": (last_updated or now) + timedelta(microseconds=position)})
+
+    written = insert_memberships(QuestTaskCompletion, task_rows)
+    written += insert_memberships(StoryQuestCompletion, quest_rows)
+    written += insert_memberships(StoryChapterCompletion, chapter_rows)
+    if written:
+        db.session.commit()
+        logger.info(f"Migrated {written} progress list entries into membership tables")
+    return written
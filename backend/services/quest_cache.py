@@ -0,0 +1,90 @@
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from ..models import Quest, UserBadge, UserQuest
+
+
+class QuestAvailabilityCache:
+    """
+    Per-user cache of computed quest availability
+
+    Entries are dropped when the user's quests or badges change, and all of
+    them when any quest definition changes. ``ttl_seconds`` bounds staleness
+    from writes made by other processes. A result computed while an
+    invalidation happened is not stored (generation check).
+    """
+
+    def __init__(self, ttl_seconds: float = 300.0, max_users: int = 4096):
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        self._entries: "OrderedDict[Hashable, Tuple[float, List[Dict]]]" = OrderedDict()
+        self._user_generations: Dict[Hashable, int] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def generation(self, user_id: Hashable) -> Tuple[int, int]:
+        with self._lock:
+            return self._generation, self._user_generations.get(user_id, 0)
+
+    def get(self, user_id: Hashable) -> Optional[List[Dict]]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def put(self, user_id: Hashable, quests: List[Dict], generation: Tuple[int, int]):
+        with self._lock:
+            if generation != (self._generation, self._user_generations.get(user_id, 0)):
+                return
+            self._entries[user_id] = (time.monotonic() + self.ttl_seconds, quests)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: Hashable):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._user_generations[user_id] = self._user_generations.get(user_id, 0) + 1
+
+    def invalidate_all(self):
+        with self._lock:
+            self._entries.clear()
+            self._user_generations.clear()
+            self._generation += 1
+
+
+quest_availability_cache = QuestAvailabilityCache()
+
+
+# ----- invalidation: applied once the quest or badge write commits -----
+
+@event.listens_for(Session, "after_flush")
+def _collect_quest_writes(session, flush_context):
+    pending = session.info.setdefault("quest_cache_users", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Quest):
+            session.info["quest_cache_all"] = True
+        elif isinstance(obj, (UserQuest, UserBadge)):
+            pending.add(obj.user_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_quest_invalidations(session):
+    users = session.info.pop("quest_cache_users", None)
+    if session.info.pop("quest_cache_all", False):
+        quest_availability_cache.invalidate_all()
+    for user_id in users or ():
+        quest_availability_cache.invalidate_user(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_quest_invalidations(session):
+    session.info.pop("quest_cache_users", None)
+    session.info.pop("quest_cache_all", None)
@@ -1,10 +1,28 @@
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
+import hashlib
+import json
+
+from sqlalchemy.exc import IntegrityError
+
 from ..models import (
     Quest, UserQuest, UserXP, UserBadge, Badge, 
-    TopicMastery, PerformanceLog, EmotionLog, User
+    TopicMastery, PerformanceLog, EmotionLog, User, QuestTaskWatch, QuestTaskCompletion
 )
-from .. import db
+from .. import db, socketio
+from .activity_counters import record_quest_completed
+from .mastery_events import subscribe
+from .mastery_store import decayed_score_column
+from .progress_membership import complete_quest_tasks, count_completed_tasks, get_completed_tasks
+from .quest_cache import quest_availability_cache
+from .xp_ledger import xp_ledger
+
+# Generated quests cover a user's first few topics below this mastery
+WEAK_MASTERY_THRESHOLD = 40.0
+TOPICS_PER_QUEST = 3
+
+# Rows per bulk statement during quest generation
+GENERATION_CHUNK = 500
 
 
 class QuestEngine:
@@ -38,59 +56,186 @@ class QuestEngine:
     
     def generate_quest_from_weaknesses(self, user_id: int) -> Optional[Quest]:
         """
-        Generate a quest based on user's weak topics
+        Assign the user the shared quest for their weak topics
         
         Args:
             user_id: User ID
             
         Returns:
-            Generated Quest or None if no weaknesses found
+            The assigned Quest or None if no weaknesses found
         """
-        # Get user's weak topics (mastery < 40%)
-        weak_topics = TopicMastery.query.filter(
-            TopicMastery.user_id == user_id,
-            TopicMastery.mastery_score < 40.0
-        ).all()
-        
-        if not weak_topics:
+        topics = self._weak_topic_sets(user_id).get(user_id)
+        if not topics:
             return None
         
-        # Select 2-3 weak topics for the quest
-        selected_topics = weak_topics[:3] if len(weak_topics) >= 3 else weak_topics
+        template = self._quest_template(topics)
+        quest_id = self._get_or_create_templates({template["template_key"]: template})[template["template_key"]]
         
-        # Choose a story theme
-        theme = self._select_theme_for_topics(selected_topics)
+        if not UserQuest.query.filter_by(user_id=user_id, quest_id=quest_id).first():
+            db.session.add(UserQuest(
+                user_id=user_id,
+                quest_id=quest_id,
+                status="available",
+                progress_percentage=0.0,
+                current_task_index=0
+            ))
+        db.session.commit()
+        
+        return Quest.query.get(quest_id)
+    
+    def assign_weakness_quests(self) -> int:
+        """
+        Assign every user the shared quest for their current weak topics
+        
+        Weak-topic sets come from one aggregate query; users with equal sets
+        share one quest template. Assignments are bulk inserted, unstarted
+        assignments of other templates are dropped, and templates nobody holds
+        any more are deleted.
+        
+        Returns:
+            Number of new assignments
+        """
+        templates, wanted = {}, {}
+        for user_id, topics in self._weak_topic_sets().items():
+            template = self._quest_template(topics)
+            templates.setdefault(template["template_key"], template)
+            wanted[user_id] = template["template_key"]
+        template_ids = self._get_or_create_templates(templates)
+        wanted = {user_id: template_ids[key] for user_id, key in wanted.items()}
+        
+        assigned = db.session.query(UserQuest.id, UserQuest.user_id, UserQuest.quest_id, UserQuest.status)\
+            .join(Quest, UserQuest.quest_id == Quest.id)\
+            .filter(Quest.template_key.isnot(None)).all()
+        held = {(user_id, quest_id) for _, user_id, quest_id, _ in assigned}
+        stale = [(user_quest_id, user_id) for user_quest_id, user_id, quest_id, status in assigned
+                 if status == "available" and wanted.get(user_id) != quest_id]
+        
+        now = datetime.utcnow()
+        rows = [
+            {
+                "user_id": user_id,
+                "quest_id": quest_id,
+                "status": "available",
+                "progress_percentage": 0.0,
+                "current_task_index": 0,
+                "xp_earned": 0,
+                "created_at": now,
+                "updated_at": now
+            }
+            for user_id, quest_id in wanted.items() if (user_id, quest_id) not in held
+        ]
+        
+        user_quests = UserQuest.__table__
+        stale_ids = [user_quest_id for user_quest_id, _ in stale]
+        for i in range(0, len(stale_ids), GENERATION_CHUNK):
+            db.session.execute(user_quests.delete().where(user_quests.c.id.in_(stale_ids[i:i + GENERATION_CHUNK])))
+        for i in range(0, len(rows), GENERATION_CHUNK):
+            db.session.execute(user_quests.insert(), rows[i:i + GENERATION_CHUNK])
+        
+        quests = Quest.__table__
+        db.session.execute(quests.delete().where(
+            quests.c.template_key.isnot(None),
+            ~quests.c.id.in_(db.select(user_quests.c.quest_id))
+        ))
+        db.session.commit()
+        
+        # Core statements bypass the session hooks, so invalidate here
+        for user_id in {row["user_id"] for row in rows} | {user_id for _, user_id in stale}:
+            quest_availability_cache.invalidate_user(user_id)
+        
+        return len(rows)
+    
+    def _weak_topic_sets(self, user_id: int = None) -> Dict[int, List]:
+        """Each user's first few weak topics (decayed mastery < 40%), for all users in one query"""
+        mastery_score = decayed_score_column()
+        position = db.func.row_number().over(
+            partition_by=TopicMastery.user_id, order_by=TopicMastery.id
+        ).label("position")
+        ranked = db.session.query(
+            TopicMastery.user_id, TopicMastery.topic, mastery_score.label("mastery_score"), position
+        ).filter(mastery_score < WEAK_MASTERY_THRESHOLD)
+        if user_id is not None:
+            ranked = ranked.filter(TopicMastery.user_id == user_id)
+        ranked = ranked.subquery()
+        
+        rows = db.session.query(ranked.c.user_id, ranked.c.topic, ranked.c.mastery_score)\
+            .filter(ranked.c.position <= TOPICS_PER_QUEST)\
+            .order_by(ranked.c.user_id, ranked.c.position)
+        
+        weak_topics = {}
+        for row in rows:
+            weak_topics.setdefault(row.user_id, []).append(row)
+        return weak_topics
+    
+    def _quest_template(self, topics: List) -> Dict:
+        """Quest fields for a weak-topic set; equal topic names and difficulty give equal templates"""
+        topics = sorted(topics, key=lambda topic: topic.topic)
         
-        # Generate quest content
-        quest_title = self._generate_quest_title(theme, selected_topics)
-        quest_description = self._generate_quest_description(theme, selected_topics)
+        # Choose a story theme
+        theme = self._select_theme_for_topics(topics)
         
         # Create required tasks
-        required_tasks = self._generate_quest_tasks(selected_topics, theme)
+        required_tasks = self._generate_quest_tasks(topics, theme)
         
         # Calculate rewards based on difficulty
-        difficulty = self._calculate_difficulty(selected_topics)
-        xp_reward = int(100 * self.difficulty_multipliers[difficulty])
-        
-        # Create the quest
-        quest = Quest(
-            title=quest_title,
-            description=quest_description,
-            story_theme=theme,
-            difficulty=difficulty,
-            category="mastery",
-            required_topics=[topic.topic for topic in selected_topics],
-            required_tasks=required_tasks,
-            xp_reward=xp_reward,
-            estimated_duration=len(required_tasks) * 2,  # 2 days per task
-            is_active=True,
-            is_repeatable=False
-        )
-        
-        db.session.add(quest)
-        db.session.commit()
+        difficulty = self._calculate_difficulty(topics)
+        topic_names = [topic.topic for topic in topics]
+        
+        return {
+            "template_key": hashlib.sha1(json.dumps([difficulty, topic_names]).encode()).hexdigest(),
+            "title": self._generate_quest_title(theme, topics),
+            "description": self._generate_quest_description(theme, topics),
+            "story_theme": theme,
+            "difficulty": difficulty,
+            "category": "mastery",
+            "required_topics": topic_names,
+            "required_tasks": required_tasks,
+            "xp_reward": int(100 * self.difficulty_multipliers[difficulty]),
+            "estimated_duration": len(required_tasks) * 2,  # 2 days per task
+            "is_active": True,
+            "is_repeatable": False
+        }
+    
+    def _get_or_create_templates(self, templates: Dict[str, Dict]) -> Dict[str, int]:
+        """Quest ids for template keys, inserting the missing templates
         
-        return quest
+        Safe against concurrent generation: a template another request inserted
+        first is skipped (or its IntegrityError rolled back) and read back.
+        """
+        template_ids = self._template_ids(templates)
+        missing = [templates[key] for key in templates if key not in template_ids]
+        if not missing:
+            return template_ids
+        
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            if dialect == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            for i in range(0, len(missing), GENERATION_CHUNK):
+                db.session.execute(insert(Quest.__table__).values(missing[i:i + GENERATION_CHUNK])
+                                   .on_conflict_do_nothing(index_elements=["template_key"]))
+            # Core inserts bypass the quest cache's flush hook
+            db.session.info["quest_cache_all"] = True
+        else:
+            for template in missing:
+                try:
+                    with db.session.begin_nested():
+                        db.session.add(Quest(**template))
+                except IntegrityError:
+                    pass
+        
+        template_ids.update(self._template_ids({template["template_key"] for template in missing}))
+        return template_ids
+    
+    def _template_ids(self, keys) -> Dict[str, int]:
+        keys = list(keys)
+        template_ids = {}
+        for i in range(0, len(keys), GENERATION_CHUNK):
+            template_ids.update(db.session.query(Quest.template_key, Quest.id)
+                                .filter(Quest.template_key.in_(keys[i:i + GENERATION_CHUNK])))
+        return template_ids
     
     def _select_theme_for_topics(self, topics: List[TopicMastery]) -> str:
         """Select appropriate story theme based on topics"""
@@ -213,13 +358,16 @@ class QuestEngine:
                 started_at=datetime.utcnow(),
                 deadline=datetime.utcnow() + timedelta(days=quest.estimated_duration),
                 progress_percentage=0.0,
-                completed_tasks=[],
                 current_task_index=0
             )
             db.session.add(user_quest)
         
+        self._watch_tasks(user_id, quest, get_completed_tasks(user_id, [quest_id]).get(quest_id, []))
         db.session.commit()
         
+        # Tasks whose topic is already at target complete straight away
+        self.progress_mastery_tasks(user_id, quest_id=quest_id)
+        
         return {
             "success": True,
             "quest_id": quest_id,
@@ -230,30 +378,23 @@ class QuestEngine:
     
     def _check_prerequisites(self, user_id: int, prerequisites: Dict) -> bool:
         """Check if user meets quest prerequisites"""
-        # Check required badges
-        if "badges" in prerequisites:
-            required_badges = prerequisites["badges"]
-            user_badges = UserBadge.query.filter_by(user_id=user_id).all()
-            user_badge_ids = [ub.badge_id for ub in user_badges]
-            
-            for badge_id in required_badges:
-                if badge_id not in user_badge_ids:
-                    return False
-        
-        # Check required quests
-        if "quests" in prerequisites:
-            required_quests = prerequisites["quests"]
-            completed_quests = UserQuest.query.filter(
-                UserQuest.user_id == user_id,
-                UserQuest.status == "completed"
-            ).all()
-            completed_quest_ids = [uq.quest_id for uq in completed_quests]
-            
-            for quest_id in required_quests:
-                if quest_id not in completed_quest_ids:
-                    return False
-        
-        return True
+        badge_ids, completed_quest_ids = self._prerequisite_sets(user_id)
+        return self._prerequisites_met(prerequisites, badge_ids, completed_quest_ids)
+    
+    def _prerequisite_sets(self, user_id: int) -> Tuple[set, set]:
+        """The user's earned badge ids and completed quest ids"""
+        badge_ids = {badge_id for (badge_id,) in
+                     db.session.query(UserBadge.badge_id).filter(UserBadge.user_id == user_id)}
+        completed_quest_ids = {quest_id for (quest_id,) in db.session.query(UserQuest.quest_id).filter(
+            UserQuest.user_id == user_id, UserQuest.status == "completed")}
+        return badge_ids, completed_quest_ids
+    
+    @staticmethod
+    def _prerequisites_met(prerequisites: Optional[Dict], badge_ids: set, completed_quest_ids: set) -> bool:
+        if not prerequisites:
+            return True
+        return (set(prerequisites.get("badges", [])) <= badge_ids
+                and set(prerequisites.get("quests", [])) <= completed_quest_ids)
     
     def complete_quest_task(self, user_id: int, quest_id: int, task_id: str, 
                           completion_data: Dict) -> Dict:
@@ -281,18 +422,15 @@ class QuestEngine:
         if not quest:
             return {"error": "Quest not found"}
         
-        # Check if task is already completed
-        completed_tasks = user_quest.completed_tasks or []
-        if task_id in completed_tasks:
+        # Record the task; nothing is inserted if it was already completed
+        if not complete_quest_tasks(user_id, quest_id, [task_id]):
             return {"error": "Task already completed"}
-        
-        # Add task to completed list
-        completed_tasks.append(task_id)
-        user_quest.completed_tasks = completed_tasks
+        QuestTaskWatch.query.filter_by(user_id=user_id, quest_id=quest_id, task_id=task_id)\
+            .delete(synchronize_session=False)
         
         # Update progress
         total_tasks = len(quest.required_tasks)
-        completed_count = len(completed_tasks)
+        completed_count = count_completed_tasks(user_id, quest_id)
         progress_percentage = (completed_count / total_tasks) * 100
         user_quest.progress_percentage = progress_percentage
         
@@ -325,6 +463,8 @@ class QuestEngine:
         user_quest.status = "completed"
         user_quest.completed_at = datetime.utcnow()
         user_quest.progress_percentage = 100.0
+        record_quest_completed(user_id)
+        QuestTaskWatch.query.filter_by(user_id=user_id, quest_id=quest_id).delete(synchronize_session=False)
         
         # Award quest completion XP
         quest_xp = quest.xp_reward
@@ -364,68 +504,123 @@ class QuestEngine:
         
         db.session.commit()
         
+        # Quest-count badges, plus XP/level badges unlocked by the quest reward
+        from .gamification_service import GamificationService
+        new_badges = GamificationService().check_and_award_badges(user_id, triggers=("quest", "xp", "level"))
+        
         return {
             "success": True,
             "quest_completed": True,
             "quest_id": quest_id,
             "xp_earned": quest_xp,
             "badge_earned": badge_earned,
+            "new_badges": new_badges,
             "completion_time": user_quest.completed_at.isoformat()
         }
     
-    def _award_xp(self, user_id: int, amount: int, source: str, source_id: int, description: str):
-        """Award XP to user and update level"""
-        # Get or create user XP profile
-        user_xp = UserXP.query.filter_by(user_id=user_id).first()
-        if not user_xp:
-            user_xp = UserXP(user_id=user_id)
-            db.session.add(user_xp)
-        
-        # Add XP
-        user_xp.total_xp += amount
-        user_xp.xp_in_current_level += amount
-        
-        # Check for level up
-        levels_gained = 0
-        while user_xp.xp_in_current_level >= user_xp.xp_to_next_level:
-            user_xp.xp_in_current_level -= user_xp.xp_to_next_level
-            user_xp.current_level += 1
-            levels_gained += 1
+    def _watch_tasks(self, user_id: int, quest: Quest, completed_tasks: List[str]):
+        """Index the quest's open mastery tasks by topic; the caller commits"""
+        QuestTaskWatch.query.filter_by(user_id=user_id, quest_id=quest.id).delete(synchronize_session=False)
+        watches = [
+            {
+                "user_id": user_id,
+                "topic": task["topic"],
+                "quest_id": quest.id,
+                "task_id": task["id"],
+                "target_mastery": task.get("target_mastery", 70.0),
+            }
+            for task in quest.required_tasks or []
+            if task.get("type") == "mastery" and task.get("topic") and task["id"] not in completed_tasks
+        ]
+        if watches:
+            db.session.execute(QuestTaskWatch.__table__.insert(), watches)
+    
+    def progress_mastery_tasks(self, user_id: int, topic: str = None, mastery_score: float = None,
+                               quest_id: int = None) -> List[Dict]:
+        """
+        Complete watched mastery tasks whose target the user has reached
+        
+        With ``topic`` and ``mastery_score`` (a mastery update event) only that
+        topic's watches are read; otherwise the watches are joined against the
+        user's current (decayed) TopicMastery scores. Progress is pushed over
+        Socket.IO.
+        
+        Returns:
+            List of complete_quest_task results
+        """
+        query = db.session.query(QuestTaskWatch.quest_id, QuestTaskWatch.task_id)\
+            .filter(QuestTaskWatch.user_id == user_id)
+        if topic is not None:
+            query = query.filter(QuestTaskWatch.topic == topic, QuestTaskWatch.target_mastery <= mastery_score)
+        else:
+            query = query.join(TopicMastery, db.and_(
+                TopicMastery.user_id == QuestTaskWatch.user_id, TopicMastery.topic == QuestTaskWatch.topic
+            )).filter(decayed_score_column() >= QuestTaskWatch.target_mastery)
+        if quest_id is not None:
+            query = query.filter(QuestTaskWatch.quest_id == quest_id)
+        
+        results = []
+        for watched_quest_id, task_id in query.all():
+            result = self.complete_quest_task(user_id, watched_quest_id, task_id, {
+                "auto": True, "topic": topic, "mastery_score": mastery_score
+            })
+            if result.get("error"):
+                continue
+            results.append(result)
             
-            # Calculate XP needed for next level (exponential growth)
-            user_xp.xp_to_next_level = int(100 * (1.2 ** user_xp.current_level))
-        
-        # Record XP transaction
-        transaction = XPTransaction(
-            user_id=user_id,
-            amount=amount,
-            source=source,
-            source_id=source_id,
-            description=description
-        )
-        db.session.add(transaction)
-        
-        return levels_gained
+            socketio.emit('quest_task_completed', {
+                'user_id': user_id,
+                'quest_id': watched_quest_id,
+                'task_id': task_id,
+                'progress_percentage': result.get('progress_percentage', 100.0),
+                'xp_earned': result['xp_earned'],
+                'remaining_tasks': result.get('remaining_tasks', 0),
+                'auto': True
+            }, room=str(user_id))
+            if result.get('quest_completed'):
+                socketio.emit('quest_completed', {
+                    'user_id': user_id,
+                    'quest_id': watched_quest_id,
+                    'xp_earned': result['xp_earned'],
+                    'badge_earned': result.get('badge_earned'),
+                    'completion_time': result['completion_time']
+                }, room=str(user_id))
+        return results
+    
+    def _award_xp(self, user_id: int, amount: int, source: str, source_id: int, description: str):
+        """Award XP to user and update level; the caller commits"""
+        result = xp_ledger.grant(user_id, amount, source, source_id, description, commit=False)
+        return result["levels_gained"]
     
     def get_available_quests(self, user_id: int) -> List[Dict]:
-        """Get quests available to a user"""
-        # Get all active quests
-        active_quests = Quest.query.filter_by(is_active=True).all()
+        """Get quests available to a user (three queries, cached until the user's quests or badges change)"""
+        cached = quest_availability_cache.get(user_id)
+        if cached is not None:
+            return cached
+        generation = quest_availability_cache.generation(user_id)
+        
+        # Active quests with their reward badge, the user's quest states, the user's badges
+        # Generated quests are only listed to the users they are assigned to
+        assigned = db.session.query(UserQuest.quest_id).filter(UserQuest.user_id == user_id)
+        active_quests = db.session.query(Quest, Badge)\
+            .outerjoin(Badge, Quest.badge_reward_id == Badge.id)\
+            .filter(Quest.is_active == True,
+                    db.or_(Quest.template_key.is_(None), Quest.id.in_(assigned))).all()
+        statuses = dict(db.session.query(UserQuest.quest_id, UserQuest.status)
+                        .filter(UserQuest.user_id == user_id))
+        badge_ids = {badge_id for (badge_id,) in
+                     db.session.query(UserBadge.badge_id).filter(UserBadge.user_id == user_id)}
+        completed_quest_ids = {quest_id for quest_id, status in statuses.items() if status == "completed"}
         
         available_quests = []
-        for quest in active_quests:
-            # Check if user already has this quest
-            user_quest = UserQuest.query.filter_by(
-                user_id=user_id, 
-                quest_id=quest.id
-            ).first()
+        for quest, badge in active_quests:
+            status = statuses.get(quest.id)
             
             # Skip if already completed and not repeatable
-            if user_quest and user_quest.status == "completed" and not quest.is_repeatable:
+            if status == "completed" and not quest.is_repeatable:
                 continue
             
-            # Check prerequisites
-            if quest.prerequisites and not self._check_prerequisites(user_id, quest.prerequisites):
+            if not self._prerequisites_met(quest.prerequisites, badge_ids, completed_quest_ids):
                 continue
             
             quest_data = {
@@ -438,32 +633,30 @@ class QuestEngine:
                 "required_topics": quest.required_topics,
                 "xp_reward": quest.xp_reward,
                 "estimated_duration": quest.estimated_duration,
-                "status": user_quest.status if user_quest else "available"
+                "status": status or "available"
             }
             
-            if quest.badge_reward_id:
-                badge = Badge.query.get(quest.badge_reward_id)
-                if badge:
-                    quest_data["badge_reward"] = {
-                        "name": badge.name,
-                        "icon": badge.icon,
-                        "rarity": badge.rarity
-                    }
+            if badge:
+                quest_data["badge_reward"] = {
+                    "name": badge.name,
+                    "icon": badge.icon,
+                    "rarity": badge.rarity
+                }
             
             available_quests.append(quest_data)
         
+        quest_availability_cache.put(user_id, available_quests, generation)
         return available_quests
     
     def get_user_quest_progress(self, user_id: int) -> List[Dict]:
         """Get user's quest progress"""
-        user_quests = UserQuest.query.filter_by(user_id=user_id).all()
+        user_quests = db.session.query(UserQuest, Quest)\
+            .join(Quest, UserQuest.quest_id == Quest.id)\
+            .filter(UserQuest.user_id == user_id).all()
+        completed_tasks = get_completed_tasks(user_id, [quest.id for _, quest in user_quests])
         
         progress_data = []
-        for user_quest in user_quests:
-            quest = Quest.query.get(user_quest.quest_id)
-            if not quest:
-                continue
-            
+        for user_quest, quest in user_quests:
             quest_data = {
                 "id": quest.id,
                 "title": quest.title,
@@ -472,7 +665,7 @@ class QuestEngine:
                 "difficulty": quest.difficulty,
                 "status": user_quest.status,
                 "progress_percentage": user_quest.progress_percentage,
-                "completed_tasks": user_quest.completed_tasks or [],
+                "completed_tasks": completed_tasks.get(quest.id, []),
                 "current_task_index": user_quest.current_task_index,
                 "started_at": user_quest.started_at.isoformat() if user_quest.started_at else None,
                 "deadline": user_quest.deadline.isoformat() if user_quest.deadline else None,
@@ -484,3 +677,32 @@ class QuestEngine:
             progress_data.append(quest_data)
         
         return progress_data
+
+@subscribe
+def _progress_quests_on_mastery(user_id: int, topic: str, mastery_score: float):
+    """Advance only the quests watching this topic when its mastery changes"""
+    try:
+        QuestEngine().progress_mastery_tasks(user_id, topic, mastery_score)
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def backfill_quest_task_watches() -> int:
+    """Index open mastery tasks of active quests when the watch table is empty"""
+    if QuestTaskWatch.query.first() is not None:
+        return 0
+    engine = QuestEngine()
+    rows = db.session.query(UserQuest, Quest).join(Quest, UserQuest.quest_id == Quest.id)\
+        .filter(UserQuest.status == "active").all()
+    completed = {}
+    for user_id, quest_id, task_id in db.session.query(
+        QuestTaskCompletion.user_id, QuestTaskCompletion.quest_id, QuestTaskCompletion.task_id
+    ).join(UserQuest, db.and_(
+        UserQuest.user_id == QuestTaskCompletion.user_id, UserQuest.quest_id == QuestTaskCompletion.quest_id
+    )).filter(UserQuest.status == "active"):
+        completed.setdefault((user_id, quest_id), []).append(task_id)
+    for user_quest, quest in rows:
+        engine._watch_tasks(user_quest.user_id, quest, completed.get((user_quest.user_id, quest.id), []))
+    db.session.commit()
+    return len(rows)
@@ -1,8 +1,8 @@
-import numpy as np
 from typing import List, Dict, Tuple
 from datetime import datetime, timedelta
-from ..models import User, EmotionLog
+from ..models import User
 from .. import db
+from .emotion_rollup import get_emotion_buckets, get_emotion_totals
 
 class RecommendationEngine:
     def __init__(self):
@@ -29,30 +29,32 @@ class RecommendationEngine:
     def get_emotion_trend(self, user_id: int, hours: int = 24) -> Dict:
         """Get emotion trend for user over specified hours"""
         since = datetime.utcnow() - timedelta(hours=hours)
-        emotions = EmotionLog.query.filter(
-            EmotionLog.user_id == user_id,
-            EmotionLog.timestamp >= since
-        ).order_by(EmotionLog.timestamp.desc()).all()
+        buckets = get_emotion_buckets(user_id, since)
 
-        if not emotions:
+        if not buckets:
             return {'trend': 'neutral', 'confidence': 0.0, 'emotions': []}
 
-        # Calculate emotion frequencies
+        # Calculate emotion frequencies from the per-minute rollups
         emotion_counts = {}
-        for emotion in emotions:
-            emotion_counts[emotion.emotion] = emotion_counts.get(emotion.emotion, 0) + 1
+        for bucket in buckets:
+            emotion_counts[bucket.emotion] = emotion_counts.get(bucket.emotion, 0) + bucket.sample_count
 
         # Find dominant emotion
         dominant_emotion = max(emotion_counts.items(), key=lambda x: x[1])
         
         # Calculate trend confidence
-        total_emotions = len(emotions)
+        total_emotions = sum(emotion_counts.values())
         confidence = dominant_emotion[1] / total_emotions
 
         return {
             'trend': dominant_emotion[0],
             'confidence': confidence,
-            'emotions': [{'emotion': e.emotion, 'confidence': e.confidence, 'timestamp': e.timestamp} for e in emotions]
+            'emotions': [{
+                'emotion': b.emotion,
+                'confidence': b.confidence_sum / b.sample_count if b.sample_count else 0.0,
+                'count': b.sample_count,
+                'timestamp': b.bucket
+            } for b in buckets]
         }
 
     def calculate_learning_difficulty(self, user_id: int, base_difficulty: float = 0.5) -> float:
@@ -153,24 +155,15 @@ class RecommendationEngine:
     def get_emotion_insights(self, user_id: int, days: int = 7) -> Dict:
         """Get insights about user's emotional learning patterns"""
         since = datetime.utcnow() - timedelta(days=days)
-        emotions = EmotionLog.query.filter(
-            EmotionLog.user_id == user_id,
-            EmotionLog.timestamp >= since
-        ).all()
+        totals = get_emotion_totals(user_id, since)
 
-        if not emotions:
+        if not totals:
             return {'insights': [], 'recommendations': []}
 
         # Analyze patterns
-        emotion_counts = {}
-        confidence_scores = []
-        
-        for emotion in emotions:
-            emotion_counts[emotion.emotion] = emotion_counts.get(emotion.emotion, 0) + 1
-            confidence_scores.append(emotion.confidence)
-
-        total_emotions = len(emotions)
-        avg_confidence = np.mean(confidence_scores)
+        emotion_counts = {emotion: t['count'] for emotion, t in totals.items()}
+        total_emotions = sum(emotion_counts.values())
+        avg_confidence = sum(t['confidence_sum'] for t in totals.values()) / total_emotions
         
         # Generate insights
         insights = []
@@ -0,0 +1,72 @@
+from typing import Iterable, Tuple
+import logging
+
+from sqlalchemy import inspect, literal, text
+from sqlalchemy.schema import CreateColumn
+
+from .. import db
+from ..models import Quest, User, UserQuest, UserStreak, XPTransaction
+
+logger = logging.getLogger(__name__)
+
+# Columns added to tables that already exist in deployed databases; db.create_all() never alters a table
+ADDED_COLUMNS: Tuple[Tuple[type, str], ...] = (
+    (User, "timezone"),
+    (Quest, "template_key"),
+)
+
+# Indexes added to tables that already exist in deployed databases
+ADDED_INDEXES: Tuple[Tuple[type, str], ...] = (
+    (UserStreak, "ix_user_streak_type_activity"),
+    (Quest, "ix_quest_template_key"),
+    (UserQuest, "ix_user_quest_user_quest"),
+    (UserQuest, "ix_user_quest_quest"),
+    (XPTransaction, "ix_xp_transaction_user_id_id"),
+    (XPTransaction, "ix_xp_transaction_created_at"),
+)
+
+
+def _add_column(connection, model, name: str) -> bool:
+    table = model.__table__
+    if name in {column["name"] for column in inspect(connection).get_columns(table.name)}:
+        return False
+
+    column = table.c[name]
+    dialect = connection.dialect
+    ddl = f"ALTER TABLE {dialect.identifier_preparer.format_table(table)} ADD COLUMN {CreateColumn(column).compile(dialect=dialect)}"
+    # Existing rows get the model's scalar default instead of NULL
+    if column.default is not None and column.default.is_scalar:
+        ddl += f" DEFAULT {literal(column.default.arg, column.type).compile(dialect=dialect, compile_kwargs={'literal_binds': True})}"
+    connection.execute(text(ddl))
+    return True
+
+
+def _add_index(connection, model, name: str) -> bool:
+    table = model.__table__
+    if name in {index["name"] for index in inspect(connection).get_indexes(table.name)}:
+        return False
+    index = next(index for index in table.indexes if index.name == name)
+    index.create(bind=connection)
+    return True
+
+
+def upgrade_schema(columns: Iterable[Tuple[type, str]] = ADDED_COLUMNS,
+                   indexes: Iterable[Tuple[type, str]] = ADDED_INDEXES) -> int:
+    """
+    Add missing columns, then missing indexes, to tables created by older releases
+
+    Idempotent: each step is skipped when the schema already has it. A step
+    that fails (e.g. another worker added it first) is logged and skipped.
+    Returns the number of columns and indexes added.
+    """
+    added = 0
+    for step, items in ((_add_column, columns), (_add_index, indexes)):
+        for model, name in items:
+            try:
+                with db.engine.begin() as connection:
+                    if step(connection, model, name):
+                        added += 1
+                        logger.info(f"Added {name} to {model.__tablename__}")
+            except Exception as e:
+                logger.error(f"Could not add {name} to {model.__tablename__}: {e}")
+    return added
@@ -0,0 +1,230 @@
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from ..models import Chapter, Story, StoryQuest
+
+# Snapshots are rebuilt at least this often, bounding staleness from writes in other processes
+CATALOG_TTL_SECONDS = 300.0
+
+
+class StoryEntry(NamedTuple):
+    id: int
+    title: str
+    description: Optional[str]
+    theme: str
+    cover_image: Optional[str]
+    is_active: bool
+    created_at: datetime
+    chapter_ids: Tuple[int, ...]  # In chapter order
+
+
+class ChapterEntry(NamedTuple):
+    id: int
+    story_id: int
+    title: str
+    description: Optional[str]
+    order: int
+    storyline_text: Optional[str]
+    visual_assets: Optional[Dict]
+    unlock_requirements: Optional[Dict]
+    # Compiled unlock rule: previous chapter completed, story XP reached, topics mastered
+    previous_chapter_id: Optional[int]
+    xp_required: int
+    required_topics: Tuple[str, ...]
+    quest_ids: Tuple[int, ...]
+
+
+class QuestEntry(NamedTuple):
+    id: int
+    chapter_id: int
+    story_id: int
+    title: str
+    description: Optional[str]
+    quest_type: str
+    difficulty_level: str
+    topics: Optional[List[str]]
+    required_xp: int
+    completion_criteria: Optional[Dict]
+    reward_xp: int
+    reward_badge: Optional[str]
+    story_context: Optional[str]
+
+
+class CatalogSnapshot:
+    """Read-only view of all stories, chapters and story quests at one catalog version"""
+
+    def __init__(self, version: int, stories: Dict[int, StoryEntry], chapters: Dict[int, ChapterEntry],
+                 quests: Dict[int, QuestEntry]):
+        self.version = version
+        self.stories = stories
+        self.chapters = chapters
+        self.quests = quests
+        self.active_story_ids = tuple(sorted(story.id for story in stories.values() if story.is_active))
+
+        quests_by_topic: Dict[str, List[int]] = {}
+        for quest in quests.values():
+            for topic in quest.topics or ():
+                quests_by_topic.setdefault(topic, []).append(quest.id)
+        self.quests_by_topic = {topic: tuple(sorted(ids)) for topic, ids in quests_by_topic.items()}
+
+    def story(self, story_id: int) -> Optional[StoryEntry]:
+        return self.stories.get(story_id)
+
+    def chapter(self, chapter_id: int) -> Optional[ChapterEntry]:
+        return self.chapters.get(chapter_id)
+
+    def quest(self, quest_id: int) -> Optional[QuestEntry]:
+        return self.quests.get(quest_id)
+
+    def active_stories(self) -> List[StoryEntry]:
+        return [self.stories[story_id] for story_id in self.active_story_ids]
+
+    def story_chapters(self, story_id: int) -> List[ChapterEntry]:
+        story = self.stories.get(story_id)
+        return [self.chapters[chapter_id] for chapter_id in story.chapter_ids] if story else []
+
+    def story_topics(self, story_id: int) -> Tuple[str, ...]:
+        """Every topic some chapter of the story requires mastered"""
+        topics = {topic for chapter in self.story_chapters(story_id) for topic in chapter.required_topics}
+        return tuple(sorted(topics))
+
+    def topic_quests(self, topic: str) -> List[QuestEntry]:
+        """Story quests covering a topic"""
+        return [self.quests[quest_id] for quest_id in self.quests_by_topic.get(topic, ())]
+
+    def chapter_quests(self, chapter_id: int) -> List[QuestEntry]:
+        chapter = self.chapters.get(chapter_id)
+        return [self.quests[quest_id] for quest_id in chapter.quest_ids] if chapter else []
+
+
+def _load_snapshot(version: int) -> CatalogSnapshot:
+    """Read the whole catalog in three queries"""
+    chapter_rows = Chapter.query.order_by(Chapter.story_id, Chapter.order, Chapter.id).all()
+    quest_rows = StoryQuest.query.order_by(StoryQuest.chapter_id, StoryQuest.id).all()
+
+    quest_ids: Dict[int, List[int]] = {}
+    for quest in quest_rows:
+        quest_ids.setdefault(quest.chapter_id, []).append(quest.id)
+
+    chapters: Dict[int, ChapterEntry] = {}
+    chapter_ids: Dict[int, List[int]] = {}
+    for chapter in chapter_rows:
+        story_chapters = chapter_ids.setdefault(chapter.story_id, [])
+        previous = chapters[story_chapters[-1]] if story_chapters else None
+        requirements = chapter.unlock_requirements or {}
+        chapters[chapter.id] = ChapterEntry(
+            id=chapter.id,
+            story_id=chapter.story_id,
+            title=chapter.title,
+            description=chapter.description,
+            order=chapter.order,
+            storyline_text=chapter.storyline_text,
+            visual_assets=chapter.visual_assets,
+            unlock_requirements=chapter.unlock_requirements,
+            previous_chapter_id=previous.id if previous and previous.order == chapter.order - 1 else None,
+            xp_required=requirements.get("xp_required", 0) or 0,
+            required_topics=tuple(requirements.get("topics_mastered", ()) or ()),
+            quest_ids=tuple(quest_ids.get(chapter.id, ())),
+        )
+        story_chapters.append(chapter.id)
+
+    stories = {
+        story.id: StoryEntry(
+            id=story.id,
+            title=story.title,
+            description=story.description,
+            theme=story.theme,
+            cover_image=story.cover_image,
+            is_active=bool(story.is_active),
+            created_at=story.created_at,
+            chapter_ids=tuple(chapter_ids.get(story.id, ())),
+        )
+        for story in Story.query.all()
+    }
+
+    quests = {
+        quest.id: QuestEntry(
+            id=quest.id,
+            chapter_id=quest.chapter_id,
+            story_id=chapters[quest.chapter_id].story_id,
+            title=quest.title,
+            description=quest.description,
+            quest_type=quest.quest_type,
+            difficulty_level=quest.difficulty_level,
+            topics=quest.topics,
+            required_xp=quest.required_xp,
+            completion_criteria=quest.completion_criteria,
+            reward_xp=quest.reward_xp,
+            reward_badge=quest.reward_badge,
+            story_context=quest.story_context,
+        )
+        for quest in quest_rows if quest.chapter_id in chapters
+    }
+    return CatalogSnapshot(version, stories, chapters, quests)
+
+
+class StoryCatalog:
+    """
+    Process-wide snapshot of the story catalog
+
+    Commits touching Story, Chapter or StoryQuest bump the version and the
+    next read rebuilds the snapshot; snapshots are never mutated, so callers
+    may hold on to one for the duration of a request.
+    """
+
+    def __init__(self, ttl_seconds: float = CATALOG_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._version = 0
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def get(self) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == self._version and time.monotonic() < self._expires_at:
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != self._version or time.monotonic() >= self._expires_at:
+                snapshot = _load_snapshot(self._version)
+                self._snapshot = snapshot
+                self._expires_at = time.monotonic() + self.ttl_seconds
+            return snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+
+
+story_catalog = StoryCatalog()
+
+
+# ----- invalidation: applied once the catalog write commits -----
+
+@event.listens_for(Session, "after_flush")
+def _collect_catalog_writes(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (Story, Chapter, StoryQuest)):
+            session.info["story_catalog_dirty"] = True
+            return
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_catalog_invalidation(session):
+    if session.info.pop("story_catalog_dirty", False):
+        story_catalog.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_catalog_invalidation(session):
+    session.info.pop("story_catalog_dirty", None)
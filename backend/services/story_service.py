@@ -3,8 +3,16 @@ from typing import Dict, List, Optional, Tuple
 from .. import db
 from ..models import (
     User, Story, Chapter, StoryQuest, StoryProgress, StoryReward, 
-    UserXP, UserQuest, TopicMastery, PerformanceLog
+    UserXP, UserQuest, PerformanceLog
 )
+from .mastery_store import get_user_mastery
+from .progress_membership import (
+    StoryCompletions, complete_story_chapter, complete_story_quest, load_story_completions
+)
+from .story_catalog import ChapterEntry, QuestEntry, StoryEntry, story_catalog
+
+# Mastery score (0-100) a chapter's required topics must reach
+CHAPTER_TOPIC_MASTERY = 80.0
 
 
 class StoryService:
@@ -15,58 +23,55 @@ class StoryService:
     
     def get_current_story_progress(self, user_id: int) -> Dict:
         """Get user's current story progress with unlocked content"""
-        user = User.query.get(user_id)
-        if not user:
-            return {"error": "User not found"}
+        catalog = story_catalog.get()
         
         # Get or create story progress
         story_progress = StoryProgress.query.filter_by(user_id=user_id).first()
         if not story_progress:
+            user = User.query.get(user_id)
+            if not user:
+                return {"error": "User not found"}
+            
             # Start with the first active story
-            first_story = Story.query.filter_by(is_active=True).order_by(Story.id).first()
-            if not first_story:
+            if not catalog.active_story_ids:
                 return {"error": "No active stories available"}
             
-            story_progress = self._initialize_story_progress(user_id, first_story.id)
+            story_progress = self._initialize_story_progress(user_id, catalog.active_story_ids[0])
         
-        story = Story.query.get(story_progress.story_id)
-        chapters = Chapter.query.filter_by(story_id=story.id).order_by(Chapter.order).all()
+        story = catalog.story(story_progress.story_id)
+        completions = load_story_completions(user_id, story.id)
         
         # Determine unlocked chapters
-        unlocked_chapters = []
-        for chapter in chapters:
-            if self._is_chapter_unlocked(user_id, chapter, story_progress):
-                unlocked_chapters.append(self._format_chapter_data(chapter, story_progress))
+        unlocked, _ = self.evaluate_chapters(user_id, story_progress, completions)
+        unlocked_chapters = [self._format_chapter_data(chapter, completions) for chapter in unlocked]
         
         return {
             "story": self._format_story_data(story),
             "current_chapter": story_progress.current_chapter_id,
             "unlocked_chapters": unlocked_chapters,
             "total_story_xp": story_progress.total_story_xp,
-            "completed_chapters": story_progress.completed_chapters,
-            "completed_quests": story_progress.completed_quests
+            "completed_chapters": completions.chapter_ids,
+            "completed_quests": completions.quest_ids
         }
     
     def update_story_progress(self, user_id: int, quest_id: int, score: float, 
-                            time_spent: int = 0) -> Dict:
-        """Update story progress when a quest is completed"""
-        user = User.query.get(user_id)
-        if not user:
-            return {"error": "User not found"}
-        
-        quest = StoryQuest.query.get(quest_id)
+                            time_spent: int = 0, story_progress: StoryProgress = None) -> Dict:
+        """Update story progress when a quest is completed (``story_progress`` skips its lookup)"""
+        quest = story_catalog.get().quest(quest_id)
         if not quest:
             return {"error": "Quest not found"}
         
-        story_progress = StoryProgress.query.filter_by(
-            user_id=user_id, story_id=quest.chapter.story_id
-        ).first()
+        if story_progress is None or story_progress.story_id != quest.story_id:
+            story_progress = StoryProgress.query.filter_by(
+                user_id=user_id, story_id=quest.story_id
+            ).first()
         
         if not story_progress:
             return {"error": "Story progress not found"}
         
         # Check if quest is already completed
-        if quest_id in story_progress.completed_quests:
+        completions = load_story_completions(user_id, quest.story_id)
+        if quest_id in completions.quests:
             return {"message": "Quest already completed", "rewards": []}
         
         # Check completion criteria
@@ -76,17 +81,23 @@ class StoryService:
         if score < min_score:
             return {"message": "Quest not completed - score too low", "rewards": []}
         
-        # Mark quest as completed
-        story_progress.completed_quests.append(quest_id)
+        # Unlock state before this quest, so only new unlocks are rewarded
+        mastery = self._mastery_vector(user_id, quest.story_id)
+        unlocked_before = {chapter.id for chapter in self.evaluate_chapters(user_id, story_progress, completions, mastery)[0]}
+        
+        # Mark quest as completed (the insert is a no-op if a concurrent request got there first)
+        if not complete_story_quest(user_id, quest.story_id, quest_id):
+            return {"message": "Quest already completed", "rewards": []}
+        completions.add_quest(quest_id)
         story_progress.total_story_xp += quest.reward_xp
         story_progress.last_updated = datetime.utcnow()
         
         # Award XP
         from .gamification_service import GamificationService
         gamification_service = GamificationService()
-        xp_result = gamification_service.add_xp(
-            user_id, quest.reward_xp, "quest_complete", quest_id, 
-            f"Completed quest: {quest.title}"
+        xp_result = gamification_service.award_xp(
+            user_id, "quest_complete", quest_id, quest.reward_xp,
+            f"Completed quest: {quest.title}", commit=False
         )
         
         rewards = [{
@@ -97,8 +108,8 @@ class StoryService:
         
         # Award badge if specified
         if quest.reward_badge:
-            badge_result = gamification_service.check_and_award_badges(user_id)
-            if badge_result.get("new_badges"):
+            new_badges = gamification_service.check_and_award_badges(user_id, triggers=("quest", "xp", "level"))
+            if new_badges:
                 rewards.append({
                     "type": "badge",
                     "badge_name": quest.reward_badge,
@@ -106,11 +117,11 @@ class StoryService:
                 })
         
         # Check for chapter completion
-        chapter_rewards = self._check_chapter_completion(user_id, quest.chapter_id, story_progress)
+        chapter_rewards = self._check_chapter_completion(user_id, quest.chapter_id, story_progress, completions)
         rewards.extend(chapter_rewards)
         
         # Check for story unlocks
-        unlock_rewards = self._check_story_unlocks(user_id, story_progress)
+        unlock_rewards = self._check_story_unlocks(user_id, story_progress, completions, mastery, unlocked_before)
         rewards.extend(unlock_rewards)
         
         db.session.commit()
@@ -122,76 +133,115 @@ class StoryService:
             "new_unlocks": unlock_rewards
         }
     
+    def get_progress_for_stories(self, user_id: int, story_ids) -> Dict[int, StoryProgress]:
+        """The user's progress rows for several stories in one query, keyed by story id"""
+        story_ids = set(story_ids)
+        if not story_ids:
+            return {}
+        rows = StoryProgress.query.filter(
+            StoryProgress.user_id == user_id, StoryProgress.story_id.in_(story_ids)
+        ).all()
+        return {row.story_id: row for row in rows}
+    
     def _initialize_story_progress(self, user_id: int, story_id: int) -> StoryProgress:
         """Initialize story progress for a new user"""
         story_progress = StoryProgress(
             user_id=user_id,
             story_id=story_id,
             current_chapter_id=None,
-            completed_chapters=[],
-            completed_quests=[],
             total_story_xp=0
         )
         db.session.add(story_progress)
         db.session.commit()
         return story_progress
     
-    def _is_chapter_unlocked(self, user_id: int, chapter: Chapter, 
-                           story_progress: StoryProgress) -> bool:
-        """Check if a chapter is unlocked for the user"""
+    def _mastery_vector(self, user_id: int, story_id: int, topics=None) -> Dict[str, float]:
+        """The user's current (decayed) mastery of the topics a story requires, in one query"""
+        if topics is None:
+            topics = story_catalog.get().story_topics(story_id)
+        if not topics:
+            return {}
+        return {topic: state.mastery_score for topic, state in get_user_mastery(user_id, topics).items()}
+    
+    def evaluate_chapters(self, user_id: int, story_progress: StoryProgress, completions: StoryCompletions = None,
+                          mastery: Dict[str, float] = None) -> Tuple[List[ChapterEntry], List[ChapterEntry]]:
+        """
+        Unlocked and completable chapters of the user's story in one pass
+        
+        Returns:
+            (unlocked chapters, unlocked chapters whose quests are all done but not yet marked complete)
+        """
+        if completions is None:
+            completions = load_story_completions(user_id, story_progress.story_id)
+        if mastery is None:
+            mastery = self._mastery_vector(user_id, story_progress.story_id)
+        
+        catalog = story_catalog.get()
+        reached_order = self._reached_order(catalog, story_progress)
+        unlocked, completable = [], []
+        for chapter in catalog.story_chapters(story_progress.story_id):
+            if not self._chapter_unlocked(chapter, story_progress.total_story_xp or 0, completions.chapters,
+                                          mastery, reached_order):
+                continue
+            unlocked.append(chapter)
+            if chapter.id not in completions.chapters and completions.quests.issuperset(chapter.quest_ids):
+                completable.append(chapter)
+        return unlocked, completable
+    
+    @staticmethod
+    def _reached_order(catalog, story_progress: StoryProgress) -> int:
+        """Order of the furthest chapter the user has unlocked; current_chapter_id only moves forward"""
+        current_chapter = catalog.chapter(story_progress.current_chapter_id)
+        if not current_chapter or current_chapter.story_id != story_progress.story_id:
+            return 0
+        return current_chapter.order
+    
+    @staticmethod
+    def _chapter_unlocked(chapter: ChapterEntry, story_xp: int, completed_chapters: set,
+                          mastery: Dict[str, float], reached_order: int = 0) -> bool:
         # First chapter is always unlocked
         if chapter.order == 1:
             return True
         
-        # Check if previous chapter is completed
-        previous_chapter = Chapter.query.filter_by(
-            story_id=chapter.story_id, order=chapter.order - 1
-        ).first()
+        # Unlocks stick: mastery decays while idle, so only chapters not yet reached are gated on it
+        if chapter.id in completed_chapters or chapter.order <= reached_order:
+            return True
         
-        if previous_chapter and previous_chapter.id not in story_progress.completed_chapters:
+        # Previous chapter completed, XP reached, required topics mastered
+        if chapter.previous_chapter_id and chapter.previous_chapter_id not in completed_chapters:
             return False
-        
-        # Check unlock requirements
-        requirements = chapter.unlock_requirements or {}
-        
-        # Check XP requirement
-        xp_required = requirements.get("xp_required", 0)
-        if story_progress.total_story_xp < xp_required:
+        if story_xp < chapter.xp_required:
             return False
-        
-        # Check topic mastery requirements
-        topics_mastered = requirements.get("topics_mastered", [])
-        for topic in topics_mastered:
-            mastery = TopicMastery.query.filter_by(
-                user_id=user_id, topic=topic
-            ).first()
-            if not mastery or mastery.mastery_score < 0.8:  # 80% mastery required
-                return False
-        
-        return True
+        return all((mastery.get(topic) or 0.0) >= CHAPTER_TOPIC_MASTERY for topic in chapter.required_topics)
+    
+    def _is_chapter_unlocked(self, user_id: int, chapter: ChapterEntry, 
+                           story_progress: StoryProgress, completions: StoryCompletions = None) -> bool:
+        """Check if a chapter is unlocked for the user"""
+        if completions is None:
+            completions = load_story_completions(user_id, chapter.story_id)
+        mastery = self._mastery_vector(user_id, chapter.story_id, chapter.required_topics)
+        return self._chapter_unlocked(chapter, story_progress.total_story_xp or 0, completions.chapters, mastery,
+                                      self._reached_order(story_catalog.get(), story_progress))
     
     def _check_chapter_completion(self, user_id: int, chapter_id: int, 
-                                story_progress: StoryProgress) -> List[Dict]:
+                                story_progress: StoryProgress, completions: StoryCompletions) -> List[Dict]:
         """Check if a chapter is completed and award rewards"""
-        chapter = Chapter.query.get(chapter_id)
+        chapter = story_catalog.get().chapter(chapter_id)
         if not chapter:
             return []
         
         # Check if chapter is already completed
-        if chapter_id in story_progress.completed_chapters:
+        if chapter_id in completions.chapters:
             return []
         
-        # Get all quests in the chapter
-        chapter_quests = StoryQuest.query.filter_by(chapter_id=chapter_id).all()
-        quest_ids = [q.id for q in chapter_quests]
-        
         # Check if all quests are completed
-        completed_quests = set(story_progress.completed_quests)
-        if not all(qid in completed_quests for qid in quest_ids):
+        if not completions.quests.issuperset(chapter.quest_ids):
             return []
         
         # Mark chapter as completed
-        story_progress.completed_chapters.append(chapter_id)
+        if not complete_story_chapter(user_id, chapter.story_id, chapter_id):
+            return []
+        completions.add_chapter(chapter_id)
         
         # Award chapter completion XP
         chapter_xp = 100  # Base XP for chapter completion
@@ -200,9 +250,9 @@ class StoryService:
         # Award XP through gamification service
         from .gamification_service import GamificationService
         gamification_service = GamificationService()
-        gamification_service.add_xp(
-            user_id, chapter_xp, "chapter_complete", chapter_id,
-            f"Completed chapter: {chapter.title}"
+        gamification_service.award_xp(
+            user_id, "chapter_complete", chapter_id, chapter_xp,
+            f"Completed chapter: {chapter.title}", commit=False
         )
         
         # Create story reward
@@ -225,20 +275,21 @@ class StoryService:
             "description": f"Chapter completed: {chapter.title}"
         }]
     
-    def _check_story_unlocks(self, user_id: int, story_progress: StoryProgress) -> List[Dict]:
-        """Check for new story unlocks and create rewards"""
-        story = Story.query.get(story_progress.story_id)
-        chapters = Chapter.query.filter_by(story_id=story.id).order_by(Chapter.order).all()
+    def _check_story_unlocks(self, user_id: int, story_progress: StoryProgress, completions: StoryCompletions,
+                             mastery: Dict[str, float] = None, unlocked_before=()) -> List[Dict]:
+        """Create rewards for chapters unlocked since ``unlocked_before``"""
+        catalog = story_catalog.get()
+        story = catalog.story(story_progress.story_id)
+        unlocked, _ = self.evaluate_chapters(user_id, story_progress, completions, mastery)
         
         unlocks = []
         
-        for chapter in chapters:
-            if (chapter.id not in story_progress.completed_chapters and 
-                self._is_chapter_unlocked(user_id, chapter, story_progress)):
+        for chapter in unlocked:
+            if chapter.id not in completions.chapters and chapter.id not in unlocked_before:
                 
                 # Update current chapter if it's the next one
-                if (not story_progress.current_chapter_id or 
-                    chapter.order > story_progress.current_chapter.order):
+                current_chapter = catalog.chapter(story_progress.current_chapter_id)
+                if not current_chapter or chapter.order > current_chapter.order:
                     story_progress.current_chapter_id = chapter.id
                 
                 # Create unlock reward
@@ -263,7 +314,7 @@ class StoryService:
         
         return unlocks
     
-    def _format_story_data(self, story: Story) -> Dict:
+    def _format_story_data(self, story: StoryEntry) -> Dict:
         """Format story data for API response"""
         return {
             "id": story.id,
@@ -274,9 +325,9 @@ class StoryService:
             "created_at": story.created_at.isoformat()
         }
     
-    def _format_chapter_data(self, chapter: Chapter, story_progress: StoryProgress) -> Dict:
+    def _format_chapter_data(self, chapter: ChapterEntry, completions: StoryCompletions) -> Dict:
         """Format chapter data for API response"""
-        quests = StoryQuest.query.filter_by(chapter_id=chapter.id).all()
+        quests = story_catalog.get().chapter_quests(chapter.id)
         
         return {
             "id": chapter.id,
@@ -285,11 +336,11 @@ class StoryService:
             "order": chapter.order,
             "storyline_text": chapter.storyline_text,
             "visual_assets": chapter.visual_assets,
-            "is_completed": chapter.id in story_progress.completed_chapters,
-            "quests": [self._format_quest_data(quest, story_progress) for quest in quests]
+            "is_completed": chapter.id in completions.chapters,
+            "quests": [self._format_quest_data(quest, completions) for quest in quests]
         }
     
-    def _format_quest_data(self, quest: StoryQuest, story_progress: StoryProgress) -> Dict:
+    def _format_quest_data(self, quest: QuestEntry, completions: StoryCompletions) -> Dict:
         """Format quest data for API response"""
         return {
             "id": quest.id,
@@ -302,7 +353,7 @@ class StoryService:
             "reward_xp": quest.reward_xp,
             "reward_badge": quest.reward_badge,
             "story_context": quest.story_context,
-            "is_completed": quest.id in story_progress.completed_quests,
+            "is_completed": quest.id in completions.quests,
             "completion_criteria": quest.completion_criteria
         }
     
@@ -0,0 +1,77 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import logging
+
+from sqlalchemy import Date, case, literal, select, update
+
+from .. import db
+from ..models import User, UserStreak
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEZONE = "UTC"
+
+
+def valid_timezone(name: Optional[str]) -> bool:
+    try:
+        ZoneInfo(name)
+        return True
+    except (ZoneInfoNotFoundError, ValueError, TypeError):
+        return False
+
+
+def local_date(tz_name: Optional[str], now: Optional[datetime] = None) -> date:
+    """The calendar date in ``tz_name`` at the naive-UTC instant ``now``"""
+    now = (now or datetime.utcnow()).replace(tzinfo=timezone.utc)
+    try:
+        return now.astimezone(ZoneInfo(tz_name or DEFAULT_TIMEZONE)).date()
+    except (ZoneInfoNotFoundError, ValueError):
+        return now.date()
+
+
+def user_today(user_id: int) -> date:
+    """Today's date in the user's timezone"""
+    tz_name = db.session.query(User.timezone).filter(User.id == user_id).scalar()
+    return local_date(tz_name)
+
+
+def expire_lapsed_streaks(now: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    Reset every streak whose owner missed a whole local day
+
+    A streak lapses once the user's local date is two or more days past its
+    last activity. Each timezone in use gets its own cutoff date, selected per
+    row with a CASE over the owner's timezone, so every streak type is settled
+    with one UPDATE. Frozen streaks are left as they are. Running this hourly
+    catches each timezone's midnight soon after it passes; it is idempotent.
+
+    Returns:
+        dict: {streak_type: streaks reset}
+    """
+    now = now or datetime.utcnow()
+    timezones = [tz for (tz,) in db.session.query(User.timezone).distinct() if tz]
+    cutoffs = {tz: literal(local_date(tz, now) - timedelta(days=1), Date) for tz in timezones}
+    default_cutoff = literal(local_date(DEFAULT_TIMEZONE, now) - timedelta(days=1), Date)
+
+    owner_cutoff = select(
+        case(cutoffs, value=User.timezone, else_=default_cutoff) if cutoffs else default_cutoff
+    ).where(User.id == UserStreak.user_id).scalar_subquery()
+
+    streak_types = [t for (t,) in db.session.query(UserStreak.streak_type).distinct()]
+    reset = {}
+    for streak_type in streak_types:
+        result = db.session.execute(
+            update(UserStreak).where(
+                UserStreak.streak_type == streak_type,
+                UserStreak.current_streak > 0,
+                UserStreak.streak_frozen.isnot(True),
+                UserStreak.last_activity_date < owner_cutoff,
+            ).values(current_streak=0).execution_options(synchronize_session=False)
+        )
+        reset[streak_type] = result.rowcount
+    db.session.commit()
+
+    if any(reset.values()):
+        logger.info(f"Reset lapsed streaks: {reset}")
+    return reset
@@ -0,0 +1,191 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional
+import math
+
+from sqlalchemy import func, select, update
+
+from .. import db
+from ..models import CoLearnerProfile, UserXP, XPTransaction
+from .leaderboard import queue_xp_update
+from .xp_rollup import record_xp_rollups
+
+# Level curve: level 1 -> 2 costs 100 XP, level n -> n+1 costs 100 * 1.2^n
+LEVEL_BASE_XP = 100
+LEVEL_GROWTH = 1.2
+
+# CoLearner companions level linearly, one level per 100 XP
+COLEARNER_XP_PER_LEVEL = 100
+
+
+def xp_threshold(level: int) -> int:
+    """Total XP needed to reach ``level``"""
+    if level <= 1:
+        return 0
+    # 100 + sum(100 * 1.2^k for k in 2..level-1), summed as a geometric series
+    growth_sum = LEVEL_BASE_XP * (LEVEL_GROWTH ** level - LEVEL_GROWTH ** 2) / (LEVEL_GROWTH - 1)
+    return int(round(LEVEL_BASE_XP + growth_sum))
+
+
+def level_for_xp(total_xp: int) -> int:
+    """Invert xp_threshold in closed form"""
+    total_xp = total_xp or 0
+    if total_xp < LEVEL_BASE_XP:
+        return 1
+    ratio = (total_xp - LEVEL_BASE_XP) * (LEVEL_GROWTH - 1) / LEVEL_BASE_XP + LEVEL_GROWTH ** 2
+    level = max(int(math.log(ratio, LEVEL_GROWTH)), 2)
+    # Guard against float rounding at exact thresholds
+    if xp_threshold(level + 1) <= total_xp:
+        level += 1
+    elif xp_threshold(level) > total_xp:
+        level -= 1
+    return level
+
+
+def level_progress(total_xp: int) -> Dict:
+    """The derived UserXP columns for a total"""
+    level = level_for_xp(total_xp)
+    floor = xp_threshold(level)
+    return {
+        "current_level": level,
+        "xp_to_next_level": xp_threshold(level + 1) - floor,
+        "xp_in_current_level": (total_xp or 0) - floor,
+    }
+
+
+class XPGrant(NamedTuple):
+    user_id: int
+    amount: int
+    source: str
+    source_id: Optional[int] = None
+    description: Optional[str] = None
+
+
+class XPLedger:
+    """Single write path for XP.
+
+    Totals are changed with ``UPDATE .. SET total_xp = total_xp + :amount`` so
+    concurrent grants never lose updates; the level columns are then derived
+    from the new total in closed form within the same transaction. Grants can
+    be batched into one commit with ``grant_many``. New totals are queued for
+    the leaderboards and applied when the transaction commits.
+    """
+
+    def grant(self, user_id: int, amount: int, source: str, source_id: int = None,
+              description: str = None, commit: bool = True) -> Dict:
+        """Apply one grant; returns the user's updated XP profile"""
+        results = self.grant_many([XPGrant(user_id, amount, source, source_id, description)], commit=commit)
+        return results[user_id]
+
+    def grant_many(self, grants: Iterable[XPGrant], commit: bool = True) -> Dict[int, Dict]:
+        """
+        Apply grants with one UPDATE per user, one bulk transaction insert
+        and one daily-rollup upsert
+
+        Returns:
+            dict: {user_id: {xp_awarded, total_xp, current_level, levels_gained, ...}}
+        """
+        grants = [XPGrant(*g) if not isinstance(g, XPGrant) else g for g in grants]
+        grants = [g for g in grants if g.amount]
+        totals: Dict[int, int] = {}
+        for g in grants:
+            totals[g.user_id] = totals.get(g.user_id, 0) + int(g.amount)
+        if not totals:
+            return {}
+
+        self._ensure_profiles(list(totals))
+
+        results = {}
+        for user_id, amount in totals.items():
+            new_total = self._increment(UserXP, UserXP.total_xp, user_id, amount)
+            progress = level_progress(new_total)
+            db.session.execute(
+                update(UserXP).where(UserXP.user_id == user_id).values(**progress)
+                .execution_options(synchronize_session=False)
+            )
+            results[user_id] = {
+                "success": True,
+                "xp_awarded": amount,
+                "total_xp": new_total,
+                "levels_gained": progress["current_level"] - level_for_xp(new_total - amount),
+                **progress,
+            }
+            queue_xp_update(user_id, new_total, amount)
+
+        now = datetime.utcnow()
+        db.session.execute(XPTransaction.__table__.insert(), [
+            {
+                "user_id": g.user_id,
+                "amount": int(g.amount),
+                "source": g.source,
+                "source_id": g.source_id,
+                "description": g.description or f"XP from {g.source}",
+                "created_at": now,
+            }
+            for g in grants
+        ])
+        record_xp_rollups(
+            {"user_id": g.user_id, "day": now.date(), "source": g.source, "amount": g.amount}
+            for g in grants
+        )
+        self._expire(UserXP, totals)
+
+        if commit:
+            db.session.commit()
+        return results
+
+    def grant_colearner(self, user_id: int, amount: int, commit: bool = True) -> Dict:
+        """Atomically add XP to a user's existing CoLearner companion"""
+        new_xp = self._increment(CoLearnerProfile, CoLearnerProfile.xp, user_id, int(amount))
+        old_level = (new_xp - int(amount)) // COLEARNER_XP_PER_LEVEL + 1
+        level = new_xp // COLEARNER_XP_PER_LEVEL + 1
+        db.session.execute(
+            update(CoLearnerProfile).where(CoLearnerProfile.user_id == user_id).values(level=level)
+            .execution_options(synchronize_session=False)
+        )
+        self._expire(CoLearnerProfile, [user_id])
+        if commit:
+            db.session.commit()
+        return {"xp": new_xp, "level": level, "old_level": old_level}
+
+    def _increment(self, model, column, user_id: int, amount: int) -> int:
+        """``column = column + amount`` for one user; returns the new value"""
+        stmt = update(model).where(model.user_id == user_id)\
+            .values({column.key: func.coalesce(column, 0) + amount})\
+            .execution_options(synchronize_session=False)
+        if db.session.get_bind().dialect.update_returning:
+            return db.session.execute(stmt.returning(column)).scalar_one()
+        # The UPDATE holds the row lock, so this read sees our own increment
+        db.session.execute(stmt)
+        return db.session.execute(select(column).where(model.user_id == user_id)).scalar_one()
+
+    def _ensure_profiles(self, user_ids: List[int]):
+        """Create missing UserXP rows without racing concurrent creators"""
+        values = [{"user_id": user_id, "total_xp": 0, **level_progress(0)} for user_id in user_ids]
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            if dialect == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            db.session.execute(insert(UserXP.__table__).values(values).on_conflict_do_nothing(
+                index_elements=["user_id"]
+            ))
+            return
+
+        existing = set(db.session.execute(
+            select(UserXP.user_id).where(UserXP.user_id.in_(user_ids))
+        ).scalars())
+        for value in values:
+            if value["user_id"] not in existing:
+                db.session.add(UserXP(**value))
+        db.session.flush()
+
+    def _expire(self, model, user_ids):
+        """Refresh any loaded instances that the Core UPDATEs bypassed"""
+        user_ids = set(user_ids)
+        for obj in list(db.session.identity_map.values()):
+            if isinstance(obj, model) and obj.user_id in user_ids:
+                db.session.expire(obj)
+
+
+xp_ledger = XPLedger()
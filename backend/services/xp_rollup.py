@@ -0,0 +1,203 @@
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+import gzip
+import json
+import logging
+import os
+
+from sqlalchemy import delete
+
+from .. import db
+from ..models import XPDailyRollup, XPTransaction
+
+logger = logging.getLogger(__name__)
+
+# Rows per upsert statement, kept well under SQLite's bound-parameter limit
+UPSERT_CHUNK = 500
+
+
+def _aggregate(rows: Iterable[Dict]) -> Dict[Tuple[int, date, str], List[int]]:
+    """Fold grants into {(user_id, day, source): [amount, count]}"""
+    buckets: Dict[Tuple[int, date, str], List[int]] = {}
+    for row in rows:
+        key = (row["user_id"], row["day"], row["source"])
+        entry = buckets.setdefault(key, [0, 0])
+        entry[0] += int(row["amount"])
+        entry[1] += 1
+    return buckets
+
+
+def _upsert(values: List[Dict]) -> bool:
+    """Single-statement INSERT .. ON CONFLICT for dialects that support it"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return False
+
+    table = XPDailyRollup.__table__
+    stmt = insert(table).values(values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "day", "source"],
+        set_={
+            "amount": table.c.amount + stmt.excluded.amount,
+            "transaction_count": table.c.transaction_count + stmt.excluded.transaction_count,
+        },
+    )
+    db.session.execute(stmt)
+    return True
+
+
+def record_xp_rollups(rows: Iterable[Dict]) -> int:
+    """Add grants ({user_id, day, source, amount}) to their daily rollups. The caller commits."""
+    buckets = _aggregate(rows)
+    if not buckets:
+        return 0
+
+    values = [
+        {"user_id": user_id, "day": day, "source": source,
+         "amount": amount, "transaction_count": count}
+        for (user_id, day, source), (amount, count) in buckets.items()
+    ]
+    if all(_upsert(values[i:i + UPSERT_CHUNK]) for i in range(0, len(values), UPSERT_CHUNK)):
+        return len(values)
+
+    # Generic fallback: read-modify-write per bucket
+    for value in values:
+        rollup = XPDailyRollup.query.filter_by(
+            user_id=value["user_id"], day=value["day"], source=value["source"]
+        ).first()
+        if rollup:
+            rollup.amount += value["amount"]
+            rollup.transaction_count += value["transaction_count"]
+        else:
+            db.session.add(XPDailyRollup(**value))
+    return len(values)
+
+
+def get_xp_totals(user_id: int, since: date) -> Dict:
+    """XP earned and grant count since the given day, overall and per source"""
+    rows = db.session.query(
+        XPDailyRollup.source,
+        db.func.sum(XPDailyRollup.amount),
+        db.func.sum(XPDailyRollup.transaction_count),
+    ).filter(
+        XPDailyRollup.user_id == user_id,
+        XPDailyRollup.day >= since
+    ).group_by(XPDailyRollup.source).all()
+
+    by_source = {source: int(amount or 0) for source, amount, _ in rows}
+    return {
+        "amount": sum(by_source.values()),
+        "transaction_count": sum(int(count or 0) for _, _, count in rows),
+        "by_source": by_source,
+    }
+
+
+def get_window_totals(since: date) -> Dict[int, int]:
+    """XP earned per user since the given day"""
+    rows = db.session.query(XPDailyRollup.user_id, db.func.sum(XPDailyRollup.amount))\
+        .filter(XPDailyRollup.day >= since).group_by(XPDailyRollup.user_id)
+    return {user_id: int(amount or 0) for user_id, amount in rows}
+
+
+def get_transactions_page(user_id: int, limit: int = 20,
+                          before_id: Optional[int] = None) -> Tuple[List[XPTransaction], Optional[int]]:
+    """Newest-first transactions after a keyset cursor; returns (rows, next before_id)"""
+    query = XPTransaction.query.filter(XPTransaction.user_id == user_id)
+    if before_id is not None:
+        query = query.filter(XPTransaction.id < before_id)
+    rows = query.order_by(XPTransaction.id.desc()).limit(limit + 1).all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def get_daily_page(user_id: int, limit: int = 30,
+                   before_day: Optional[date] = None) -> Tuple[List[Dict], Optional[date]]:
+    """Newest-first per-day XP totals after a keyset cursor; returns (days, next before_day)"""
+    query = db.session.query(
+        XPDailyRollup.day,
+        db.func.sum(XPDailyRollup.amount),
+        db.func.sum(XPDailyRollup.transaction_count),
+    ).filter(XPDailyRollup.user_id == user_id)
+    if before_day is not None:
+        query = query.filter(XPDailyRollup.day < before_day)
+    rows = query.group_by(XPDailyRollup.day).order_by(XPDailyRollup.day.desc()).limit(limit + 1).all()
+    next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+    days = [
+        {"day": day.isoformat(), "amount": int(amount or 0), "transaction_count": int(count or 0)}
+        for day, amount, count in rows[:limit]
+    ]
+    return days, next_cursor
+
+
+def backfill_xp_rollups(chunk_size: int = 5000) -> int:
+    """Build rollups from existing XPTransaction rows when the rollup table is empty"""
+    if XPDailyRollup.query.first() is not None or XPTransaction.query.first() is None:
+        return 0
+
+    transactions = db.session.query(
+        XPTransaction.user_id, XPTransaction.created_at, XPTransaction.source, XPTransaction.amount
+    ).yield_per(chunk_size)
+
+    written = record_xp_rollups(
+        {"user_id": user_id, "day": created_at.date(), "source": source, "amount": amount}
+        for user_id, created_at, source, amount in transactions
+        if created_at is not None
+    )
+    db.session.commit()
+    logger.info(f"Backfilled {written} XP rollup days")
+    return written
+
+
+def compact_xp_transactions(retention_days: int, archive_dir: str, chunk_size: int = 5000) -> Dict:
+    """
+    Archive and delete raw transactions older than the retention window
+
+    Rollups already hold their totals (the ledger writes both in one
+    transaction), so compaction only moves the raw rows out of the hot table.
+    Each chunk is written to a gzipped JSON-lines file before its rows are
+    deleted, so a crash can duplicate an archive chunk but never lose one.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    os.makedirs(archive_dir, exist_ok=True)
+    stats = {"archived": 0, "files": []}
+
+    while True:
+        rows = db.session.query(
+            XPTransaction.id, XPTransaction.user_id, XPTransaction.amount, XPTransaction.source,
+            XPTransaction.source_id, XPTransaction.description, XPTransaction.created_at
+        ).filter(XPTransaction.created_at < cutoff).order_by(XPTransaction.id).limit(chunk_size).all()
+        if not rows:
+            break
+
+        first_id, last_id = rows[0].id, rows[-1].id
+        path = os.path.join(archive_dir, f"xp_transactions_{cutoff:%Y%m%d}_{first_id}-{last_id}.jsonl.gz")
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps({
+                    "id": row.id,
+                    "user_id": row.user_id,
+                    "amount": row.amount,
+                    "source": row.source,
+                    "source_id": row.source_id,
+                    "description": row.description,
+                    "created_at": row.created_at.isoformat(),
+                }) + "\n")
+        os.replace(tmp_path, path)
+
+        db.session.execute(delete(XPTransaction).where(
+            XPTransaction.id.between(first_id, last_id),
+            XPTransaction.created_at < cutoff
+        ).execution_options(synchronize_session=False))
+        db.session.commit()
+
+        stats["archived"] += len(rows)
+        stats["files"].append(path)
+
+    if stats["archived"]:
+        logger.info(f"Archived {stats['archived']} XP transactions older than {cutoff:%Y-%m-%d}")
+    return stats
@@ -13,11 +13,19 @@ export function createEmotionCapture({ intervalMs = 7000, getToken, getOptIn })
     await new Promise((res) => (video.onloadedmetadata = () => res()));
     canvas.width = video.videoWidth;
     canvas.height = video.videoHeight;
-    timer = setInterval(captureAndSend, intervalMs);
+    schedule(intervalMs);
+  }
+
+  function schedule(delayMs) {
+    timer = setTimeout(async () => {
+      const nextMs = await captureAndSend();
+      // The hint may stretch the interval but never shortens it below intervalMs
+      if (timer) schedule(Math.max(nextMs || 0, intervalMs));
+    }, delayMs);
   }
 
   function stop() {
-    if (timer) clearInterval(timer);
+    if (timer) clearTimeout(timer);
     timer = null;
     const stream = video.srcObject;
     if (stream) stream.getTracks().forEach((t) => t.stop());
@@ -35,12 +43,14 @@ export function createEmotionCapture({ intervalMs = 7000, getToken, getOptIn })
       const resp = await fetch('/api/emotion', {
         method: 'POST',
         headers,
-        body: JSON.stringify({ image: dataUrl })
+        body: JSON.stringify({ image: dataUrl, session_state: document.hidden ? 'hidden' : 'active' })
       });
-      // Optionally handle response
-      await resp.json().catch(() => ({}));
+      // The server paces capture: back off while the emotion is stable or it is busy
+      const data = await resp.json().catch(() => ({}));
+      return data.next_frame_after_ms;
     } catch (e) {
       // swallow errors; it's background
+      return null;
     }
   }
 
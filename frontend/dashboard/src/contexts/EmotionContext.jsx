@@ -66,8 +66,8 @@ export function EmotionProvider({ children }) {
         streamRef.current = stream
       }
 
-      // Start periodic capture
-      intervalRef.current = setInterval(captureFrame, 5000) // Every 5 seconds
+      // Start periodic capture; the server adjusts the interval after each frame
+      scheduleCapture(5000)
       setIsCapturing(true)
       
       toast.success('Emotion detection started')
@@ -81,7 +81,7 @@ export function EmotionProvider({ children }) {
 
   const stopCapture = () => {
     if (intervalRef.current) {
-      clearInterval(intervalRef.current)
+      clearTimeout(intervalRef.current)
       intervalRef.current = null
     }
 
@@ -95,8 +95,16 @@ export function EmotionProvider({ children }) {
     toast.success('Emotion detection stopped')
   }
 
+  const scheduleCapture = (delayMs) => {
+    intervalRef.current = setTimeout(async () => {
+      const nextMs = await captureFrame()
+      // The hint may stretch the interval but never shortens it below 5s
+      if (intervalRef.current) scheduleCapture(Math.max(nextMs || 0, 5000))
+    }, delayMs)
+  }
+
   const captureFrame = async () => {
-    if (!videoRef.current || !canvasRef.current) return
+    if (!videoRef.current || !canvasRef.current) return null
 
     const video = videoRef.current
     const canvas = canvasRef.current
@@ -115,15 +123,15 @@ export function EmotionProvider({ children }) {
           'Content-Type': 'application/json',
           'Authorization': `Bearer ${localStorage.getItem('token')}`
         },
-        body: JSON.stringify({ image: dataUrl })
+        body: JSON.stringify({ image: dataUrl, session_state: document.hidden ? 'hidden' : 'active' })
       })
 
-      if (response.ok) {
-        const data = await response.json()
-        // Emotion will be handled by WebSocket update
-      }
+      // Emotion will be handled by WebSocket update; the body carries the pacing hint
+      const data = await response.json().catch(() => ({}))
+      return data.next_frame_after_ms
     } catch (error) {
       console.error('Error sending emotion data:', error)
+      return null
     }
   }
 
@@ -180,7 +188,7 @@ export function EmotionProvider({ children }) {
   useEffect(() => {
     return () => {
       if (intervalRef.current) {
-        clearInterval(intervalRef.current)
+        clearTimeout(intervalRef.current)
       }
       if (streamRef.current) {
         streamRef.current.getTracks().forEach(track => track.stop())